@@ -4,20 +4,42 @@
 # ===============================================
 
 import os
+import atexit
 import base64
+import functools
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import NamedTuple, Optional
 
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
-import psycopg2
-from io import BytesIO
 from textwrap import dedent
 
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from archivio_locale import ArchivioLocale, fetch_duckdb
+from db import ConnectionPool, HealthMonitor, fetch_copy, fetch_prepared, svuota_tipi_query
+from dialetto import DUCKDB, POSTGRES
+from esportazioni import (
+    MIME_XLSX, PARQUET_DISPONIBILE, csv_a_blocchi, date_italiane, excel_streaming, parquet_streaming,
+    zip_parquet,
+)
+from grafici import colori_segno, serie, testi
+from griglia import ALTEZZA_GRIGLIA, html_griglia_codici
+from notifiche import REGISTRO, AscoltatoreModifiche
+from perf import Traccia, attiva, misura, span, traccia_attiva, tracciata
+from rollup import FORMATO_HOVER, FORMATO_TICK, etichette, rollup, scegli_risoluzione
+from schema import compatta, report_memoria, senza_categorie_inutili
+from snapshot import Incrementale, SnapshotStore, versione_contenuto
+from waterfall import composizione_gap, etichetta_mese, mesi_periodo, seleziona_giorni
+
 
 # --------------------------------------------------
 # CONFIGURAZIONE PAGINA
@@ -55,6 +77,28 @@ def get_colore_deposito(dep: str) -> str:
     return COLORI_DEPOSITI.get(str(dep).strip().lower(), "#64748b")
 
 
+def _punti_traccia(trace) -> int:
+    for attr in ("z", "values", "y", "x"):
+        v = getattr(trace, attr, None)
+        if v is not None:
+            return int(np.size(v))
+    return 0
+
+
+# Budget del JSON di una figura: oltre, il pannello tempi (admin) la segnala.
+# Le serie sono già contenute da grafici.py; il tetto scopre le regressioni.
+GRAFICO_KB_MAX = float(os.environ.get("ESTATE2026_GRAFICO_KB", 512))
+
+
+def plotly_chart(fig, **kwargs) -> None:
+    """st.plotly_chart con span di strumentazione: tempo di invio, punti e byte della figura."""
+    with span(f"plotly.{kwargs.get('key', '-')}") as rec:
+        st.plotly_chart(fig, **kwargs)
+    if "span" in rec:  # solo con traccia attiva: la serializzazione extra non pesa sugli altri
+        rec["righe"] = sum(_punti_traccia(t) for t in fig.data)
+        rec["byte"] = len(fig.to_json())
+
+
 # --------------------------------------------------
 # CSS INJECTION UTILITY
 # --------------------------------------------------
@@ -251,8 +295,11 @@ def render_login() -> None:
         st.markdown("<div class='ca-login-title'>ANALISI ESTATE 2026</div>", unsafe_allow_html=True)
 
         def _entered():
+            # ADMIN_PASSWORD (facoltativa) dà accesso anche agli strumenti di diagnostica
+            admin = st.secrets.get("ADMIN_PASSWORD")
+            st.session_state["is_admin"] = bool(admin) and st.session_state["_pwd"] == admin
             st.session_state["password_correct"] = (
-                st.session_state["_pwd"] == st.secrets["APP_PASSWORD"]
+                st.session_state["_pwd"] == st.secrets["APP_PASSWORD"] or st.session_state["is_admin"]
             )
 
         st.text_input(
@@ -322,6 +369,45 @@ def ensure_auth_or_stop() -> None:
 ensure_auth_or_stop()
 
 
+# --------------------------------------------------
+# STRUMENTAZIONE TEMPI (solo admin)
+# --------------------------------------------------
+# Loader, filtri, simulazione ferie, tab e grafici registrano uno span
+# (tempo, righe, byte) nella traccia della sessione; il pannello in fondo
+# alla sidebar mostra il dettaglio del rerun e p50/p95 per span.
+traccia = None
+if st.session_state.get("is_admin"):
+    traccia = st.session_state.setdefault("traccia", Traccia())
+    traccia.inizia_rerun()
+attiva(traccia)
+
+
+def fragment_tracciato(fn):
+    """
+    st.fragment con la traccia dei tempi. Dentro un rerun completo il corpo
+    è uno span `fragment.<nome>`; quando il fragment si riesegue da solo
+    (un suo widget) gira fuori dallo script, su un altro thread: attiva la
+    traccia della sessione e registra un rerun a sé, `rerun.<nome>`.
+    """
+    @functools.wraps(fn)
+    def corpo(*args, **kwargs):
+        ctx = get_script_run_ctx()
+        if not (ctx and ctx.fragment_ids_this_run):
+            with span(f"fragment.{fn.__name__}"):
+                return fn(*args, **kwargs)
+        traccia_fragment = st.session_state.get("traccia") if st.session_state.get("is_admin") else None
+        attiva(traccia_fragment)
+        if traccia_fragment is None:
+            return fn(*args, **kwargs)
+        traccia_fragment.inizia_rerun()
+        try:
+            with span(f"fragment.{fn.__name__}"):
+                return fn(*args, **kwargs)
+        finally:
+            traccia_fragment.chiudi_rerun(f"rerun.{fn.__name__}")
+    return st.fragment(corpo)
+
+
 # --------------------------------------------------
 # SPLASH — logica timestamp pura, ZERO JS, ZERO query_params
 #
@@ -330,30 +416,48 @@ ensure_auth_or_stop()
 # Il query param arriva su una sessione nuova (splash_done
 # non è in session_state) → loop infinito garantito.
 #
-# Soluzione: timestamp in session_state + polling con rerun.
-# Loop controllato: si interrompe quando elapsed >= SPLASH_DURATION.
-# time.sleep(0.1) limita a ~10 rerun/sec durante lo splash.
+# Soluzione: lo splash è un overlay dentro un placeholder. Lo script
+# NON si ferma e non fa polling: sotto lo splash prosegue con pool DB,
+# caricamento concorrente e filtri (cache calde), poi chiudi_splash()
+# svuota il placeholder quando i dati sono pronti e sono passati almeno
+# SPLASH_DURATION secondi. Un solo run, nessun rerun.
 # --------------------------------------------------
-SPLASH_DURATION = 3.5  # secondi
+SPLASH_DURATION = 3.5  # secondi (durata minima)
 
 
-def render_splash_once() -> None:
+def render_splash_once():
+    """Mostra lo splash (una sola volta per sessione) e restituisce il suo placeholder, o None."""
     # Già completato → esci subito
     if st.session_state.get("splash_done"):
-        return
+        return None
 
     # Prima visita → registra timestamp
     if "splash_start" not in st.session_state:
         st.session_state["splash_start"] = time.time()
 
-    # Tempo scaduto → vai alla dashboard
-    elapsed = time.time() - st.session_state["splash_start"]
-    if elapsed >= SPLASH_DURATION:
-        st.session_state["splash_done"] = True
-        st.rerun()
+    slot = st.empty()
+    with slot.container():
+        _splash_html()
+    return slot
+
+
+def chiudi_splash(slot, attendi: bool = True) -> None:
+    """
+    Rimuove lo splash. Con `attendi` rispetta la durata minima (i dati sono
+    già pronti); senza, chiude subito (es. per mostrare un errore bloccante).
+    """
+    if slot is None:
         return
+    if attendi:
+        resto = SPLASH_DURATION - (time.time() - st.session_state["splash_start"])
+        if resto > 0:
+            time.sleep(resto)
+    slot.empty()
+    css_post_splash()
+    st.session_state["splash_done"] = True
 
-    # Mostra splash HTML/CSS
+
+def _splash_html() -> None:
     inject_css(
         """
         [data-testid="stSidebar"]{display:none!important}
@@ -475,29 +579,32 @@ def render_splash_once() -> None:
         </div>
     """, unsafe_allow_html=True)
 
-    # Polling: aspetta 100ms, poi rerun per ricontrollare il timer
-    time.sleep(0.1)
-    st.rerun()
-
 
-render_splash_once()
+splash = render_splash_once()
 
 
 # --------------------------------------------------
 # ✅ CSS RESET POST-SPLASH
 # --------------------------------------------------
-inject_css(
-    """
-    [data-testid="stSidebar"] { display: flex !important; }
-    [data-testid="stHeader"]  { display: flex !important; }
-    footer { display: block !important; }
-    .block-container { padding-top: 1.5rem !important; max-width: 100% !important; }
-    .stApp { overflow: auto !important; }
-    .sp-wrap { display: none !important; }
-    """,
-    style_id="ca-ui-reset",
-    include_fa=False,
-)
+# Durante lo splash il reset va applicato solo alla sua chiusura
+# (nasconde .sp-wrap): lo inietta chiudi_splash() dopo aver svuotato il placeholder.
+def css_post_splash() -> None:
+    inject_css(
+        """
+        [data-testid="stSidebar"] { display: flex !important; }
+        [data-testid="stHeader"]  { display: flex !important; }
+        footer { display: block !important; }
+        .block-container { padding-top: 1.5rem !important; max-width: 100% !important; }
+        .stApp { overflow: auto !important; }
+        .sp-wrap { display: none !important; }
+        """,
+        style_id="ca-ui-reset",
+        include_fa=False,
+    )
+
+
+if splash is None:
+    css_post_splash()
 
 # --------------------------------------------------
 # CSS DASHBOARD
@@ -590,109 +697,472 @@ PLOTLY_TEMPLATE = {
 # --------------------------------------------------
 # CONNESSIONE DATABASE
 # --------------------------------------------------
+# Due motori: Postgres remoto (DATABASE_URL) oppure, se nei secrets c'è
+# LOCAL_DATA_DIR, l'archivio locale DuckDB esportato con archivio_locale.py
+# (nessun accesso di rete). Le query sono le stesse: i frammenti che
+# cambiano tra i due passano da SQL (dialetto.py).
+LOCAL_DATA_DIR = st.secrets.get("LOCAL_DATA_DIR") or os.environ.get("ESTATE2026_LOCAL_DIR")
+SQL = DUCKDB if LOCAL_DATA_DIR else POSTGRES
+
+# Un solo pool per processo, condiviso da tutte le sessioni Streamlit
+# (st.cache_resource). Ogni query prende in prestito una connessione e la
+# restituisce all'uscita del blocco `with`, anche in caso di eccezione.
+DB_POOL_MIN      = 1
+DB_POOL_MAX      = 8      # connessioni massime aperte verso Postgres
+DB_POOL_MAX_AGE  = 1800   # secondi: oltre → connessione riciclata
+DB_POOL_MAX_IDLE = 300    # secondi di inattività: oltre → chiusa
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool() -> ConnectionPool:
+    pool = ConnectionPool(
+        st.secrets["DATABASE_URL"],
+        minconn=DB_POOL_MIN,
+        maxconn=DB_POOL_MAX,
+        max_age=DB_POOL_MAX_AGE,
+        max_idle=DB_POOL_MAX_IDLE,
+        sslmode="require",
+        connect_timeout=10,
+    )
+    atexit.register(pool.closeall)
+    return pool
+
+
+@st.cache_resource(show_spinner=False)
+def get_archivio() -> ArchivioLocale:
+    return ArchivioLocale(LOCAL_DATA_DIR)
+
+
 def get_conn():
-    """Apre una nuova connessione ad ogni chiamata. Semplice e affidabile su Streamlit Cloud."""
-    return psycopg2.connect(st.secrets["DATABASE_URL"], sslmode="require", connect_timeout=10)
+    """Presta una connessione dal pool: usare sempre come `with get_conn() as conn:`."""
+    if LOCAL_DATA_DIR:
+        return get_archivio().connection()
+    return get_pool().connection()
 
-try:
-    _c = get_conn()
-    _cur = _c.cursor()
-    _cur.execute("SELECT NOW();")
-    db_time = _cur.fetchone()[0]
-    _cur.close()
-    _c.close()
-    st.sidebar.success(f"✅ DB connesso\n{db_time.strftime('%d/%m/%Y %H:%M')}")
-except Exception as e:
-    st.sidebar.error(f"❌ Errore DB: {e}")
-    st.stop()
+
+def read_sql_prepared(query: str, params: dict = None) -> pd.DataFrame:
+    """Query come statement preparato lato server (parametri `%(nome)s` legati)."""
+    with get_conn() as conn:
+        if LOCAL_DATA_DIR:
+            return fetch_duckdb(conn, query, params)
+        return fetch_prepared(conn, query, params)
+
+
+def read_sql_bulk(query: str, params: dict = None) -> pd.DataFrame:
+    """
+    Per i risultati grandi (righe per giorno × deposito): COPY ... TO STDOUT
+    decodificato a colonne, senza una tupla Python per riga. Le date arrivano
+    già come datetime64.
+    """
+    with get_conn() as conn:
+        if LOCAL_DATA_DIR:
+            return fetch_duckdb(conn, query, params)
+        return fetch_copy(conn, query, params)
+
+
+# Stato del database: lo verifica un thread di background (HealthMonitor)
+# ogni DB_HEALTH_INTERVALLO secondi; i rerun leggono lo stato in memoria,
+# senza round trip. Ci si ferma solo su guasto confermato (più sonde
+# fallite di fila) o se il pool non si può nemmeno creare.
+DB_HEALTH_INTERVALLO = 30   # secondi tra due verifiche
+
+
+@st.cache_resource(show_spinner=False)
+def get_health() -> HealthMonitor:
+    monitor = HealthMonitor(get_pool(), intervallo=DB_HEALTH_INTERVALLO).avvia()
+    atexit.register(monitor.ferma)
+    return monitor
+
+
+if LOCAL_DATA_DIR:
+    # Archivio locale: nessun server da sondare, basta che i Parquet si carichino
+    try:
+        archivio = get_archivio().stato()
+    except Exception as e:
+        st.sidebar.error(f"❌ Archivio locale non disponibile: {e}")
+        chiudi_splash(splash, attendi=False)
+        st.stop()
+    esportato = (
+        datetime.fromtimestamp(archivio["esportato_il"]).strftime("%d/%m/%Y %H:%M")
+        if archivio["esportato_il"] else "n.d."
+    )
+    st.sidebar.success(f"🗂️ Archivio locale (DuckDB)\n{len(archivio['tabelle'])} tabelle · esportate il {esportato}")
+else:
+    try:
+        salute = get_health().stato()
+    except Exception as e:
+        salute = {"guasto": True, "errore": str(e)}
+
+    if salute["guasto"]:
+        st.sidebar.error(f"❌ Errore DB: {salute['errore']}")
+        chiudi_splash(splash, attendi=False)
+        st.stop()
+    elif salute["ok"]:
+        st.sidebar.success(
+            f"✅ DB connesso\n{salute['ora_db'].strftime('%d/%m/%Y %H:%M')}"
+            f" · {salute['latenza_ms']:.1f} ms · verificato {salute['eta_s']:.0f}s fa"
+        )
+    else:
+        st.sidebar.warning(
+            f"⚠️ DB non risponde (tentativo {salute['fallimenti']}), nuova verifica in corso: {salute['errore']}"
+        )
 
 
 # --------------------------------------------------
 # CARICAMENTO DATI
 # --------------------------------------------------
-@st.cache_data(ttl=600)
-def load_staffing() -> pd.DataFrame:
-    query = """
+# I filtri della sidebar (depositi, periodo) sono spinti nelle query come
+# parametri legati: restringere a un deposito e una settimana scarica solo
+# quelle righe. Ogni loader è in cache per chiave di filtro; la chiave
+# "vuota" (tutti i depositi, stagione intera) è quella della vista di default.
+DEPOSITI_ESCLUSI = ("depbelvede",)
+
+
+class FiltroDati(NamedTuple):
+    """Chiave di filtro dei loader. None = nessun vincolo su quella dimensione."""
+    depositi: Optional[tuple] = None
+    dal: Optional[date] = None
+    al: Optional[date] = None
+
+
+def where_filtro(filtro: FiltroDati, col_giorno: str, col_deposito: str, escludi: bool = False) -> tuple:
+    """Clausola WHERE (parametrica) e parametri per `filtro` sulle colonne indicate."""
+    clausole, params = [], {}
+    if escludi:
+        clausole.append(f"{col_deposito} <> ALL(%(esclusi)s)")
+        params["esclusi"] = list(DEPOSITI_ESCLUSI)
+    if filtro.depositi is not None:
+        clausole.append(f"{col_deposito} = ANY(%(depositi)s)")
+        params["depositi"] = list(filtro.depositi)
+    if filtro.dal is not None:
+        clausole.append(f"{col_giorno} >= %(dal)s")
+        params["dal"] = filtro.dal
+    if filtro.al is not None:
+        clausole.append(f"{col_giorno} <= %(al)s")
+        params["al"] = filtro.al
+    return ("WHERE " + " AND ".join(clausole) if clausole else ""), params
+
+
+# --------------------------------------------------
+# SNAPSHOT SU DISCO (avvio a caldo)
+# --------------------------------------------------
+# I loader a stagione intera (filtro vuoto) salvano il risultato come
+# snapshot Parquet compresso. Un processo appena avviato serve subito lo
+# snapshot e rilegge il database in background; se i dati sono cambiati
+# lo snapshot viene riscritto e la cache del loader svuotata.
+#
+# La rilettura segue le modifiche: i trigger di notifiche.py scrivono nel
+# registro le partizioni (giorno, deposito) toccate da ogni comando; dal
+# segno dell'ultima lettura si rileggono solo quei giorni/depositi, fusi
+# nello snapshot. Il costo dipende da quanto è cambiato, non dalla durata
+# della stagione. Senza trigger, se i contatori delle tabelle sorgente
+# (pg_stat_user_tables) sono cambiati si rilegge il dataset per intero.
+# Solo i dataset che dipendono dalle tabelle toccate cambiano versione (e
+# quindi cache e filtri a valle).
+SNAPSHOT_DIR = os.environ.get("ESTATE2026_SNAPSHOT_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".snapshots"
+)
+SNAPSHOT_TTL = 600              # secondi: oltre, lo snapshot viene rivalidato
+SNAPSHOT_COMPLETO = 6 * 3600    # secondi: oltre, rilettura completa anche senza modifiche
+
+# Tabelle lette da ogni dataset (per le viste: le tabelle sotto la vista).
+# Se una vista cambia definizione va aggiornata qui; in ogni caso ogni
+# SNAPSHOT_COMPLETO secondi il dataset è riletto per intero. Serve anche
+# all'invalidazione su notifica, che copre pure i loader senza snapshot.
+SORGENTI_DATASET = {
+    "dominio":          ("roster", "turni_giornalieri", "assenze", "calendar"),
+    "staffing":         ("roster", "turni_giornalieri", "assenze", "calendar"),
+    "depositi":         ("roster",),
+    "turni_calendario": ("turni_giornalieri",),
+    "staffing_roster2": ("roster2", "turni_giornalieri", "calendar"),
+    "copertura":        ("roster", "roster2", "turni_giornalieri", "assenze", "calendar"),
+    "ferie_riposi":     ("roster",),
+    "assenze_nominali": ("roster",),
+    "catalogo_turni":   ("turni",),
+    "calendario":       ("calendar",),
+}
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot_store() -> SnapshotStore:
+    return SnapshotStore(SNAPSHOT_DIR, ttl=SNAPSHOT_TTL, completo_ogni=SNAPSHOT_COMPLETO)
+
+
+def contatori_modifiche(tabelle: tuple) -> dict:
+    """Righe inserite + aggiornate + cancellate da sempre, per tabella (None se non esiste)."""
+    df = read_sql_prepared("""
+        SELECT t AS tabella,
+               (SELECT n_tup_ins + n_tup_upd + n_tup_del
+                FROM pg_stat_user_tables WHERE relid = to_regclass(t)) AS n
+        FROM unnest(%(tabelle)s::text[]) AS t;
+    """, {"tabelle": list(tabelle)})
+    return {r.tabella: (None if pd.isna(r.n) else int(r.n)) for r in df.itertuples()}
+
+
+def segno_modifiche() -> Optional[int]:
+    """
+    Segno del registro delle modifiche: ogni transazione con id minore è
+    conclusa. None se il registro non c'è o l'utente dell'app non lo legge.
+    """
+    df = read_sql_prepared("""
+        SELECT CASE WHEN has_table_privilege(to_regclass(%(registro)s), 'SELECT')
+                    THEN txid_snapshot_xmin(txid_current_snapshot()) END AS segno;
+    """, {"registro": REGISTRO})
+    segno = df["segno"].iloc[0]
+    return None if pd.isna(segno) else int(segno)
+
+
+def modifiche_partizioni(tabelle: tuple, dal_segno: int) -> pd.DataFrame:
+    """Partizioni (tabella, giorno, deposito) toccate dalle transazioni da `dal_segno` in poi."""
+    return read_sql_prepared(f"""
+        SELECT DISTINCT tabella, giorno, deposito
+        FROM {REGISTRO}
+        WHERE xid >= %(segno)s AND tabella = ANY(%(tabelle)s);
+    """, {"segno": dal_segno, "tabelle": list(tabelle)})
+
+
+# nome dataset → loader in cache (compilato dopo la definizione dei loader)
+REGISTRO_LOADER: dict = {}
+
+
+def _svuota_cache(nome: str) -> None:
+    loader = REGISTRO_LOADER.get(nome)
+    if loader is not None:
+        loader.clear()
+
+
+def con_snapshot(nome: str, chiavi: Optional[tuple] = ("giorno", "deposito")):
+    """
+    Decoratore per i loader: con filtro vuoto passa dallo snapshot `nome`,
+    altrimenti interroga direttamente il database (sempre, con l'archivio
+    locale: è già su disco e lo snapshot ne sarebbe una copia). Il frame restituito è
+    già nello schema compatto (schema.py) e ha sempre `attrs["versione"]`
+    (hash del contenuto).
+
+    `chiavi` è l'ordinamento delle righe del dataset; con `None` il dataset
+    non è per (giorno, deposito) e alla rivalidazione si rilegge per intero
+    (solo se le tabelle sorgente hanno avuto modifiche).
+    """
+    def decora(fetch):
+        incrementale = Incrementale(
+            tabelle=SORGENTI_DATASET[nome],
+            contatori=contatori_modifiche,
+            segno=segno_modifiche,
+            modifiche=modifiche_partizioni,
+            fetch_riquadro=(lambda depositi, dal, al: compatta(fetch(FiltroDati(depositi, dal, al)))) if chiavi else None,
+            chiavi=chiavi or (),
+            normalizza=compatta,
+        )
+
+        @functools.wraps(fetch)
+        def loader(*args, **kwargs):
+            filtri = list(args) + list(kwargs.values())
+            if LOCAL_DATA_DIR or any(f != FiltroDati() for f in filtri):
+                df = compatta(fetch(*args, **kwargs))
+                df.attrs["versione"] = versione_contenuto(df)
+                return df
+
+            def rilettura_completa():
+                # rilegge anche i tipi delle colonne per COPY (una migrazione può averli cambiati)
+                svuota_tipi_query()
+                return compatta(fetch(*args, **kwargs))
+
+            return compatta(get_snapshot_store().servi(
+                nome, rilettura_completa, on_change=lambda: _svuota_cache(nome),
+                incrementale=incrementale,
+            ))
+        return loader
+    return decora
+
+
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+@con_snapshot("dominio", chiavi=None)
+def load_dominio() -> pd.DataFrame:
+    """Depositi e intervallo date disponibili (per i controlli della sidebar)."""
+    return read_sql_prepared(
+        """
+        SELECT deposito, MIN(giorno) AS dal, MAX(giorno) AS al
+        FROM v_staffing
+        WHERE deposito <> ALL(%(esclusi)s)
+        GROUP BY deposito
+        ORDER BY deposito;
+        """,
+        {"esclusi": list(DEPOSITI_ESCLUSI)},
+    )
+
+
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+@con_snapshot("staffing")
+def load_staffing(filtro: FiltroDati = FiltroDati()) -> pd.DataFrame:
+    where, params = where_filtro(filtro, "giorno", "deposito", escludi=True)
+    query = f"""
         SELECT
             giorno, tipo_giorno, deposito, totale_autisti,
             assenze_programmate, assenze_previste, infortuni, malattie,
             legge_104, altre_assenze, congedo_parentale, permessi_vari,
             turni_richiesti, disponibili_netti, gap
         FROM v_staffing
+        {where}
         ORDER BY giorno, deposito;
     """
-    return pd.read_sql(query, get_conn())
+    return read_sql_bulk(query, params)
 
 
-@st.cache_data(ttl=600)
+@st.cache_data(ttl=600, show_spinner=False)
+@con_snapshot("depositi", chiavi=None)
 def load_depositi_stats() -> pd.DataFrame:
-    return pd.read_sql(
-        "SELECT deposito, giorni_attivi, dipendenti_medi_giorno FROM v_depositi_organico_medio ORDER BY deposito;",
-        get_conn()
+    return read_sql_prepared(
+        """
+        SELECT deposito, giorni_attivi, dipendenti_medi_giorno
+        FROM v_depositi_organico_medio
+        WHERE deposito <> ALL(%(esclusi)s)
+        ORDER BY deposito;
+        """,
+        {"esclusi": list(DEPOSITI_ESCLUSI)},
     )
 
 
-@st.cache_data(ttl=600)
-def load_turni_calendario() -> pd.DataFrame:
-    return pd.read_sql("""
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+@con_snapshot("turni_calendario")
+def load_turni_calendario(filtro: FiltroDati = FiltroDati()) -> pd.DataFrame:
+    where, params = where_filtro(filtro, "tg.data", "tg.deposito")
+    return read_sql_bulk(f"""
         SELECT tg.data AS giorno, tg.deposito, COUNT(tg.id) AS turni
         FROM turni_giornalieri tg
+        {where}
         GROUP BY tg.data, tg.deposito
         ORDER BY tg.data, tg.deposito;
-    """, get_conn())
-
-
-@st.cache_data(ttl=600)
-def load_copertura() -> pd.DataFrame:
+    """, params)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+@con_snapshot("catalogo_turni", chiavi=None)
+def load_catalogo_turni() -> pd.DataFrame:
+    """Catalogo dei codici turno (esploratore del tab 3)."""
+    return read_sql_prepared("""
+        SELECT deposito, codice_turno, valid, dal, al
+        FROM turni
+        ORDER BY deposito, valid, codice_turno;
+    """)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+@con_snapshot("calendario", chiavi=None)
+def load_calendario() -> pd.DataFrame:
+    """Tabella calendar: daytype di ogni data (dimensione per le categorie di giorno)."""
+    return read_sql_prepared("SELECT data AS giorno, daytype FROM calendar ORDER BY data;")
+
+
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+@con_snapshot("staffing_roster2")
+def load_staffing_roster2(filtro: FiltroDati = FiltroDati()) -> pd.DataFrame:
+    where_r, params = where_filtro(filtro, "r.data", "r.deposito", escludi=True)
+    where_t, _      = where_filtro(filtro, "data", "deposito", escludi=True)
+    assenti = SQL.conta_se("r.turno IN ('R','FP','AP','PADm','NF','FI')")
+    query = f"""
+        SELECT
+            r.data                             AS giorno,
+            c.daytype                          AS tipo_giorno,
+            r.deposito,
+            COUNT(DISTINCT r.matricola)        AS totale_autisti,
+            COALESCE(t.turni_richiesti, 0)     AS turni_richiesti,
+            {SQL.massimo(f"COUNT(DISTINCT r.matricola) - {assenti}", "0")}
+                                               AS disponibili_netti,
+            COUNT(DISTINCT r.matricola)
+                - {assenti}
+                - COALESCE(t.turni_richiesti, 0) AS gap
+        FROM roster2 r
+        JOIN calendar c ON c.data = r.data
+        LEFT JOIN (
+            SELECT data AS giorno, deposito, COUNT(*) AS turni_richiesti
+            FROM turni_giornalieri
+            {where_t}
+            GROUP BY data, deposito
+        ) t ON t.giorno = r.data AND t.deposito = r.deposito
+        {where_r}
+        GROUP BY r.data, c.daytype, r.deposito, COALESCE(t.turni_richiesti, 0)
+        ORDER BY r.data, r.deposito;
     """
-    Logica corretta copertura:
-
-    persone_in_forza   = COUNT(DISTINCT matricola) per data/deposito dal roster
-    assenze_nominali   = COUNT(*) WHERE turno IN ('R','FP','AP','PADm','NF','FI')
-                         — codici che rendono il dipendente indisponibile
-    assenze_statistiche = somma delle medie storiche dalla tabella assenze,
-                         per deposito e daytype del giorno
-                         NOTA: roster.daytype è in italiano accentato ("martedì"),
-                         calendar.daytype è in italiano senza accento ("martedi").
-                         Normalizziamo con UNACCENT o REPLACE per il JOIN.
-    turni_richiesti    = COUNT(*) da turni_giornalieri per data/deposito
-
-    gap = persone_in_forza - assenze_nominali - assenze_statistiche - turni_richiesti
-
-    Se gap > 0 → avanzano persone disponibili (buffer)
-    Se gap < 0 → mancano persone per coprire i turni (deficit)
+    return read_sql_bulk(query, params)
+
+
+@st.cache_data(ttl=600, max_entries=16)
+def load_ferie_riposi(filtro: FiltroDati) -> pd.DataFrame:
+    where, params = where_filtro(filtro, "data", "deposito", escludi=True)
+    return compatta(read_sql_prepared(f"""
+        SELECT data AS giorno, deposito,
+            {SQL.conta_se("turno = 'FP'")} AS ferie_programmate,
+            {SQL.conta_se("turno = 'R'")}  AS riposi
+        FROM roster {where}
+        GROUP BY data, deposito ORDER BY data, deposito;
+    """, params))
+
+
+@st.cache_data(ttl=600, max_entries=16)
+def load_assenze_nominali(filtro: FiltroDati) -> pd.DataFrame:
+    where, params = where_filtro(filtro, "data", "deposito", escludi=True)
+    return compatta(read_sql_prepared(f"""
+        SELECT data AS giorno, deposito,
+            {SQL.conta_se("turno = 'PS'")}   AS ps,
+            {SQL.conta_se("turno = 'AP'")}   AS aspettativa,
+            {SQL.conta_se("turno = 'PADm'")} AS congedo_straord,
+            {SQL.conta_se("turno = 'NF'")}   AS non_in_forza
+        FROM roster {where}
+        GROUP BY data, deposito ORDER BY data, deposito;
+    """, params))
+
+
+# ── Motore copertura ──────────────────────────────────────────────────
+# Scenari disponibili: nome scenario → tabella roster di origine.
+SCENARI_ROSTER = {"roster": "roster", "roster2": "roster2"}
+
+# Codici turno che rendono il dipendente INDISPONIBILE:
+#   R   = Riposo
+#   FP  = Ferie Programmate
+#   AP  = Aspettativa
+#   PADm= Congedo Straordinario
+#   NF  = Non in Forza
+#   FI  = Festività
+# NULL o qualsiasi altro codice = presente/disponibile
+CODICI_INDISPONIBILI = ("R", "FP", "AP", "PADm", "NF", "FI")
+
+
+def build_copertura_query(tabelle: dict, filtro: FiltroDati = FiltroDati()) -> tuple:
+    """
+    Query unica di copertura per uno o più scenari roster → (sql, params).
+
+    Ogni tabella roster viene letta UNA sola volta: organico (DISTINCT
+    matricola) e assenze nominali escono dallo stesso GROUP BY. Le
+    dimensioni condivise (assenze statistiche da `assenze JOIN calendar`
+    e turni richiesti da `turni_giornalieri`) sono calcolate una volta
+    sola e agganciate a tutti gli scenari. `filtro` è applicato a ogni
+    sorgente prima dell'aggregazione.
     """
-    query = """
+    codici = ",".join(f"'{c}'" for c in CODICI_INDISPONIBILI)
+    where, params = where_filtro(filtro, "data", "deposito")
+    where_cal, _  = where_filtro(filtro, "c.data", "a.deposito")
+    sorgenti = "\n            UNION ALL\n".join(
+        f"            SELECT '{scenario}' AS scenario, data, deposito, matricola, turno FROM {tabella} {where}"
+        for scenario, tabella in tabelle.items()
+    )
+    sql = f"""
         WITH
 
-        -- ── 1. Organico: DISTINCT matricola per data/deposito ───────────
-        forza AS (
-            SELECT
-                r.data                          AS giorno,
-                r.deposito,
-                COUNT(DISTINCT r.matricola)     AS persone_in_forza
-            FROM roster r
-            GROUP BY r.data, r.deposito
+        -- ── 1. Roster di tutti gli scenari ──────────────────────────────
+        roster_scenari AS (
+{sorgenti}
         ),
 
-        -- ── 2. Assenze nominali dal roster ───────────────────────────────
-        -- Codici che rendono il dipendente INDISPONIBILE:
-        --   R   = Riposo
-        --   FP  = Ferie Programmate
-        --   AP  = Aspettativa
-        --   PADm= Congedo Straordinario
-        --   NF  = Non in Forza
-        --   FI  = Festività
-        -- NULL o qualsiasi altro codice = presente/disponibile
-        assenze_nom AS (
+        -- ── 2. Organico + assenze nominali in un solo passaggio ─────────
+        organico AS (
             SELECT
+                r.scenario,
                 r.data                          AS giorno,
                 r.deposito,
-                COUNT(*) FILTER (
-                    WHERE r.turno IN ('R','FP','AP','PADm','NF','FI')
-                )                               AS assenze_nominali
-            FROM roster r
-            GROUP BY r.data, r.deposito
+                COUNT(DISTINCT r.matricola)     AS persone_in_forza,
+                {SQL.conta_se(f"r.turno IN ({codici})")}
+                                                AS assenze_nominali
+            FROM roster_scenari r
+            GROUP BY r.scenario, r.data, r.deposito
         ),
 
         -- ── 3. Assenze statistiche (medie storiche dalla tabella assenze) ─
@@ -700,7 +1170,6 @@ def load_copertura() -> pd.DataFrame:
         -- Il roster ha daytype in italiano con accento ("martedì").
         -- Usiamo la tabella calendar come ponte: calendar.data → calendar.daytype
         -- e facciamo JOIN assenze ON assenze.daytype = calendar.daytype.
-        -- In questo modo non dobbiamo toccare il roster.daytype.
         assenze_stat AS (
             SELECT
                 c.data                          AS giorno,
@@ -714,8 +1183,8 @@ def load_copertura() -> pd.DataFrame:
                     COALESCE(a.permessi_vari,       0)
                 , 2)                            AS assenze_statistiche
             FROM assenze a
-            -- JOIN diretto su calendar: entrambi usano daytype senza accento
             JOIN calendar c ON c.daytype = a.daytype
+            {where_cal}
         ),
 
         -- ── 4. Turni richiesti (da turni_giornalieri, già espansi per data) ─
@@ -725,246 +1194,325 @@ def load_copertura() -> pd.DataFrame:
                 deposito,
                 COUNT(*)                        AS turni_richiesti
             FROM turni_giornalieri
+            {where}
             GROUP BY data, deposito
         )
 
         SELECT
-            f.giorno,
-            f.deposito,
+            o.scenario,
+            o.giorno,
+            o.deposito,
 
-            f.persone_in_forza,
+            o.persone_in_forza,
 
-            COALESCE(an.assenze_nominali,     0)    AS assenze_nominali,
+            o.assenze_nominali,
             COALESCE(ast.assenze_statistiche, 0)    AS assenze_statistiche,
             COALESCE(t.turni_richiesti,       0)    AS turni_richiesti,
 
             -- Disponibili netti = organico − assenze nominali − assenze statistiche
             ROUND(
-                f.persone_in_forza
-                - COALESCE(an.assenze_nominali,     0)
+                o.persone_in_forza
+                - o.assenze_nominali
                 - COALESCE(ast.assenze_statistiche, 0)
             , 2)                                    AS disponibili_netti,
 
             -- GAP = disponibili netti − turni richiesti
             ROUND(
-                f.persone_in_forza
-                - COALESCE(an.assenze_nominali,     0)
+                o.persone_in_forza
+                - o.assenze_nominali
                 - COALESCE(ast.assenze_statistiche, 0)
                 - COALESCE(t.turni_richiesti,       0)
             , 2)                                    AS gap
 
-        FROM forza f
-        LEFT JOIN assenze_nom  an  USING (giorno, deposito)
+        FROM organico o
         LEFT JOIN assenze_stat ast USING (giorno, deposito)
         LEFT JOIN turni        t   USING (giorno, deposito)
-        ORDER BY f.giorno, f.deposito;
+        ORDER BY o.scenario, o.giorno, o.deposito;
     """
-    return pd.read_sql(query, get_conn())
+    return sql, params
 
 
-@st.cache_data(ttl=600)
-def load_staffing_roster2() -> pd.DataFrame:
-    query = """
-        SELECT
-            r.data                             AS giorno,
-            c.daytype                          AS tipo_giorno,
-            r.deposito,
-            COUNT(DISTINCT r.matricola)        AS totale_autisti,
-            COALESCE(t.turni_richiesti, 0)     AS turni_richiesti,
-            GREATEST(
-                COUNT(DISTINCT r.matricola)
-                - COUNT(*) FILTER (WHERE r.turno IN ('R','FP','AP','PADm','NF','FI'))
-            , 0)                               AS disponibili_netti,
-            COUNT(DISTINCT r.matricola)
-                - COUNT(*) FILTER (WHERE r.turno IN ('R','FP','AP','PADm','NF','FI'))
-                - COALESCE(t.turni_richiesti, 0) AS gap
-        FROM roster2 r
-        JOIN calendar c ON c.data = r.data
-        LEFT JOIN (
-            SELECT data AS giorno, deposito, COUNT(*) AS turni_richiesti
-            FROM turni_giornalieri
-            GROUP BY data, deposito
-        ) t ON t.giorno = r.data AND t.deposito = r.deposito
-        GROUP BY r.data, c.daytype, r.deposito, COALESCE(t.turni_richiesti, 0)
-        ORDER BY r.data, r.deposito;
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+@con_snapshot("copertura", chiavi=("scenario", "giorno", "deposito"))
+def load_copertura_scenari(filtro: FiltroDati = FiltroDati()) -> pd.DataFrame:
     """
-    return pd.read_sql(query, get_conn())
+    Logica corretta copertura (tutti gli scenari in un solo round trip):
 
+    persone_in_forza   = COUNT(DISTINCT matricola) per data/deposito dal roster
+    assenze_nominali   = COUNT(*) WHERE turno IN CODICI_INDISPONIBILI
+    assenze_statistiche = somma delle medie storiche dalla tabella assenze,
+                         per deposito e daytype del giorno (ponte: calendar)
+    turni_richiesti    = COUNT(*) da turni_giornalieri per data/deposito
 
-@st.cache_data(ttl=600)
-def load_copertura_roster2() -> pd.DataFrame:
-    query = """
-        WITH
-        forza AS (
-            SELECT
-                r.data                          AS giorno,
-                r.deposito,
-                COUNT(DISTINCT r.matricola)     AS persone_in_forza
-            FROM roster2 r
-            GROUP BY r.data, r.deposito
-        ),
-        assenze_nom AS (
-            SELECT
-                r.data                          AS giorno,
-                r.deposito,
-                COUNT(*) FILTER (
-                    WHERE r.turno IN ('R','FP','AP','PADm','NF','FI')
-                )                               AS assenze_nominali
-            FROM roster2 r
-            GROUP BY r.data, r.deposito
-        ),
-        assenze_stat AS (
-            SELECT
-                c.data                          AS giorno,
-                a.deposito,
-                ROUND(
-                    COALESCE(a.infortuni,          0) +
-                    COALESCE(a.malattie,            0) +
-                    COALESCE(a.legge_104,           0) +
-                    COALESCE(a.altre_assenze,       0) +
-                    COALESCE(a.congedo_parentale,   0) +
-                    COALESCE(a.permessi_vari,       0)
-                , 2)                            AS assenze_statistiche
-            FROM assenze a
-            JOIN calendar c ON c.daytype = a.daytype
-        ),
-        turni AS (
-            SELECT
-                data                            AS giorno,
-                deposito,
-                COUNT(*)                        AS turni_richiesti
-            FROM turni_giornalieri
-            GROUP BY data, deposito
-        )
-        SELECT
-            f.giorno,
-            f.deposito,
-            f.persone_in_forza,
-            COALESCE(an.assenze_nominali,     0)    AS assenze_nominali,
-            COALESCE(ast.assenze_statistiche, 0)    AS assenze_statistiche,
-            COALESCE(t.turni_richiesti,       0)    AS turni_richiesti,
-            ROUND(
-                f.persone_in_forza
-                - COALESCE(an.assenze_nominali,     0)
-                - COALESCE(ast.assenze_statistiche, 0)
-            , 2)                                    AS disponibili_netti,
-            ROUND(
-                f.persone_in_forza
-                - COALESCE(an.assenze_nominali,     0)
-                - COALESCE(ast.assenze_statistiche, 0)
-                - COALESCE(t.turni_richiesti,       0)
-            , 2)                                    AS gap
-        FROM forza f
-        LEFT JOIN assenze_nom  an  USING (giorno, deposito)
-        LEFT JOIN assenze_stat ast USING (giorno, deposito)
-        LEFT JOIN turni        t   USING (giorno, deposito)
-        ORDER BY f.giorno, f.deposito;
+    gap = persone_in_forza - assenze_nominali - assenze_statistiche - turni_richiesti
+
+    Se gap > 0 → avanzano persone disponibili (buffer)
+    Se gap < 0 → mancano persone per coprire i turni (deficit)
+
+    Gli scenari la cui tabella non esiste (es. roster2 non ancora
+    importato) vengono esclusi dalla query invece di farla fallire.
     """
-    return pd.read_sql(query, get_conn())
+    presenti = read_sql_prepared(
+        "SELECT " + ", ".join(
+            f"{SQL.tabella_esiste(s)} AS {s}" for s in SCENARI_ROSTER
+        ) + ";",
+        SCENARI_ROSTER,
+    ).iloc[0]
+    tabelle = {s: t for s, t in SCENARI_ROSTER.items() if bool(presenti[s])}
+    if not tabelle:
+        return pd.DataFrame()
+    return read_sql_bulk(*build_copertura_query(tabelle, filtro))
 
 
-try:
-    df_raw = load_staffing()
-    df_raw["giorno"] = pd.to_datetime(df_raw["giorno"])
-    df_depositi = load_depositi_stats()
-    df_raw      = df_raw[df_raw["deposito"] != "depbelvede"].copy()
-    df_depositi = df_depositi[df_depositi["deposito"] != "depbelvede"].copy()
-except Exception as e:
-    st.error(f"❌ Errore caricamento staffing: {e}")
-    st.stop()
+def _copertura_scenario(scenario: str, filtro: FiltroDati) -> pd.DataFrame:
+    df = load_copertura_scenari(filtro)
+    if len(df) == 0:
+        return df
+    out = df[df["scenario"] == scenario].drop(columns="scenario").reset_index(drop=True)
+    out.attrs["versione"] = f"{df.attrs.get('versione', '')}:{scenario}"
+    return out
 
-try:
-    df_turni_cal = load_turni_calendario()
-    df_turni_cal["giorno"] = pd.to_datetime(df_turni_cal["giorno"])
-    turni_cal_ok = len(df_turni_cal) > 0
-    if not turni_cal_ok:
-        st.sidebar.warning("⚠️ Turni: query OK ma 0 righe restituite")
-except Exception as e:
-    st.sidebar.error(f"❌ Errore turni: {e}")
-    df_turni_cal = pd.DataFrame()
-    turni_cal_ok = False
 
-try:
-    df_copertura = load_copertura()
-    df_copertura["giorno"] = pd.to_datetime(df_copertura["giorno"])
-except Exception as e:
-    st.sidebar.warning(f"⚠️ Copertura non disponibile: {e}")
-    df_copertura = pd.DataFrame()
+def load_copertura(filtro: FiltroDati = FiltroDati()) -> pd.DataFrame:
+    return _copertura_scenario("roster", filtro)
 
-# --- roster2 ---
-roster2_disponibile = False
-try:
-    df_raw2 = load_staffing_roster2()
-    df_raw2["giorno"] = pd.to_datetime(df_raw2["giorno"])
-    df_raw2 = df_raw2[df_raw2["deposito"] != "depbelvede"].copy()
-    roster2_disponibile = len(df_raw2) > 0
-except Exception:
-    df_raw2 = pd.DataFrame()
 
-try:
-    df_copertura2 = load_copertura_roster2()
-    df_copertura2["giorno"] = pd.to_datetime(df_copertura2["giorno"])
-    df_copertura2 = df_copertura2[df_copertura2["deposito"] != "depbelvede"].copy()
-except Exception:
-    df_copertura2 = pd.DataFrame()
+def load_copertura_roster2(filtro: FiltroDati = FiltroDati()) -> pd.DataFrame:
+    return _copertura_scenario("roster2", filtro)
+
+
+REGISTRO_LOADER.update({
+    "dominio":          load_dominio,
+    "staffing":         load_staffing,
+    "depositi":         load_depositi_stats,
+    "turni_calendario": load_turni_calendario,
+    "staffing_roster2": load_staffing_roster2,
+    "copertura":        load_copertura_scenari,
+    "ferie_riposi":     load_ferie_riposi,
+    "assenze_nominali": load_assenze_nominali,
+    "catalogo_turni":   load_catalogo_turni,
+    "calendario":       load_calendario,
+})
 
 
 # --------------------------------------------------
-# UTILITY
+# INVALIDAZIONE SU NOTIFICA (LISTEN/NOTIFY)
 # --------------------------------------------------
-def categorizza_tipo_giorno(tipo: str) -> str:
-    t = (tipo or "").strip().lower()
-    if t in ['lunedi', 'martedi', 'mercoledi', 'giovedi', 'venerdi']: return 'Lu-Ve'
-    elif t == 'sabato': return 'Sabato'
-    elif t == 'domenica': return 'Domenica'
-    return tipo
-
+# Con i trigger di notifiche.py installati, ogni modifica a roster, roster2,
+# turni, turni_giornalieri, assenze e calendar arriva come notifica a un solo
+# ascoltatore per processo. Per ogni dataset che legge le tabelle toccate
+# lo snapshot è rivalidato subito (solo le partizioni cambiate) e la cache
+# del loader svuotata: le sessioni aperte vedono i dati nuovi al rerun
+# successivo. I TTL restano come rete di sicurezza (trigger non installati,
+# ascoltatore in riconnessione).
+def invalida_per_tabelle(tabelle: set) -> None:
+    svuota_tipi_query()   # i tipi in cache per fetch_copy possono essere cambiati con le tabelle
+    store = get_snapshot_store()
+    for nome, sorgenti in SORGENTI_DATASET.items():
+        toccate = tabelle.intersection(sorgenti)
+        if toccate:
+            store.rivalida_ora(nome, toccate)
+            _svuota_cache(nome)
+
+
+@st.cache_resource(show_spinner=False)
+def get_ascoltatore() -> AscoltatoreModifiche:
+    ascoltatore = AscoltatoreModifiche(
+        st.secrets["DATABASE_URL"], on_modifiche=invalida_per_tabelle,
+        sslmode="require", connect_timeout=10,
+    ).avvia()
+    atexit.register(ascoltatore.ferma)
+    return ascoltatore
+
+
+if not LOCAL_DATA_DIR:
+    notifiche = get_ascoltatore().stato()
+    if notifiche["connesso"] and notifiche["tabelle"]:
+        ultima = (
+            f" · ultima modifica {datetime.fromtimestamp(notifiche['ultimo_evento']).strftime('%H:%M:%S')}"
+            if notifiche["ultimo_evento"] else ""
+        )
+        st.sidebar.caption(f"🔔 Aggiornamento automatico attivo{ultima}")
 
-def applica_ferie_10gg(df_in: pd.DataFrame) -> pd.DataFrame:
-    df = df_in.copy()
-    required = {"giorno", "deposito", "totale_autisti", "assenze_previste", "disponibili_netti", "gap"}
-    missing = required - set(df.columns)
-    if missing:
-        raise ValueError(f"Mancano colonne: {missing}")
-    df["deposito_norm"] = df["deposito"].astype(str).str.strip().str.lower()
-    df["ferie_extra"] = 0.0
-    df.loc[df["deposito_norm"] == "ancona", "ferie_extra"] += 5.0
-    mask_eligible = ~df["deposito_norm"].isin(["ancona", "moie"])
-    eligible = df[mask_eligible].copy()
-    if not eligible.empty:
-        eligible["peso"] = eligible["totale_autisti"].clip(lower=0)
-        sum_pesi = eligible.groupby("giorno")["peso"].transform("sum")
-        eligible["quota"] = np.where(sum_pesi > 0, 5.0 * eligible["peso"] / sum_pesi, 0.0)
-        df.loc[eligible.index, "ferie_extra"] += eligible["quota"].values
-    df["assenze_previste_adj"]  = df["assenze_previste"] + df["ferie_extra"]
-    df["disponibili_netti_adj"] = (df["disponibili_netti"] - df["ferie_extra"]).clip(lower=0)
-    df["gap_adj"]               = df["gap"] - df["ferie_extra"]
-    df.drop(columns=["deposito_norm"], inplace=True)
-    return df
 
+# --------------------------------------------------
+# CARICAMENTO CONCORRENTE
+# --------------------------------------------------
+# I dataset sono indipendenti: all'avvio si chiedono tutti insieme a un
+# pool limitato di thread (ognuno prende una connessione dal pool DB), così
+# il tempo totale si avvicina a quello della query più lenta invece della
+# somma. Gli errori restano per dataset: chi chiama decide cosa è fatale.
+LOADER_WORKERS = 4   # ≤ DB_POOL_MAX: i thread non restano in coda sul pool
+
+
+def carica_in_parallelo(richieste: dict) -> dict:
+    """{nome: (loader, *args)} → {nome: DataFrame oppure l'eccezione sollevata}."""
+    ctx = get_script_run_ctx()
+    traccia = traccia_attiva()
+
+    def _esegui(nome, loader, *args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        attiva(traccia)
+        with span(f"loader.{nome}") as rec:
+            df = loader(*args)
+            misura(rec, df)
+        return df
+
+    with ThreadPoolExecutor(
+        max_workers=min(LOADER_WORKERS, DB_POOL_MAX, len(richieste)),
+        thread_name_prefix="loader",
+    ) as pool:
+        futuri = {nome: pool.submit(_esegui, nome, *r) for nome, r in richieste.items()}
+
+    esiti = {}
+    for nome, futuro in futuri.items():
+        try:
+            esiti[nome] = futuro.result()
+        except Exception as e:
+            esiti[nome] = e
+    return esiti
+
+
+def esito(esiti: dict, nome: str) -> pd.DataFrame:
+    """Risultato del dataset `nome`; rilancia l'errore se il caricamento è fallito."""
+    r = esiti[nome]
+    if isinstance(r, Exception):
+        raise r
+    return r
 
-df_raw["categoria_giorno"] = df_raw["tipo_giorno"].apply(categorizza_tipo_giorno)
-if roster2_disponibile and len(df_raw2) > 0:
-    df_raw2["categoria_giorno"] = df_raw2["tipo_giorno"].apply(categorizza_tipo_giorno)
+try:
+    with span("loader.dominio") as _rec:
+        df_dominio = load_dominio()
+        misura(_rec, df_dominio)
+    if len(df_dominio) == 0:
+        raise ValueError("v_staffing non contiene righe")
+except Exception as e:
+    st.error(f"❌ Errore caricamento staffing: {e}")
+    chiudi_splash(splash, attendi=False)
+    st.stop()
 
 
 # --------------------------------------------------
-# SIDEBAR
+# UTILITY
 # --------------------------------------------------
-st.sidebar.markdown("## <i class='fas fa-sliders-h'></i> CONTROLLI", unsafe_allow_html=True)
-st.sidebar.markdown("---")
+CATEGORIE_TIPO_GIORNO = {
+    "lunedi": "Lu-Ve", "martedi": "Lu-Ve", "mercoledi": "Lu-Ve", "giovedi": "Lu-Ve", "venerdi": "Lu-Ve",
+    "sabato": "Sabato", "domenica": "Domenica",
+}
 
-modalita = st.sidebar.radio(
+
+def categorizza_tipo_giorno(tipi: pd.Series) -> pd.Series:
+    """Categoria (Lu-Ve / Sabato / Domenica) di ogni daytype; i valori non previsti restano invariati."""
+    testo = tipi.astype(object)
+    return testo.str.strip().str.lower().map(CATEGORIE_TIPO_GIORNO).fillna(testo).astype(object)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def dimensione_calendario(versione: str, _df_calendario: pd.DataFrame) -> pd.DataFrame:
+    """Calendario indicizzato per giorno, con daytype e categoria_giorno."""
+    dim = _df_calendario.assign(giorno=pd.to_datetime(_df_calendario["giorno"])).set_index("giorno")
+    dim["categoria_giorno"] = categorizza_tipo_giorno(dim["daytype"])
+    return dim
+
+
+def categoria_per_giorno(df: pd.DataFrame, calendario: pd.DataFrame) -> pd.Series:
+    """
+    `categoria_giorno` delle righe di `df` dalla dimensione calendario (per
+    data); per le date fuori calendario, dal `tipo_giorno` della riga.
+    """
+    categoria = df["giorno"].map(calendario["categoria_giorno"]).astype(object)
+    mancanti = categoria.isna()
+    if mancanti.any():
+        categoria[mancanti] = categorizza_tipo_giorno(df.loc[mancanti, "tipo_giorno"])
+    return categoria
+
+
+# ── Simulazione ferie ─────────────────────────────────────────────────
+class ParametriFerie(NamedTuple):
+    """
+    Giornate di ferie aggiuntive per giorno:
+    - `fissi`: giornate assegnate direttamente a un deposito
+    - `distribuiti`: giornate ripartite sugli altri depositi in proporzione
+      all'organico del giorno, esclusi quelli in `esclusi`
+    """
+    fissi: tuple = (("ancona", 5.0),)
+    distribuiti: float = 5.0
+    esclusi: tuple = ("ancona", "moie")
+
+
+PARAMETRI_FERIE_10 = ParametriFerie()
+
+
+def calcola_ferie_extra(giorno, deposito, peso, parametri: ParametriFerie = PARAMETRI_FERIE_10) -> np.ndarray:
+    """
+    Giornate extra per riga, vettorizzato su tutti i giorni e depositi insieme.
+    I nomi deposito sono normalizzati una volta per valore distinto, non per riga.
+    """
+    cod_dep, depositi = pd.factorize(np.asarray(deposito), use_na_sentinel=False)
+    norm = np.array([str(d).strip().lower() for d in depositi], dtype=object)
+    fissi = dict(parametri.fissi)
+
+    extra      = np.array([fissi.get(n, 0.0) for n in norm], dtype=float)[cod_dep]
+    eleggibile = ~np.isin(norm, list(parametri.esclusi))[cod_dep]
+
+    if parametri.distribuiti and eleggibile.any():
+        cod_g, _ = pd.factorize(np.asarray(giorno))
+        pesi  = np.where(eleggibile, np.clip(np.nan_to_num(np.asarray(peso, dtype=float)), 0, None), 0.0)
+        somma = np.bincount(cod_g, weights=pesi)[cod_g]
+        extra += np.divide(parametri.distribuiti * pesi, somma, out=np.zeros_like(pesi), where=somma > 0)
+    return extra
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def ferie_extra(versione: str, colonna_peso: str, parametri: ParametriFerie, _df: pd.DataFrame) -> np.ndarray:
+    """Memo per (versione dataset, parametri): il frame non viene hashato né copiato."""
+    return calcola_ferie_extra(_df["giorno"].values, _df["deposito"].values, _df[colonna_peso].values, parametri)
+
+
+@tracciata("ferie.applica_10gg")
+def applica_ferie_10gg(df: pd.DataFrame, extra: np.ndarray) -> pd.DataFrame:
+    """Applica le giornate extra allo staffing (in place sul frame già filtrato)."""
+    required = {"giorno", "deposito", "totale_autisti", "assenze_previste", "disponibili_netti", "gap"}
+    missing = required - set(df.columns)
+    if missing:
+        raise ValueError(f"Mancano colonne: {missing}")
+    df["ferie_extra"]           = extra
+    df["assenze_previste_adj"]  = df["assenze_previste"] + extra
+    df["disponibili_netti_adj"] = (df["disponibili_netti"] - extra).clip(lower=0)
+    df["gap_adj"]               = df["gap"] - extra
+    return df
+
+
+@tracciata("ferie.applica_copertura")
+def applica_ferie_copertura(df: pd.DataFrame, extra: np.ndarray) -> pd.DataFrame:
+    """Applica le giornate extra a un frame copertura (in place): ricalcola il gap."""
+    df["assenze_nominali"] = df["assenze_nominali"] + extra
+    df["gap"] = (
+        df["persone_in_forza"]
+        - df["assenze_nominali"]
+        - df["assenze_statistiche"]
+        - df["turni_richiesti"]
+    )
+    return df
+
+
+# --------------------------------------------------
+# SIDEBAR
+# --------------------------------------------------
+st.sidebar.markdown("## <i class='fas fa-sliders-h'></i> CONTROLLI", unsafe_allow_html=True)
+st.sidebar.markdown("---")
+
+modalita = st.sidebar.radio(
     "📊 Modalità Vista",
     ["Dashboard Completa", "Analisi Comparativa", "Report Esportabile"],
 )
 st.sidebar.markdown("---")
 
-depositi_lista = sorted(df_raw["deposito"].unique())
+depositi_lista = sorted(df_dominio["deposito"].unique())
 deposito_sel   = st.sidebar.multiselect("📍 DEPOSITI", depositi_lista, default=depositi_lista)
 
-min_date   = df_raw["giorno"].min().date()
-max_date   = df_raw["giorno"].max().date()
+min_date   = pd.to_datetime(df_dominio["dal"]).min().date()
+max_date   = pd.to_datetime(df_dominio["al"]).max().date()
 date_range = st.sidebar.date_input("📅 PERIODO", value=(min_date, max_date),
                                    min_value=min_date, max_value=max_date)
 st.sidebar.markdown("---")
@@ -983,131 +1531,258 @@ with st.sidebar.expander("🔧 Filtri Avanzati"):
 
 st.sidebar.markdown("---")
 
-# --- filtri su staffing ---
-if len(date_range) == 2:
-    df_filtered = df_raw[
-        (df_raw["deposito"].isin(deposito_sel)) &
-        (df_raw["giorno"] >= pd.to_datetime(date_range[0])) &
-        (df_raw["giorno"] <= pd.to_datetime(date_range[1]))
-    ].copy()
-else:
-    df_filtered = df_raw[df_raw["deposito"].isin(deposito_sel)].copy()
+# --------------------------------------------------
+# CARICAMENTO DATI FILTRATI
+# --------------------------------------------------
+def crea_filtro(depositi, dal: Optional[date] = None, al: Optional[date] = None) -> FiltroDati:
+    """
+    Chiave di filtro normalizzata: i vincoli che coprono l'intero dominio
+    diventano None, così la vista di default condivide la stessa voce di
+    cache (e la stessa query) del caricamento dell'intera stagione.
+    """
+    dep = tuple(sorted(depositi))
+    return FiltroDati(
+        depositi=None if set(dep) >= set(depositi_lista) else dep,
+        dal=None if dal is None or dal <= min_date else dal,
+        al=None if al is None or al >= max_date else al,
+    )
 
-if ferie_10:
-    try:
-        df_filtered = applica_ferie_10gg(df_filtered)
+
+filtro = (
+    crea_filtro(deposito_sel, date_range[0], date_range[1]) if len(date_range) == 2
+    else crea_filtro(deposito_sel)
+)
+# La simulazione ferie ridistribuisce le giornate su TUTTI i depositi del
+# giorno: con la simulazione attiva la copertura va caricata senza vincolo
+# sui depositi (il filtro depositi resta applicato dopo, in pandas).
+filtro_cop = filtro._replace(depositi=None) if ferie_10 else filtro
+
+with st.spinner("⏳ Caricamento dati..."):
+    esiti = carica_in_parallelo({
+        "staffing":   (load_staffing, filtro),
+        "depositi":   (load_depositi_stats,),
+        "turni_cal":  (load_turni_calendario, filtro),
+        "copertura":  (load_copertura, filtro_cop),
+        "roster2":    (load_staffing_roster2, filtro),
+        "copertura2": (load_copertura_roster2, filtro_cop),
+        "calendario": (load_calendario,),
+    })
+
+try:
+    df_raw      = esito(esiti, "staffing")
+    df_depositi = esito(esiti, "depositi")
+    df_raw["giorno"] = pd.to_datetime(df_raw["giorno"])
+except Exception as e:
+    st.error(f"❌ Errore caricamento staffing: {e}")
+    chiudi_splash(splash, attendi=False)
+    st.stop()
+
+try:
+    df_turni_cal = esito(esiti, "turni_cal")
+    df_turni_cal["giorno"] = pd.to_datetime(df_turni_cal["giorno"])
+    turni_cal_ok = len(df_turni_cal) > 0
+    if not turni_cal_ok:
+        st.sidebar.warning("⚠️ Turni: query OK ma 0 righe restituite")
+except Exception as e:
+    st.sidebar.error(f"❌ Errore turni: {e}")
+    df_turni_cal = pd.DataFrame()
+    turni_cal_ok = False
+
+try:
+    df_copertura = esito(esiti, "copertura")
+    df_copertura["giorno"] = pd.to_datetime(df_copertura["giorno"])
+except Exception as e:
+    st.sidebar.warning(f"⚠️ Copertura non disponibile: {e}")
+    df_copertura = pd.DataFrame()
+
+# --- roster2 ---
+roster2_disponibile = False
+try:
+    df_raw2 = esito(esiti, "roster2")
+    df_raw2["giorno"] = pd.to_datetime(df_raw2["giorno"])
+    roster2_disponibile = len(df_raw2) > 0
+except Exception:
+    df_raw2 = pd.DataFrame()
+
+try:
+    df_copertura2 = esito(esiti, "copertura2")
+    df_copertura2["giorno"] = pd.to_datetime(df_copertura2["giorno"])
+    df_copertura2 = df_copertura2[df_copertura2["deposito"] != "depbelvede"].copy()
+except Exception:
+    df_copertura2 = pd.DataFrame()
+
+# Dimensione calendario (data → daytype, categoria_giorno): senza, le
+# categorie si ricavano dal tipo_giorno di ogni riga
+try:
+    df_cal = esito(esiti, "calendario")
+except Exception:
+    df_cal = pd.DataFrame(columns=["giorno", "daytype"])
+
+
+# --------------------------------------------------
+# PIPELINE FILTRI
+# --------------------------------------------------
+# Il filtraggio è una funzione pura dei dati caricati (identificati dalla
+# versione) e dello stato della sidebar: i rerun causati da widget che non
+# toccano i filtri (es. "Modalità barre" nel tab 3) la trovano in cache e
+# non rifiltrano nulla.
+def _maschera_periodo(df: pd.DataFrame, depositi: tuple, periodo: tuple) -> pd.Series:
+    mask = df["deposito"].isin(depositi)
+    if len(periodo) == 2:
+        mask &= (
+            (df["giorno"] >= pd.to_datetime(periodo[0])) &
+            (df["giorno"] <= pd.to_datetime(periodo[1]))
+        )
+    return mask
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def filtra_dati(
+    versioni: tuple, depositi: tuple, periodo: tuple, ferie: bool, gap_min: float, gap_max: float,
+    _df_raw: pd.DataFrame, _df_copertura: pd.DataFrame, _df_raw2: pd.DataFrame,
+    _df_copertura2: pd.DataFrame, _df_turni_cal: pd.DataFrame, _calendario: pd.DataFrame,
+) -> dict:
+    """
+    Applica i filtri della sidebar ai cinque dataset. La chiave di cache è
+    (versioni dei dati, depositi, periodo, ferie, soglie gap): i DataFrame
+    (`_df_*`) non vengono hashati.
+    """
+    # --- filtri su staffing ---
+    mask_staff = _maschera_periodo(_df_raw, depositi, periodo)
+    df_filtered = _df_raw[mask_staff].copy()
+    df_filtered["categoria_giorno"] = categoria_per_giorno(df_filtered, _calendario)
+
+    if ferie:
+        # _df_raw arriva già filtrato dalla query (stesse righe di df_filtered):
+        # le quote calcolate sul frame versionato valgono anche per il sottoinsieme
+        extra = ferie_extra(_df_raw.attrs["versione"], "totale_autisti", PARAMETRI_FERIE_10, _df_raw)
+        df_filtered = applica_ferie_10gg(df_filtered, extra[mask_staff.values])
         df_filtered["assenze_previste"]  = df_filtered["assenze_previste_adj"]
         df_filtered["disponibili_netti"] = df_filtered["disponibili_netti_adj"]
         df_filtered["gap"]               = df_filtered["gap_adj"]
-    except Exception as e:
-        st.error(f"❌ Errore ferie: {e}")
-        st.stop()
 
-df_filtered = df_filtered[
-    (df_filtered["gap"] >= min_gap_filter) &
-    (df_filtered["gap"] <= max_gap_filter)
-].copy()
-
-# --- filtro df_copertura ---
-if len(df_copertura) > 0:
-    if ferie_10:
-        df_cop = df_copertura.copy()
-        df_cop["deposito_norm"] = df_cop["deposito"].str.strip().str.lower()
-        df_cop["ferie_extra"] = 0.0
-        df_cop.loc[df_cop["deposito_norm"] == "ancona", "ferie_extra"] += 5.0
-        mask_elig = ~df_cop["deposito_norm"].isin(["ancona", "moie"])
-        elig = df_cop[mask_elig].copy()
-        if not elig.empty:
-            elig["peso"] = elig["persone_in_forza"].clip(lower=0)
-            sum_p = elig.groupby("giorno")["peso"].transform("sum")
-            elig["quota"] = np.where(sum_p > 0, 5.0 * elig["peso"] / sum_p, 0.0)
-            df_cop.loc[elig.index, "ferie_extra"] += elig["quota"].values
-        df_cop["assenze_nominali"] = df_cop["assenze_nominali"] + df_cop["ferie_extra"]
-        df_cop["gap"] = (
-            df_cop["persone_in_forza"]
-            - df_cop["assenze_nominali"]
-            - df_cop["assenze_statistiche"]
-            - df_cop["turni_richiesti"]
-        )
-        df_cop.drop(columns=["deposito_norm", "ferie_extra"], inplace=True)
-        df_copertura_filtered = df_cop
-    else:
-        df_copertura_filtered = df_copertura.copy()
-
-    if len(date_range) == 2:
-        df_copertura_filtered = df_copertura_filtered[
-            (df_copertura_filtered["giorno"] >= pd.to_datetime(date_range[0])) &
-            (df_copertura_filtered["giorno"] <= pd.to_datetime(date_range[1])) &
-            (df_copertura_filtered["deposito"].isin(deposito_sel))
-        ]
-    else:
-        df_copertura_filtered = df_copertura_filtered[df_copertura_filtered["deposito"].isin(deposito_sel)]
-else:
-    df_copertura_filtered = pd.DataFrame()
-
-# --- filtri roster2 ---
-if roster2_disponibile and len(df_raw2) > 0:
-    if len(date_range) == 2:
-        df_filtered2 = df_raw2[
-            (df_raw2["deposito"].isin(deposito_sel)) &
-            (df_raw2["giorno"] >= pd.to_datetime(date_range[0])) &
-            (df_raw2["giorno"] <= pd.to_datetime(date_range[1]))
-        ].copy()
+    df_filtered = df_filtered[
+        (df_filtered["gap"] >= gap_min) &
+        (df_filtered["gap"] <= gap_max)
+    ].copy()
+
+    # --- filtro copertura ---
+    if len(_df_copertura) > 0:
+        mask_cop = _maschera_periodo(_df_copertura, depositi, periodo)
+        df_copertura_filtered = _df_copertura[mask_cop].copy()
+        if ferie:
+            # quote calcolate su tutti i depositi del giorno, poi ritagliate sul filtro
+            extra = ferie_extra(_df_copertura.attrs["versione"], "persone_in_forza", PARAMETRI_FERIE_10, _df_copertura)
+            applica_ferie_copertura(df_copertura_filtered, extra[mask_cop.values])
     else:
-        df_filtered2 = df_raw2[df_raw2["deposito"].isin(deposito_sel)].copy()
-else:
-    df_filtered2 = pd.DataFrame()
-
-if len(df_copertura2) > 0:
-    if ferie_10:
-        df_cop2 = df_copertura2.copy()
-        df_cop2["deposito_norm"] = df_cop2["deposito"].str.strip().str.lower()
-        df_cop2["ferie_extra"] = 0.0
-        df_cop2.loc[df_cop2["deposito_norm"] == "ancona", "ferie_extra"] += 5.0
-        mask_elig2 = ~df_cop2["deposito_norm"].isin(["ancona", "moie"])
-        elig2 = df_cop2[mask_elig2].copy()
-        if not elig2.empty:
-            elig2["peso"] = elig2["persone_in_forza"].clip(lower=0)
-            sum_p2 = elig2.groupby("giorno")["peso"].transform("sum")
-            elig2["quota"] = np.where(sum_p2 > 0, 5.0 * elig2["peso"] / sum_p2, 0.0)
-            df_cop2.loc[elig2.index, "ferie_extra"] += elig2["quota"].values
-        df_cop2["assenze_nominali"] = df_cop2["assenze_nominali"] + df_cop2["ferie_extra"]
-        df_cop2["gap"] = (
-            df_cop2["persone_in_forza"]
-            - df_cop2["assenze_nominali"]
-            - df_cop2["assenze_statistiche"]
-            - df_cop2["turni_richiesti"]
-        )
-        df_cop2.drop(columns=["deposito_norm", "ferie_extra"], inplace=True)
-        df_copertura2_filtered = df_cop2
+        df_copertura_filtered = pd.DataFrame()
+
+    # --- filtri roster2 ---
+    if len(_df_raw2) > 0:
+        df_filtered2 = _df_raw2[_maschera_periodo(_df_raw2, depositi, periodo)].copy()
+        df_filtered2["categoria_giorno"] = categoria_per_giorno(df_filtered2, _calendario)
     else:
-        df_copertura2_filtered = df_copertura2.copy()
-
-    if len(date_range) == 2:
-        df_copertura2_filtered = df_copertura2_filtered[
-            (df_copertura2_filtered["giorno"] >= pd.to_datetime(date_range[0])) &
-            (df_copertura2_filtered["giorno"] <= pd.to_datetime(date_range[1])) &
-            (df_copertura2_filtered["deposito"].isin(deposito_sel))
-        ]
+        df_filtered2 = pd.DataFrame()
+
+    if len(_df_copertura2) > 0:
+        mask_cop2 = _maschera_periodo(_df_copertura2, depositi, periodo)
+        df_copertura2_filtered = _df_copertura2[mask_cop2].copy()
+        if ferie:
+            extra = ferie_extra(_df_copertura2.attrs["versione"], "persone_in_forza", PARAMETRI_FERIE_10, _df_copertura2)
+            applica_ferie_copertura(df_copertura2_filtered, extra[mask_cop2.values])
     else:
-        df_copertura2_filtered = df_copertura2_filtered[
-            df_copertura2_filtered["deposito"].isin(deposito_sel)
-        ]
-else:
-    df_copertura2_filtered = pd.DataFrame()
-
-# --- filtro turni calendario ---
-if turni_cal_ok and len(df_turni_cal) > 0:
-    if len(date_range) == 2:
-        df_tc_filtered = df_turni_cal[
-            (df_turni_cal["giorno"] >= pd.to_datetime(date_range[0])) &
-            (df_turni_cal["giorno"] <= pd.to_datetime(date_range[1])) &
-            (df_turni_cal["deposito"].isin(deposito_sel))
-        ].copy()
+        df_copertura2_filtered = pd.DataFrame()
+
+    # --- filtro turni calendario ---
+    if len(_df_turni_cal) > 0:
+        df_tc_filtered = _df_turni_cal[_maschera_periodo(_df_turni_cal, depositi, periodo)].copy()
     else:
-        df_tc_filtered = df_turni_cal[df_turni_cal["deposito"].isin(deposito_sel)].copy()
-else:
-    df_tc_filtered = pd.DataFrame()
+        df_tc_filtered = pd.DataFrame()
+
+    filtrati = {
+        "staffing":    df_filtered,
+        "copertura":   df_copertura_filtered,
+        "staffing2":   df_filtered2,
+        "copertura2":  df_copertura2_filtered,
+        "turni_cal":   df_tc_filtered,
+    }
+    return {nome: senza_categorie_inutili(df) for nome, df in filtrati.items()}
+
+
+def _versione(df: pd.DataFrame) -> str:
+    return df.attrs.get("versione", "") if len(df) else ""
+
+
+if not roster2_disponibile:
+    df_raw2 = pd.DataFrame()
+if not turni_cal_ok:
+    df_turni_cal = pd.DataFrame()
+calendario = dimensione_calendario(_versione(df_cal), df_cal)
+
+_chiave_filtri = (
+    tuple(_versione(d) for d in (df_raw, df_copertura, df_raw2, df_copertura2, df_turni_cal, df_cal)),
+    tuple(sorted(deposito_sel)), tuple(date_range), ferie_10,
+    min_gap_filter, max_gap_filter,
+)
+try:
+    with span("filtri") as _rec:
+        _filtrati = filtra_dati(*_chiave_filtri, df_raw, df_copertura, df_raw2, df_copertura2, df_turni_cal, calendario)
+        misura(_rec, _filtrati["staffing"])
+except Exception as e:
+    st.error(f"❌ Errore filtri: {e}")
+    chiudi_splash(splash, attendi=False)
+    st.stop()
+
+df_filtered            = _filtrati["staffing"]
+df_copertura_filtered  = _filtrati["copertura"]
+df_filtered2           = _filtrati["staffing2"]
+df_copertura2_filtered = _filtrati["copertura2"]
+df_tc_filtered         = _filtrati["turni_cal"]
+
+
+# Grafici di copertura e heatmap leggono aggregati per periodo: la
+# risoluzione (giorno / settimana / mese) segue la lunghezza del periodo
+# selezionato, così barre, celle ed etichette restano in numero limitato.
+# I KPI "per giorno" usano sempre gli aggregati giornalieri.
+MISURE_COPERTURA = ("persone_in_forza", "turni_richiesti", "assenze_nominali", "assenze_statistiche", "gap")
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def rollup_dati(chiave: tuple, risoluzione: str, _filtrati: dict) -> dict:
+    """Aggregati a `risoluzione` dei dati filtrati; `chiave` è quella di filtra_dati."""
+    return {
+        "copertura":    rollup(_filtrati["copertura"], risoluzione, MISURE_COPERTURA),
+        "copertura2":   rollup(_filtrati["copertura2"], risoluzione, MISURE_COPERTURA),
+        "gap_depositi": rollup(_filtrati["staffing"], risoluzione, ("gap",), per=("deposito",)),
+    }
+
+
+risoluzione = scegli_risoluzione(*(date_range if len(date_range) == 2 else (min_date, max_date)))
+with span("rollup"):
+    rollup_giorno  = rollup_dati(_chiave_filtri, "giorno", _filtrati)
+    rollup_periodo = (
+        rollup_giorno if risoluzione == "giorno" else rollup_dati(_chiave_filtri, risoluzione, _filtrati)
+    )
+
+# Dati caricati e filtrati: lo splash (se attivo) può lasciare il posto alla dashboard
+chiudi_splash(splash)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _report_memoria(versioni: tuple, _frames: dict) -> pd.DataFrame:
+    return report_memoria(_frames)
+
+
+with st.sidebar.expander("📦 Memoria dataset"):
+    _caricati = {
+        "staffing": df_raw, "depositi": df_depositi, "turni_calendario": df_turni_cal,
+        "copertura": df_copertura, "staffing_roster2": df_raw2, "copertura_roster2": df_copertura2,
+    }
+    rep_mem = _report_memoria(tuple(_versione(d) for d in _caricati.values()), _caricati)
+    if len(rep_mem) > 0:
+        st.dataframe(rep_mem.round(1), hide_index=True, use_container_width=True)
+        prima, dopo = rep_mem["prima_kb"].sum(), rep_mem["dopo_kb"].sum()
+        st.caption(f"Totale {prima:,.0f} KB → {dopo:,.0f} KB (×{prima / max(dopo, 1e-9):.1f}) con lo schema compatto")
 
 
 # --------------------------------------------------
@@ -1170,7 +1845,7 @@ if show_insights and len(df_filtered) > 0:
     ic1, ic2, ic3 = st.columns(3)
 
     with ic1:
-        by_dep = df_filtered.groupby("deposito")["gap"].mean()
+        by_dep = df_filtered.groupby("deposito", observed=True)["gap"].mean()
         worst_dep = by_dep.idxmin()
         st.markdown(f"""<div class='insight-card'><h4><i class='fas fa-exclamation-triangle'></i> Deposito Critico</h4>
             <p style='font-size:1.1rem;margin:0;'><b>{worst_dep}</b> — gap medio: <b>{by_dep.min():.1f}</b></p>
@@ -1178,7 +1853,7 @@ if show_insights and len(df_filtered) > 0:
         </div>""", unsafe_allow_html=True)
 
     with ic2:
-        by_cat = df_filtered.groupby("categoria_giorno")["gap"].mean()
+        by_cat = df_filtered.groupby("categoria_giorno", observed=True)["gap"].mean()
         worst_cat = by_cat.idxmin()
         st.markdown(f"""<div class='insight-card'><h4><i class='fas fa-calendar-times'></i> Giorno Critico</h4>
             <p style='font-size:1.1rem;margin:0;'><b>{worst_cat}</b> — gap medio: <b>{by_cat.min():.1f}</b></p>
@@ -1204,14 +1879,14 @@ if show_insights and len(df_filtered) > 0:
 # AGGREGATI PER DEPOSITO
 # --------------------------------------------------
 if len(df_filtered) > 0:
-    by_deposito = df_filtered.groupby("deposito").agg(
+    by_deposito = df_filtered.groupby("deposito", observed=True).agg(
         turni_richiesti=("turni_richiesti","sum"),
         disponibili_netti=("disponibili_netti","sum"),
         gap=("gap","sum"),
         assenze_previste=("assenze_previste","sum"),
     ).reset_index()
     by_deposito = by_deposito.merge(df_depositi, on="deposito", how="left")
-    giorni_per_dep = df_filtered.groupby("deposito")["giorno"].nunique().rename("giorni_periodo")
+    giorni_per_dep = df_filtered.groupby("deposito", observed=True)["giorno"].nunique().rename("giorni_periodo")
     by_deposito    = by_deposito.merge(giorni_per_dep, left_on="deposito", right_index=True)
     by_deposito["media_gap_giorno"]  = (by_deposito["gap"] / by_deposito["giorni_periodo"]).round(1)
     by_deposito["tasso_copertura_%"] = (by_deposito["disponibili_netti"] / by_deposito["turni_richiesti"] * 100).fillna(0).round(1)
@@ -1223,913 +1898,948 @@ else:
 # --------------------------------------------------
 # TABS
 # --------------------------------------------------
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+# In modalità lazy i tab tengono traccia di quello aperto (cambiare tab fa
+# un rerun) e si calcola solo il contenuto visibile: query e grafici degli
+# altri tab vengono rimandati a quando l'utente li apre.
+TAB_LAZY = True
+
+
+def crea_tabs(etichette: list, key: str) -> list:
+    if TAB_LAZY:
+        return st.tabs(etichette, key=key, on_change="rerun")
+    return st.tabs(etichette)
+
+
+def tab_aperto(tab) -> bool:
+    """False solo per un tab nascosto in modalità lazy (senza tracciamento `open` è None)."""
+    return getattr(tab, "open", None) is not False
+
+
+tab1, tab2, tab3, tab4, tab5, tab6 = crea_tabs([
     "📊 Overview", "📈 Analisi & Assenze", "🚌 Turni Calendario", "🎯 Depositi", "📥 Export",
     "🔄 Confronto & Assunzioni",
-])
+], key="tab_principale")
 
 
 # ══════════════════════════════════════════════════
 # TAB 1 — OVERVIEW
 # ══════════════════════════════════════════════════
-with tab1:
-    if len(df_filtered) == 0:
-        st.info("Nessun dato.")
-    else:
-        st.markdown("#### Copertura del Servizio")
-        st.markdown(
-            "<p style='font-size:0.85rem;'>La barra impilata raggiunge la linea di <b>breakeven</b> (organico). "
-            "<span style='color:#22c55e;font-weight:600;'>Verde</span> = buffer sotto la linea · "
-            "<span style='color:#ef4444;font-weight:600;'>Rosso</span> = deficit che sporge sopra.</p>",
-            unsafe_allow_html=True,
-        )
-
-        if len(df_copertura_filtered) > 0:
-            # --------------------------------------------------
-            # 1) Aggregazione giornaliera
-            # --------------------------------------------------
-            cop = (
-                df_copertura_filtered.groupby("giorno")
-                .agg(
-                    persone_in_forza=("persone_in_forza", "sum"),
-                    turni_richiesti=("turni_richiesti", "sum"),
-                    assenze_nominali=("assenze_nominali", "sum"),
-                    assenze_statistiche=("assenze_statistiche", "sum"),
-                    gap=("gap", "sum"),
-                )
-                .reset_index()
-            )
-
-            kc1, kc2, kc3, kc4 = st.columns(4)
-            with kc1:
-                st.metric("👥 Media/gg", f"{cop['persone_in_forza'].mean():.0f}")
-            with kc2:
-                st.metric("✅ Giorni OK", f"{int((cop['gap'] >= 0).sum())}")
-            with kc3:
-                st.metric("🚨 Deficit", f"{int((cop['gap'] < 0).sum())}")
-            with kc4:
-                st.metric(
-                    "📉 Gap medio",
-                    f"{cop['gap'].mean():.1f}",
-                    delta=f"min: {cop['gap'].min():.0f}",
-                )
-
-            # --------------------------------------------------
-            # 2) Calcoli per stack buffer/deficit
-            # --------------------------------------------------
-            # disponibili = persone - assenze (quanto resta per coprire turni)
-            cop["disponibili_netti"] = (
-                cop["persone_in_forza"] - cop["assenze_nominali"] - cop["assenze_statistiche"]
-            ).clip(lower=0)
-
-            # turni_coperti = parte dei turni che sta SOTTO il breakeven
-            cop["turni_coperti"] = cop[["turni_richiesti", "disponibili_netti"]].min(axis=1)
-
-            # buffer = gap positivo → persone in eccesso (verde, sotto la linea)
-            cop["buffer"] = cop["gap"].clip(lower=0)
-
-            # deficit = gap negativo → turni scoperti (rosso, SOPRA la linea breakeven)
-            cop["deficit"] = (-cop["gap"]).clip(lower=0)
-
-            # --------------------------------------------------
-            # 3) Figura (subplots) + trace
-            # --------------------------------------------------
-            fig_cop = make_subplots(
-                rows=2,
-                cols=1,
-                row_heights=[0.70, 0.30],
-                shared_xaxes=True,
-                vertical_spacing=0.05,
-                subplot_titles=("Distribuzione persone in forza", "Buffer / Deficit"),
+with tab1, span("tab.overview"):
+    if tab_aperto(tab1):
+        if len(df_filtered) == 0:
+            st.info("Nessun dato.")
+        else:
+            st.markdown("#### Copertura del Servizio")
+            st.markdown(
+                "<p style='font-size:0.85rem;'>La barra impilata raggiunge la linea di <b>breakeven</b> (organico). "
+                "<span style='color:#22c55e;font-weight:600;'>Verde</span> = buffer sotto la linea · "
+                "<span style='color:#ef4444;font-weight:600;'>Rosso</span> = deficit che sporge sopra.</p>",
+                unsafe_allow_html=True,
             )
 
-            # Stack principale
-            fig_cop.add_trace(
-                go.Bar(
-                    x=cop["giorno"],
-                    y=cop["assenze_nominali"],
-                    name="Assenze roster",
-                    marker_color="#cbd5e1",
-                    hovertemplate="<b>Assenze roster</b><br>%{x|%d/%m/%Y}: <b>%{y:.0f}</b><extra></extra>",
-                ),
-                row=1,
-                col=1,
-            )
+            if len(df_copertura_filtered) > 0:
+                # --------------------------------------------------
+                # 1) Aggregazione giornaliera (KPI) e per periodo (grafico)
+                # --------------------------------------------------
+                cop = rollup_giorno["copertura"]
+                cop_graf = rollup_periodo["copertura"].copy()
+                hx = FORMATO_HOVER[risoluzione]
+
+                kc1, kc2, kc3, kc4 = st.columns(4)
+                with kc1:
+                    st.metric("👥 Media/gg", f"{cop['persone_in_forza'].mean():.0f}")
+                with kc2:
+                    st.metric("✅ Giorni OK", f"{int((cop['gap'] >= 0).sum())}")
+                with kc3:
+                    st.metric("🚨 Deficit", f"{int((cop['gap'] < 0).sum())}")
+                with kc4:
+                    st.metric(
+                        "📉 Gap medio",
+                        f"{cop['gap'].mean():.1f}",
+                        delta=f"min: {cop['gap'].min():.0f}",
+                    )
 
-            fig_cop.add_trace(
-                go.Bar(
-                    x=cop["giorno"],
-                    y=cop["assenze_statistiche"],
-                    name="Assenze storiche",
-                    marker_color="#e2e8f0",
-                    hovertemplate="<b>Assenze storiche</b><br>%{x|%d/%m/%Y}: <b>%{y:.1f}</b><extra></extra>",
-                ),
-                row=1,
-                col=1,
-            )
+                # --------------------------------------------------
+                # 2) Calcoli per stack buffer/deficit
+                # --------------------------------------------------
+                # disponibili = persone - assenze (quanto resta per coprire turni)
+                cop_graf["disponibili_netti"] = (
+                    cop_graf["persone_in_forza"] - cop_graf["assenze_nominali"] - cop_graf["assenze_statistiche"]
+                ).clip(lower=0)
+
+                # turni_coperti = parte dei turni che sta SOTTO il breakeven
+                cop_graf["turni_coperti"] = cop_graf[["turni_richiesti", "disponibili_netti"]].min(axis=1)
+
+                # buffer = gap positivo → persone in eccesso (verde, sotto la linea)
+                cop_graf["buffer"] = cop_graf["gap"].clip(lower=0)
+
+                # deficit = gap negativo → turni scoperti (rosso, SOPRA la linea breakeven)
+                cop_graf["deficit"] = (-cop_graf["gap"]).clip(lower=0)
+
+                # --------------------------------------------------
+                # 3) Figura (subplots) + trace
+                # --------------------------------------------------
+                fig_cop = make_subplots(
+                    rows=2,
+                    cols=1,
+                    row_heights=[0.70, 0.30],
+                    shared_xaxes=True,
+                    vertical_spacing=0.05,
+                    subplot_titles=("Distribuzione persone in forza", "Buffer / Deficit"),
+                )
 
-            fig_cop.add_trace(
-                go.Bar(
-                    x=cop["giorno"],
-                    y=cop["turni_coperti"],
-                    name="Turni coperti",
-                    marker_color="#94a3b8",
-                    hovertemplate=(
-                        "<b>Turni coperti</b><br>%{x|%d/%m/%Y}: "
-                        "<b>%{y:.0f}</b> / %{customdata:.0f}<extra></extra>"
+                # Stack principale
+                fig_cop.add_trace(
+                    go.Bar(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["assenze_nominali"],
+                        name="Assenze roster",
+                        marker_color="#cbd5e1",
+                        hovertemplate="<b>Assenze roster</b><br>" + hx + ": <b>%{y:.0f}</b><extra></extra>",
                     ),
-                    customdata=cop["turni_richiesti"],
-                ),
-                row=1,
-                col=1,
-            )
+                    row=1,
+                    col=1,
+                )
 
-            fig_cop.add_trace(
-                go.Bar(
-                    x=cop["giorno"],
-                    y=cop["buffer"],
-                    name="Buffer",
-                    marker=dict(
-                        color="rgba(34,197,94,0.75)",
-                        line=dict(width=0.5, color="rgba(34,197,94,0.9)"),
+                fig_cop.add_trace(
+                    go.Bar(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["assenze_statistiche"],
+                        name="Assenze storiche",
+                        marker_color="#e2e8f0",
+                        hovertemplate="<b>Assenze storiche</b><br>" + hx + ": <b>%{y:.1f}</b><extra></extra>",
                     ),
-                    text=[f"+{int(b)}" if b > 0 else "" for b in cop["buffer"]],
-                    textposition="outside",
-                    textfont=dict(size=9, color="#16a34a"),
-                    hovertemplate="<b>Buffer</b><br>%{x|%d/%m/%Y}: <b>+%{y:.0f}</b><extra></extra>",
-                ),
-                row=1,
-                col=1,
-            )
+                    row=1,
+                    col=1,
+                )
 
-            fig_cop.add_trace(
-                go.Bar(
-                    x=cop["giorno"],
-                    y=cop["deficit"],
-                    name="Deficit",
-                    marker=dict(
-                        color="rgba(239,68,68,0.85)",
-                        line=dict(width=0.5, color="rgba(220,38,38,0.9)"),
+                fig_cop.add_trace(
+                    go.Bar(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["turni_coperti"],
+                        name="Turni coperti",
+                        marker_color="#94a3b8",
+                        hovertemplate=(
+                            "<b>Turni coperti</b><br>" + hx + ": "
+                            "<b>%{y:.0f}</b> / %{customdata:.0f}<extra></extra>"
+                        ),
+                        customdata=cop_graf["turni_richiesti"],
                     ),
-                    text=[f"−{int(d)}" if d > 0 else "" for d in cop["deficit"]],
-                    textposition="outside",
-                    textfont=dict(size=9, color="#dc2626"),
-                    hovertemplate="<b>Deficit</b><br>%{x|%d/%m/%Y}: <b>−%{y:.0f}</b><extra></extra>",
-                ),
-                row=1,
-                col=1,
-            )
+                    row=1,
+                    col=1,
+                )
 
-            # Linea breakeven = organico totale (persone_in_forza)
-            fig_cop.add_trace(
-                go.Scatter(
-                    x=cop["giorno"],
-                    y=cop["persone_in_forza"],
-                    name="Organico (breakeven)",
-                    mode="lines",
-                    line=dict(color="#78716c", width=2.5, dash="dot"),
-                    hovertemplate="<b>Organico</b><br>%{x|%d/%m/%Y}: <b>%{y:.0f}</b><extra></extra>",
-                ),
-                row=1,
-                col=1,
-            )
+                fig_cop.add_trace(
+                    go.Bar(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["buffer"],
+                        name="Buffer",
+                        marker=dict(
+                            color="rgba(34,197,94,0.75)",
+                            line=dict(width=0.5, color="rgba(34,197,94,0.9)"),
+                        ),
+                        text=testi(cop_graf["buffer"], lambda b: f"+{int(b)}", lambda b: b > 0),
+                        textposition="outside",
+                        textfont=dict(size=9, color="#16a34a"),
+                        hovertemplate="<b>Buffer</b><br>" + hx + ": <b>+%{y:.0f}</b><extra></extra>",
+                    ),
+                    row=1,
+                    col=1,
+                )
 
-            # Barra gap (secondo subplot)
-            colori_gap = [
-                "rgba(34,197,94,0.80)" if g >= 0 else "rgba(239,68,68,0.85)" for g in cop["gap"]
-            ]
-            fig_cop.add_trace(
-                go.Bar(
-                    x=cop["giorno"],
-                    y=cop["gap"],
-                    marker=dict(color=colori_gap),
-                    text=[f"{int(g)}" for g in cop["gap"]],
-                    textposition="outside",
-                    textfont=dict(size=9, color="#cbd5e1"),
-                    showlegend=False,
-                ),
-                row=2,
-                col=1,
-            )
+                fig_cop.add_trace(
+                    go.Bar(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["deficit"],
+                        name="Deficit",
+                        marker=dict(
+                            color="rgba(239,68,68,0.85)",
+                            line=dict(width=0.5, color="rgba(220,38,38,0.9)"),
+                        ),
+                        text=testi(cop_graf["deficit"], lambda d: f"−{int(d)}", lambda d: d > 0),
+                        textposition="outside",
+                        textfont=dict(size=9, color="#dc2626"),
+                        hovertemplate="<b>Deficit</b><br>" + hx + ": <b>−%{y:.0f}</b><extra></extra>",
+                    ),
+                    row=1,
+                    col=1,
+                )
 
-            fig_cop.add_hline(y=0, line_color="#94a3b8", line_width=1, row=2, col=1)
+                # Linea breakeven = organico totale (persone_in_forza)
+                fig_cop.add_trace(
+                    go.Scatter(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["persone_in_forza"],
+                        name="Organico (breakeven)",
+                        mode="lines",
+                        line=dict(color="#78716c", width=2.5, dash="dot"),
+                        hovertemplate="<b>Organico</b><br>" + hx + ": <b>%{y:.0f}</b><extra></extra>",
+                    ),
+                    row=1,
+                    col=1,
+                )
 
-            if soglia_gap < 0:
-                fig_cop.add_hline(
-                    y=soglia_gap,
-                    line_dash="dash",
-                    line_color="#ef4444",
-                    line_width=2,
-                    annotation_text=f"Soglia ({soglia_gap})",
-                    annotation_font=dict(color="#ef4444", size=10),
+                # Barra gap (secondo subplot)
+                colori_gap = colori_segno(cop_graf["gap"], "rgba(34,197,94,0.80)", "rgba(239,68,68,0.85)")
+                fig_cop.add_trace(
+                    go.Bar(
+                        x=cop_graf["giorno"],
+                        y=cop_graf["gap"],
+                        marker=dict(color=colori_gap),
+                        text=testi(cop_graf["gap"], lambda g: f"{int(g)}"),
+                        textposition="outside",
+                        textfont=dict(size=9, color="#cbd5e1"),
+                        showlegend=False,
+                    ),
                     row=2,
                     col=1,
                 )
 
-            # --------------------------------------------------
-            # 4) Layout (tema scuro coerente)
-            # --------------------------------------------------
-            fig_cop.update_layout(
-                barmode="stack",
-                height=680,
-                hovermode="x unified",
-
-                plot_bgcolor=PLOTLY_TEMPLATE["plot_bgcolor"],
-                paper_bgcolor=PLOTLY_TEMPLATE["paper_bgcolor"],
-                font=PLOTLY_TEMPLATE["font"],
-
-                legend=dict(
-                    orientation="h",
-                    y=1.02,
-                    xanchor="right",
-                    x=1,
-                    font=dict(size=10),
-                    bgcolor="rgba(15,23,42,0.65)",
-                    bordercolor="rgba(245,158,11,0.18)",
-                    borderwidth=1,
-                ),
-                margin=dict(t=60, b=20, l=10, r=10),
-            )
-
-            fig_cop.update_xaxes(
-                tickformat="%d/%m",
-                tickangle=-45,
-                gridcolor="rgba(96,165,250,0.10)",
-                linecolor="rgba(96,165,250,0.30)",
-            )
-            fig_cop.update_yaxes(
-                gridcolor="rgba(96,165,250,0.10)",
-                linecolor="rgba(96,165,250,0.30)",
-                zeroline=False,
-            )
-
-            fig_cop.update_yaxes(title_text="Persone", row=1, col=1)
-            fig_cop.update_yaxes(title_text="Gap", row=2, col=1)
-
-            st.plotly_chart(fig_cop, use_container_width=True, key="pc1")
-
-        with st.expander("📊 Gauge & Distribuzione"):
-            eg1, eg2 = st.columns(2)
-            with eg1:
-                fig_g = go.Figure(
-                    go.Indicator(
-                        mode="gauge+number+delta",
-                        value=gap_pct_medio,
-                        title={"text": "Gap %", "font": {"size": 13, "color": "#cbd5e1"}},
-                        delta={"reference": 0, "suffix": "%"},
-                        number={"suffix": "%", "font": {"size": 24, "color": "#fde68a"}},
-                        gauge={
-                            "axis": {"range": [-20, 20]},
-                            "bar": {"color": "#f59e0b"},
-                            "bgcolor": "rgba(15,23,42,0.65)",
-                            "borderwidth": 1,
-                            "bordercolor": "rgba(96,165,250,0.25)",
-                            "steps": [
-                                {"range": [-20, -10], "color": "rgba(239,68,68,0.18)"},
-                                {"range": [-10, 0], "color": "rgba(245,158,11,0.18)"},
-                                {"range": [0, 10], "color": "rgba(34,197,94,0.16)"},
-                                {"range": [10, 20], "color": "rgba(34,197,94,0.10)"},
-                            ],
-                        },
+                fig_cop.add_hline(y=0, line_color="#94a3b8", line_width=1, row=2, col=1)
+
+                if soglia_gap < 0:
+                    fig_cop.add_hline(
+                        y=soglia_gap,
+                        line_dash="dash",
+                        line_color="#ef4444",
+                        line_width=2,
+                        annotation_text=f"Soglia ({soglia_gap})",
+                        annotation_font=dict(color="#ef4444", size=10),
+                        row=2,
+                        col=1,
                     )
+
+                # --------------------------------------------------
+                # 4) Layout (tema scuro coerente)
+                # --------------------------------------------------
+                fig_cop.update_layout(
+                    barmode="stack",
+                    height=680,
+                    hovermode="x unified",
+
+                    plot_bgcolor=PLOTLY_TEMPLATE["plot_bgcolor"],
+                    paper_bgcolor=PLOTLY_TEMPLATE["paper_bgcolor"],
+                    font=PLOTLY_TEMPLATE["font"],
+
+                    legend=dict(
+                        orientation="h",
+                        y=1.02,
+                        xanchor="right",
+                        x=1,
+                        font=dict(size=10),
+                        bgcolor="rgba(15,23,42,0.65)",
+                        bordercolor="rgba(245,158,11,0.18)",
+                        borderwidth=1,
+                    ),
+                    margin=dict(t=60, b=20, l=10, r=10),
                 )
-                fig_g.update_layout(
-                    height=250,
-                    paper_bgcolor="rgba(0,0,0,0)",
-                    margin=dict(l=20, r=20, t=30, b=20),
+
+                fig_cop.update_xaxes(
+                    tickformat=FORMATO_TICK[risoluzione],
+                    tickangle=-45,
+                    gridcolor="rgba(96,165,250,0.10)",
+                    linecolor="rgba(96,165,250,0.30)",
                 )
-                st.plotly_chart(fig_g, use_container_width=True, key="pc2")
-
-            with eg2:
-                ab = pd.DataFrame(
-                    {
-                        "T": ["Infortuni", "Malattie", "L.104", "Congedi", "Permessi", "Altro"],
-                        "V": [
-                            int(df_filtered[c].sum())
-                            for c in [
-                                "infortuni",
-                                "malattie",
-                                "legge_104",
-                                "congedo_parentale",
-                                "permessi_vari",
-                                "altre_assenze",
-                            ]
-                        ],
-                    }
+                fig_cop.update_yaxes(
+                    gridcolor="rgba(96,165,250,0.10)",
+                    linecolor="rgba(96,165,250,0.30)",
+                    zeroline=False,
                 )
-                ab = ab[ab["V"] > 0]
-                if len(ab) > 0:
-                    fig_p = go.Figure(
-                        go.Pie(
-                            labels=ab["T"],
-                            values=ab["V"],
-                            hole=0.5,
-                            marker=dict(
-                                colors=[
-                                    "#ef4444",
-                                    "#f97316",
-                                    "#eab308",
-                                    "#3b82f6",
-                                    "#22c55e",
-                                    "#94a3b8",
-                                ]
-                            ),
-                            textinfo="label+percent",
+
+                fig_cop.update_yaxes(title_text="Persone", row=1, col=1)
+                fig_cop.update_yaxes(title_text="Gap", row=2, col=1)
+
+                if risoluzione != "giorno":
+                    st.caption(f"📆 Un valore per {risoluzione}: medie giornaliere del periodo")
+                plotly_chart(fig_cop, use_container_width=True, key="pc1")
+
+            with st.expander("📊 Gauge & Distribuzione"):
+                eg1, eg2 = st.columns(2)
+                with eg1:
+                    fig_g = go.Figure(
+                        go.Indicator(
+                            mode="gauge+number+delta",
+                            value=gap_pct_medio,
+                            title={"text": "Gap %", "font": {"size": 13, "color": "#cbd5e1"}},
+                            delta={"reference": 0, "suffix": "%"},
+                            number={"suffix": "%", "font": {"size": 24, "color": "#fde68a"}},
+                            gauge={
+                                "axis": {"range": [-20, 20]},
+                                "bar": {"color": "#f59e0b"},
+                                "bgcolor": "rgba(15,23,42,0.65)",
+                                "borderwidth": 1,
+                                "bordercolor": "rgba(96,165,250,0.25)",
+                                "steps": [
+                                    {"range": [-20, -10], "color": "rgba(239,68,68,0.18)"},
+                                    {"range": [-10, 0], "color": "rgba(245,158,11,0.18)"},
+                                    {"range": [0, 10], "color": "rgba(34,197,94,0.16)"},
+                                    {"range": [10, 20], "color": "rgba(34,197,94,0.10)"},
+                                ],
+                            },
                         )
                     )
-                    fig_p.update_layout(
+                    fig_g.update_layout(
                         height=250,
-                        showlegend=False,
                         paper_bgcolor="rgba(0,0,0,0)",
-                        margin=dict(l=0, r=0, t=0, b=0),
-                        font=dict(color="#cbd5e1"),
+                        margin=dict(l=20, r=20, t=30, b=20),
                     )
-                    st.plotly_chart(fig_p, use_container_width=True, key="pc3")
+                    plotly_chart(fig_g, use_container_width=True, key="pc2")
+
+                with eg2:
+                    ab = pd.DataFrame(
+                        {
+                            "T": ["Infortuni", "Malattie", "L.104", "Congedi", "Permessi", "Altro"],
+                            "V": [
+                                int(df_filtered[c].sum())
+                                for c in [
+                                    "infortuni",
+                                    "malattie",
+                                    "legge_104",
+                                    "congedo_parentale",
+                                    "permessi_vari",
+                                    "altre_assenze",
+                                ]
+                            ],
+                        }
+                    )
+                    ab = ab[ab["V"] > 0]
+                    if len(ab) > 0:
+                        fig_p = go.Figure(
+                            go.Pie(
+                                labels=ab["T"],
+                                values=ab["V"],
+                                hole=0.5,
+                                marker=dict(
+                                    colors=[
+                                        "#ef4444",
+                                        "#f97316",
+                                        "#eab308",
+                                        "#3b82f6",
+                                        "#22c55e",
+                                        "#94a3b8",
+                                    ]
+                                ),
+                                textinfo="label+percent",
+                            )
+                        )
+                        fig_p.update_layout(
+                            height=250,
+                            showlegend=False,
+                            paper_bgcolor="rgba(0,0,0,0)",
+                            margin=dict(l=0, r=0, t=0, b=0),
+                            font=dict(color="#cbd5e1"),
+                        )
+                        plotly_chart(fig_p, use_container_width=True, key="pc3")
 
-        st.markdown("---")
-        st.markdown("#### Heatmap Criticità")
-
-        pv = df_filtered.pivot_table(
-            values="gap",
-            index="deposito",
-            columns=df_filtered["giorno"].dt.strftime("%d/%m"),
-            aggfunc="sum",
-            fill_value=0,
-        )
+            st.markdown("---")
+            st.markdown(
+                "#### Heatmap Criticità"
+                + ("" if risoluzione == "giorno" else f" · gap medio giornaliero per {risoluzione}")
+            )
 
-        if len(pv) > 0:
-            fig_h = go.Figure(
-                go.Heatmap(
-                    z=pv.values,
-                    x=pv.columns,
-                    y=pv.index,
-                    colorscale=[
-                        [0, "#991b1b"],
-                        [0.35, "#ef4444"],
-                        [0.45, "#fdba74"],
-                        [0.5, "#0f172a"],
-                        [0.55, "#bbf7d0"],
-                        [0.7, "#22c55e"],
-                        [1, "#166534"],
-                    ],
-                    zmid=0,
-                    text=pv.values,
-                    texttemplate="%{text:.0f}",
-                    textfont=dict(size=10, color="#e2e8f0"),
-                    colorbar=dict(title="Gap"),
-                )
+            gap_dep = rollup_periodo["gap_depositi"]
+            pv = gap_dep.pivot_table(
+                values="gap",
+                index="deposito",
+                columns="giorno",
+                aggfunc="sum",
+                fill_value=0,
+                observed=True,
             )
-            fig_h.update_layout(height=max(300, len(pv) * 40), **PLOTLY_TEMPLATE)
-            st.plotly_chart(fig_h, use_container_width=True, key="pc4")
+            pv.columns = etichette(pv.columns.to_series(), risoluzione)
+
+            if len(pv) > 0:
+                fig_h = go.Figure(
+                    go.Heatmap(
+                        z=pv.values,
+                        x=pv.columns,
+                        y=pv.index,
+                        colorscale=[
+                            [0, "#991b1b"],
+                            [0.35, "#ef4444"],
+                            [0.45, "#fdba74"],
+                            [0.5, "#0f172a"],
+                            [0.55, "#bbf7d0"],
+                            [0.7, "#22c55e"],
+                            [1, "#166534"],
+                        ],
+                        zmid=0,
+                        text=pv.values,
+                        texttemplate="%{text:.0f}",
+                        textfont=dict(size=10, color="#e2e8f0"),
+                        colorbar=dict(title="Gap"),
+                    )
+                )
+                fig_h.update_layout(height=max(300, len(pv) * 40), **PLOTLY_TEMPLATE)
+                plotly_chart(fig_h, use_container_width=True, key="pc4")
 # ══════════════════════════════════════════════════
 # TAB 2 — ANALISI & ASSENZE
 # ══════════════════════════════════════════════════
-with tab2:
-    if len(df_filtered) == 0:
-        st.info("Nessun dato per i filtri selezionati.")
+@fragment_tracciato
+def grafico_ferie_riposi(df_fp_r: pd.DataFrame, fp_r_daily: pd.DataFrame) -> None:
+    """Grafico FP/Riposi: cambiare vista o tipo rilancia solo questa sezione."""
+    view_fp_r = st.radio("Visualizza", ["Per tipo (FP vs R)","Per deposito"], horizontal=True, key="view_fp_r")
+    if view_fp_r == "Per tipo (FP vs R)":
+        fig_fpr = go.Figure()
+        fig_fpr.add_trace(go.Bar(x=fp_r_daily["giorno"], y=fp_r_daily["ferie_programmate"], name="FP", marker_color="#22c55e"))
+        fig_fpr.add_trace(go.Bar(x=fp_r_daily["giorno"], y=fp_r_daily["riposi"], name="Riposi (R)", marker_color="#3b82f6"))
+        fig_fpr.update_layout(barmode="stack", height=450, hovermode="x unified",
+            plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
+            legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1),
+            xaxis=dict(tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+            yaxis=dict(title="Persone",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
+        plotly_chart(fig_fpr, use_container_width=True, key="pc_8")
     else:
-        st2_a, st2_b, st2_c = st.tabs(["📉 Gap & Waterfall", "🏖️ Ferie & Riposi", "🤒 Assenze Complete"])
-
-        with st2_a:
-            st.markdown(
-                "#### <i class='fas fa-water'></i> Composizione Gap Medio Giornaliero — Luglio",
-                unsafe_allow_html=True
-            )
-            st.markdown(
-                "<p style='color:#93c5fd;font-size:0.85rem;'>"
-                "Valori fissi luglio: <b>318 autisti</b> · <b>237 turni/giorno</b> · "
-                "assenze statistiche (lun–sab) + assenze roster (lun–sab, media giornaliera)</p>",
-                unsafe_allow_html=True
-            )
+        tipo_dep = st.radio("Tipo", ["FP","R"], horizontal=True, key="tipo_dep_fpr")
+        col_sel  = "ferie_programmate" if tipo_dep == "FP" else "riposi"
+        fig_fpr_dep = go.Figure()
+        for dep in sorted(df_fp_r["deposito"].unique()):
+            df_d = df_fp_r[df_fp_r["deposito"] == dep]
+            fig_fpr_dep.add_trace(go.Bar(x=df_d["giorno"], y=df_d[col_sel], name=dep.title(), marker_color=get_colore_deposito(dep)))
+        fig_fpr_dep.update_layout(barmode="stack", height=450, hovermode="x unified",
+            plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
+            legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1),
+            xaxis=dict(tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+            yaxis=dict(title="Persone",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
+        plotly_chart(fig_fpr_dep, use_container_width=True, key="pc_9")
+
+
+@fragment_tracciato
+def dettaglio_assenze_deposito(df_filtered: pd.DataFrame, df_nominali: pd.DataFrame, depositi: list,
+                               palette_stat: list, palette_nom: list) -> None:
+    """Dettaglio assenze di un singolo deposito (rerun limitato alla sezione)."""
+    dep_ass = st.selectbox("Deposito", sorted(depositi), key="dep_ass_detail", format_func=lambda x: x.title())
+    df_dep_stat = df_filtered[df_filtered["deposito"] == dep_ass].groupby("giorno").agg(
+        infortuni=("infortuni","sum"), malattie=("malattie","sum"), legge_104=("legge_104","sum"),
+        altre_assenze=("altre_assenze","sum"), congedo_parentale=("congedo_parentale","sum"),
+        permessi_vari=("permessi_vari","sum")).reset_index()
+    df_dep_nom = df_nominali[df_nominali["deposito"] == dep_ass].copy()
+    df_dep_full = df_dep_stat.merge(df_dep_nom[["giorno","ps","aspettativa","congedo_straord","non_in_forza"]], on="giorno", how="left").fillna(0)
+    fig_dep_ass = go.Figure()
+    for col, label, colore in palette_stat + palette_nom:
+        fig_dep_ass.add_trace(go.Bar(x=df_dep_full["giorno"], y=df_dep_full[col], name=label, marker_color=colore))
+    fig_dep_ass.update_layout(barmode="stack", height=420, hovermode="x unified",
+        title=f"Assenze — {dep_ass.title()}",
+        plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
+        legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1,font=dict(size=10)),
+        xaxis=dict(tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+        yaxis=dict(title="Persone",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
+    plotly_chart(fig_dep_ass, use_container_width=True, key="pc_11")
+
+
+with tab2, span("tab.analisi"):
+    if tab_aperto(tab2):
+        if len(df_filtered) == 0:
+            st.info("Nessun dato per i filtri selezionati.")
+        else:
+            st2_a, st2_b, st2_c = crea_tabs(["📉 Gap & Waterfall", "🏖️ Ferie & Riposi", "🤒 Assenze Complete"], key="tab_analisi")
+
+            with st2_a:
+                if tab_aperto(st2_a):
+                    # ── Periodo e giorni del waterfall (dalla copertura già filtrata) ──
+                    mesi_wf = mesi_periodo(df_copertura_filtered["giorno"]) if len(df_copertura_filtered) else []
+                    wf1, wf2 = st.columns([2, 1])
+                    with wf1:
+                        mese_wf = st.selectbox(
+                            "Periodo", options=[None] + mesi_wf,
+                            format_func=lambda m: "Intero periodo selezionato" if m is None else etichetta_mese(m),
+                            key="mese_waterfall",
+                        )
+                    with wf2:
+                        senza_domeniche = st.checkbox("Escludi domeniche", value=True, key="wf_senza_domeniche")
+                    etichetta_wf = "periodo selezionato" if mese_wf is None else etichetta_mese(mese_wf)
+                    giorni_wf = "lun–sab" if senza_domeniche else "tutti i giorni"
+
+                    st.markdown(
+                        f"#### <i class='fas fa-water'></i> Composizione Gap Medio Giornaliero — {etichetta_wf.capitalize()}",
+                        unsafe_allow_html=True
+                    )
 
-            # ── Valori fissi luglio ────────────────────────────────────────
-            AUTISTI_LUGLIO = 318
-            TURNI_LUGLIO   = 237
-
-            # ── Assenze statistiche: media per giorno lun-sab ─────────────
-            try:
-                df_ass_stat = pd.read_sql("""
-                    SELECT
-                        SUM(
-                            COALESCE(infortuni,0) + COALESCE(malattie,0) +
-                            COALESCE(legge_104,0) + COALESCE(altre_assenze,0) +
-                            COALESCE(congedo_parentale,0) + COALESCE(permessi_vari,0)
-                        ) AS totale_assenze,
-                        COUNT(DISTINCT daytype) AS n_tipi
-                    FROM assenze
-                    WHERE LOWER(daytype) NOT IN ('domenica')
-                """, get_conn())
-                assenze_stat_giorno = float(df_ass_stat["totale_assenze"].iloc[0]) / 6.0
-            except Exception as e:
-                st.warning(f"⚠️ Assenze statistiche non disponibili: {e}")
-                assenze_stat_giorno = 0.0
-
-            # ── Assenze roster luglio: media per giorno lun-sab ───────────
-            try:
-                df_ass_roster = pd.read_sql("""
-                    SELECT
-                        r.data,
-                        COUNT(*) FILTER (
-                            WHERE r.turno IN ('R','FP','AP','PADm','NF','FI')
-                        ) AS assenze_giorno
-                    FROM roster r
-                    WHERE
-                        EXTRACT(MONTH FROM r.data) = 7
-                        AND LOWER(TO_CHAR(r.data, 'Day')) NOT LIKE 'sund%'
-                        AND LOWER(TO_CHAR(r.data, 'Day')) NOT LIKE 'dome%'
-                        AND TRIM(LOWER(r.daytype)) NOT IN ('domenica')
-                    GROUP BY r.data
-                """, get_conn())
-                assenze_roster_giorno = float(df_ass_roster["assenze_giorno"].mean()) if len(df_ass_roster) > 0 else 0.0
-            except Exception as e:
-                st.warning(f"⚠️ Assenze roster luglio non disponibili: {e}")
-                assenze_roster_giorno = 0.0
-
-            assenze_totali_giorno = assenze_stat_giorno + assenze_roster_giorno
-            disponibili_medi      = AUTISTI_LUGLIO - assenze_totali_giorno
-            gap_medio_wf          = disponibili_medi - TURNI_LUGLIO
-
-            # ── Colori richiesti ──────────────────────────────────────────
-            colore_autisti = "#94a3b8"  # neutro
-            colore_assenze = "#ef4444"  # rosso
-            colore_turni   = "#3b82f6"  # blu
-            colore_gap     = "#22c55e" if gap_medio_wf >= 0 else "#ef4444"
-
-            fig_wf = go.Figure(go.Waterfall(
-                orientation="v",
-                measure=["absolute","relative","relative","relative","total"],
-                x=[
-                    "👥 Autisti luglio",
-                    "➖ Assenze storiche",
-                    "➖ Assenze roster",
-                    "➖ Turni richiesti",
-                    "= Gap / Buffer"
-                ],
-                y=[
-                    AUTISTI_LUGLIO,
-                    -assenze_stat_giorno,
-                    -assenze_roster_giorno,
-                    -TURNI_LUGLIO,
-                    0
-                ],
-                text=[
-                    f"<b>{AUTISTI_LUGLIO}</b>",
-                    f"<b>−{assenze_stat_giorno:.1f}</b>",
-                    f"<b>−{assenze_roster_giorno:.1f}</b>",
-                    f"<b>−{TURNI_LUGLIO}</b>",
-                    f"<b>{'+' if gap_medio_wf >= 0 else ''}{gap_medio_wf:.1f}</b>",
-                ],
-                textposition="outside",
-                textfont=dict(size=13, color="#e2e8f0"),
-                connector={"line": {"color": "rgba(96,165,250,0.4)", "width": 1.5, "dash": "dot"}},
-
-                # ✅ Autisti (absolute) usa "increasing" → lo mettiamo neutro
-                increasing={"marker": {"color": colore_autisti}},
-
-                # ✅ Tutte le barre negative diventano rosse (assenze + turni)
-                decreasing={"marker": {"color": colore_assenze}},
-
-                # ✅ Totale (gap) verde/rosso
-                totals={"marker": {"color": colore_gap}},
-            ))
+                    cop_wf = seleziona_giorni(df_copertura_filtered, mese_wf, senza_domeniche, calendario["categoria_giorno"]) \
+                        if len(df_copertura_filtered) else df_copertura_filtered
+                    comp = composizione_gap(cop_wf)
+                    if comp.giorni == 0:
+                        st.warning("⚠️ Nessun dato di copertura per il periodo scelto.")
+                    st.markdown(
+                        "<p style='color:#93c5fd;font-size:0.85rem;'>"
+                        f"Medie giornaliere su <b>{comp.giorni} giorni</b> ({giorni_wf}) · "
+                        f"<b>{cop_wf['deposito'].nunique() if comp.giorni else 0} depositi</b> · copertura roster</p>",
+                        unsafe_allow_html=True
+                    )
 
-            # --------------------------------------------------------------
-            # Override colore SOLO della barra "Turni richiesti" a blu
-            # (Plotly non supporta colori diversi per singola barra negativa
-            # con l'API standard del Waterfall, quindi facciamo override dopo)
-            # --------------------------------------------------------------
-            try:
-                trace = fig_wf.data[0]  # il Waterfall è un singolo trace
-                # In trace.x l'ordine è quello che hai definito sopra
-                turni_index = list(trace.x).index("➖ Turni richiesti")
-
-                # Se marker.color non esiste, la creiamo come lista
-                if getattr(trace, "marker", None) is None:
-                    trace.marker = {}
-
-                existing = getattr(trace.marker, "color", None)
-
-                if existing is None:
-                    # Se non c'è una lista colori, ne creiamo una coerente:
-                    # - autisti neutro
-                    # - assenze rosse
-                    # - turni blu
-                    # - totale gap (colore_gap)
-                    new_colors = [
-                        colore_autisti,
-                        colore_assenze,
-                        colore_assenze,
-                        colore_turni,
-                        colore_gap,
-                    ]
-                    trace.marker.color = new_colors
-                else:
-                    # Se esiste già, proviamo a modificarla (se è una lista/tuple)
-                    colors_list = list(existing)
-                    if len(colors_list) == len(trace.x):
-                        colors_list[turni_index] = colore_turni
-                        trace.marker.color = colors_list
-            except Exception:
-                # Se per qualche versione Plotly non permette l'override, il grafico resta comunque leggibile
-                pass
-
-            fig_wf.add_annotation(
-                x="➖ Assenze roster", y=disponibili_medi,
-                text=f"Disponibili netti: <b>{disponibili_medi:.1f}</b>",
-                showarrow=True, arrowhead=2, ax=80, ay=-30,
-                font=dict(size=12, color="#93c5fd"),
-                bgcolor="rgba(15,23,42,0.85)", bordercolor="rgba(59,130,246,0.6)", borderwidth=1, borderpad=6
-            )
+                    assenze_stat_giorno   = comp.assenze_statistiche
+                    assenze_roster_giorno = comp.assenze_roster
+                    disponibili_medi      = comp.disponibili
+                    gap_medio_wf          = comp.gap
+
+                    # ── Colori richiesti ──────────────────────────────────────────
+                    colore_autisti = "#94a3b8"  # neutro
+                    colore_assenze = "#ef4444"  # rosso
+                    colore_turni   = "#3b82f6"  # blu
+                    colore_gap     = "#22c55e" if gap_medio_wf >= 0 else "#ef4444"
+
+                    fig_wf = go.Figure(go.Waterfall(
+                        orientation="v",
+                        measure=["absolute","relative","relative","relative","total"],
+                        x=[
+                            "👥 Autisti",
+                            "➖ Assenze storiche",
+                            "➖ Assenze roster",
+                            "➖ Turni richiesti",
+                            "= Gap / Buffer"
+                        ],
+                        y=[
+                            comp.autisti,
+                            -assenze_stat_giorno,
+                            -assenze_roster_giorno,
+                            -comp.turni,
+                            0
+                        ],
+                        text=[
+                            f"<b>{comp.autisti:.1f}</b>",
+                            f"<b>−{assenze_stat_giorno:.1f}</b>",
+                            f"<b>−{assenze_roster_giorno:.1f}</b>",
+                            f"<b>−{comp.turni:.1f}</b>",
+                            f"<b>{'+' if gap_medio_wf >= 0 else ''}{gap_medio_wf:.1f}</b>",
+                        ],
+                        textposition="outside",
+                        textfont=dict(size=13, color="#e2e8f0"),
+                        connector={"line": {"color": "rgba(96,165,250,0.4)", "width": 1.5, "dash": "dot"}},
+
+                        # ✅ Autisti (absolute) usa "increasing" → lo mettiamo neutro
+                        increasing={"marker": {"color": colore_autisti}},
+
+                        # ✅ Tutte le barre negative diventano rosse (assenze + turni)
+                        decreasing={"marker": {"color": colore_assenze}},
+
+                        # ✅ Totale (gap) verde/rosso
+                        totals={"marker": {"color": colore_gap}},
+                    ))
+
+                    # --------------------------------------------------------------
+                    # Override colore SOLO della barra "Turni richiesti" a blu
+                    # (Plotly non supporta colori diversi per singola barra negativa
+                    # con l'API standard del Waterfall, quindi facciamo override dopo)
+                    # --------------------------------------------------------------
+                    try:
+                        trace = fig_wf.data[0]  # il Waterfall è un singolo trace
+                        # In trace.x l'ordine è quello che hai definito sopra
+                        turni_index = list(trace.x).index("➖ Turni richiesti")
+
+                        # Se marker.color non esiste, la creiamo come lista
+                        if getattr(trace, "marker", None) is None:
+                            trace.marker = {}
+
+                        existing = getattr(trace.marker, "color", None)
+
+                        if existing is None:
+                            # Se non c'è una lista colori, ne creiamo una coerente:
+                            # - autisti neutro
+                            # - assenze rosse
+                            # - turni blu
+                            # - totale gap (colore_gap)
+                            new_colors = [
+                                colore_autisti,
+                                colore_assenze,
+                                colore_assenze,
+                                colore_turni,
+                                colore_gap,
+                            ]
+                            trace.marker.color = new_colors
+                        else:
+                            # Se esiste già, proviamo a modificarla (se è una lista/tuple)
+                            colors_list = list(existing)
+                            if len(colors_list) == len(trace.x):
+                                colors_list[turni_index] = colore_turni
+                                trace.marker.color = colors_list
+                    except Exception:
+                        # Se per qualche versione Plotly non permette l'override, il grafico resta comunque leggibile
+                        pass
+
+                    fig_wf.add_annotation(
+                        x="➖ Assenze roster", y=disponibili_medi,
+                        text=f"Disponibili netti: <b>{disponibili_medi:.1f}</b>",
+                        showarrow=True, arrowhead=2, ax=80, ay=-30,
+                        font=dict(size=12, color="#93c5fd"),
+                        bgcolor="rgba(15,23,42,0.85)", bordercolor="rgba(59,130,246,0.6)", borderwidth=1, borderpad=6
+                    )
 
-            # ✅ Se gap è negativo, resta sotto lo 0 (questa linea lo rende evidente)
-            fig_wf.add_hline(y=0, line_dash="dash", line_color="rgba(255,255,255,0.3)", line_width=1)
+                    # ✅ Se gap è negativo, resta sotto lo 0 (questa linea lo rende evidente)
+                    fig_wf.add_hline(y=0, line_dash="dash", line_color="rgba(255,255,255,0.3)", line_width=1)
 
-            annotation_color = "#22c55e" if gap_medio_wf >= 0 else "#ef4444"
-            annotation_text  = f"✅ Buffer: +{gap_medio_wf:.1f}" if gap_medio_wf >= 0 else f"🚨 Deficit: {gap_medio_wf:.1f}"
-            fig_wf.add_annotation(
-                x="= Gap / Buffer", y=gap_medio_wf + (10 if gap_medio_wf >= 0 else -10),
-                text=annotation_text, showarrow=False,
-                font=dict(size=13, color=annotation_color),
-                bgcolor="rgba(15,23,42,0.85)", bordercolor=annotation_color, borderwidth=1, borderpad=6
-            )
+                    annotation_color = "#22c55e" if gap_medio_wf >= 0 else "#ef4444"
+                    annotation_text  = f"✅ Buffer: +{gap_medio_wf:.1f}" if gap_medio_wf >= 0 else f"🚨 Deficit: {gap_medio_wf:.1f}"
+                    fig_wf.add_annotation(
+                        x="= Gap / Buffer", y=gap_medio_wf + (10 if gap_medio_wf >= 0 else -10),
+                        text=annotation_text, showarrow=False,
+                        font=dict(size=13, color=annotation_color),
+                        bgcolor="rgba(15,23,42,0.85)", bordercolor=annotation_color, borderwidth=1, borderpad=6
+                    )
 
-            fig_wf.update_layout(
-                height=500,
-                showlegend=False,
-                plot_bgcolor="rgba(15,23,42,0.8)",
-                paper_bgcolor="rgba(15,23,42,0.5)",
-                font=dict(color="#cbd5e1"),
-                margin=dict(t=30, b=60, l=20, r=20),
-                xaxis=dict(gridcolor="rgba(96,165,250,0.08)", linecolor="rgba(96,165,250,0.2)", tickfont=dict(size=12)),
-                yaxis=dict(title="Persone (media/giorno)", gridcolor="rgba(96,165,250,0.1)", linecolor="rgba(96,165,250,0.2)"),
-            )
-            st.plotly_chart(fig_wf, use_container_width=True, key="pc_5")
-
-            wk1, wk2, wk3, wk4, wk5 = st.columns(5)
-            with wk1: st.metric("👥 Autisti luglio",         f"{AUTISTI_LUGLIO}")
-            with wk2: st.metric("🚌 Turni/giorno",           f"{TURNI_LUGLIO}")
-            with wk3: st.metric("📊 Ass. storiche/giorno",   f"{assenze_stat_giorno:.1f}",   delta="lun–sab", delta_color="off")
-            with wk4: st.metric("📋 Ass. roster/giorno",     f"{assenze_roster_giorno:.1f}", delta="lun–sab luglio", delta_color="off")
-            with wk5:
-                st.metric(
-                    "⚖️ Gap medio/giorno",
-                    f"{gap_medio_wf:+.1f}",
-                    delta="✅ buffer" if gap_medio_wf >= 0 else "🚨 deficit",
-                    delta_color="normal" if gap_medio_wf >= 0 else "inverse"
-                )
+                    fig_wf.update_layout(
+                        height=500,
+                        showlegend=False,
+                        plot_bgcolor="rgba(15,23,42,0.8)",
+                        paper_bgcolor="rgba(15,23,42,0.5)",
+                        font=dict(color="#cbd5e1"),
+                        margin=dict(t=30, b=60, l=20, r=20),
+                        xaxis=dict(gridcolor="rgba(96,165,250,0.08)", linecolor="rgba(96,165,250,0.2)", tickfont=dict(size=12)),
+                        yaxis=dict(title="Persone (media/giorno)", gridcolor="rgba(96,165,250,0.1)", linecolor="rgba(96,165,250,0.2)"),
+                    )
+                    plotly_chart(fig_wf, use_container_width=True, key="pc_5")
+
+                    wk1, wk2, wk3, wk4, wk5 = st.columns(5)
+                    with wk1: st.metric("👥 Autisti/giorno",         f"{comp.autisti:.1f}")
+                    with wk2: st.metric("🚌 Turni/giorno",           f"{comp.turni:.1f}")
+                    with wk3: st.metric("📊 Ass. storiche/giorno",   f"{assenze_stat_giorno:.1f}",   delta=giorni_wf, delta_color="off")
+                    with wk4: st.metric("📋 Ass. roster/giorno",     f"{assenze_roster_giorno:.1f}", delta=f"{giorni_wf} · {etichetta_wf}", delta_color="off")
+                    with wk5:
+                        st.metric(
+                            "⚖️ Gap medio/giorno",
+                            f"{gap_medio_wf:+.1f}",
+                            delta="✅ buffer" if gap_medio_wf >= 0 else "🚨 deficit",
+                            delta_color="normal" if gap_medio_wf >= 0 else "inverse"
+                        )
 
-            st.markdown("---")
-            st.markdown("#### <i class='fas fa-chart-line'></i> Trend Assenze per Tipologia", unsafe_allow_html=True)
-            trend_df = df_filtered.groupby("giorno").agg(
-                infortuni=("infortuni","sum"), malattie=("malattie","sum"),
-                legge_104=("legge_104","sum"), congedo_parentale=("congedo_parentale","sum"),
-                permessi_vari=("permessi_vari","sum")).reset_index()
-            fig_trend = go.Figure()
-            for col, label, colore in [("infortuni","Infortuni","#ef4444"),("malattie","Malattie","#f97316"),
-                ("legge_104","L.104","#eab308"),("congedo_parentale","Congedo parent.","#06b6d4"),("permessi_vari","Permessi vari","#22c55e")]:
-                fig_trend.add_trace(go.Scatter(x=trend_df["giorno"], y=trend_df[col], mode="lines+markers",
-                    name=label, line=dict(color=colore, width=2), marker=dict(size=5),
-                    hovertemplate=f"<b>{label}</b><br>%{{x|%d/%m/%Y}}: <b>%{{y:.1f}}</b><extra></extra>"))
-            fig_trend.update_layout(height=400, hovermode="x unified", legend=dict(orientation="h", y=-0.18), **PLOTLY_TEMPLATE)
-            st.plotly_chart(fig_trend, use_container_width=True, key="pc_7")
-
-        with st2_b:
-            try:
-                d0 = df_filtered["giorno"].min().date()
-                d1 = df_filtered["giorno"].max().date()
-                deps_str = ",".join([f"'{d}'" for d in deposito_sel])
-                df_fp_r = pd.read_sql(f"""
-                    SELECT data AS giorno, deposito,
-                        COUNT(*) FILTER (WHERE turno = 'FP') AS ferie_programmate,
-                        COUNT(*) FILTER (WHERE turno = 'R')  AS riposi
-                    FROM roster WHERE data BETWEEN '{d0}' AND '{d1}' AND deposito IN ({deps_str})
-                    GROUP BY data, deposito ORDER BY data, deposito;
-                """, get_conn())
-                df_fp_r["giorno"] = pd.to_datetime(df_fp_r["giorno"])
-                fp_r_daily = df_fp_r.groupby("giorno")[["ferie_programmate","riposi"]].sum().reset_index()
-
-                k1,k2,k3,k4 = st.columns(4)
-                with k1: st.metric("🏖️ Tot. Ferie Programmate", f"{int(fp_r_daily['ferie_programmate'].sum()):,}")
-                with k2: st.metric("💤 Tot. Riposi", f"{int(fp_r_daily['riposi'].sum()):,}")
-                with k3: st.metric("📅 Media FP/giorno", f"{fp_r_daily['ferie_programmate'].mean():.1f}")
-                with k4: st.metric("📅 Media Riposi/giorno", f"{fp_r_daily['riposi'].mean():.1f}")
-
-                view_fp_r = st.radio("Visualizza", ["Per tipo (FP vs R)","Per deposito"], horizontal=True, key="view_fp_r")
-                if view_fp_r == "Per tipo (FP vs R)":
-                    fig_fpr = go.Figure()
-                    fig_fpr.add_trace(go.Bar(x=fp_r_daily["giorno"], y=fp_r_daily["ferie_programmate"], name="FP", marker_color="#22c55e"))
-                    fig_fpr.add_trace(go.Bar(x=fp_r_daily["giorno"], y=fp_r_daily["riposi"], name="Riposi (R)", marker_color="#3b82f6"))
-                    fig_fpr.update_layout(barmode="stack", height=450, hovermode="x unified",
-                        plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
-                        legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1),
-                        xaxis=dict(tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                        yaxis=dict(title="Persone",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
-                    st.plotly_chart(fig_fpr, use_container_width=True, key="pc_8")
-                else:
-                    tipo_dep = st.radio("Tipo", ["FP","R"], horizontal=True, key="tipo_dep_fpr")
-                    col_sel  = "ferie_programmate" if tipo_dep == "FP" else "riposi"
-                    fig_fpr_dep = go.Figure()
-                    for dep in sorted(df_fp_r["deposito"].unique()):
-                        df_d = df_fp_r[df_fp_r["deposito"] == dep]
-                        fig_fpr_dep.add_trace(go.Bar(x=df_d["giorno"], y=df_d[col_sel], name=dep.title(), marker_color=get_colore_deposito(dep)))
-                    fig_fpr_dep.update_layout(barmode="stack", height=450, hovermode="x unified",
-                        plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
-                        legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1),
-                        xaxis=dict(tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                        yaxis=dict(title="Persone",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
-                    st.plotly_chart(fig_fpr_dep, use_container_width=True, key="pc_9")
-            except Exception as e:
-                st.warning(f"⚠️ Errore ferie/riposi: {e}")
-
-        with st2_c:
-            try:
-                d0 = df_filtered["giorno"].min().date()
-                d1 = df_filtered["giorno"].max().date()
-                deps_str = ",".join([f"'{d}'" for d in deposito_sel])
-                df_nominali = pd.read_sql(f"""
-                    SELECT data AS giorno, deposito,
-                        COUNT(*) FILTER (WHERE turno = 'PS')   AS ps,
-                        COUNT(*) FILTER (WHERE turno = 'AP')   AS aspettativa,
-                        COUNT(*) FILTER (WHERE turno = 'PADm') AS congedo_straord,
-                        COUNT(*) FILTER (WHERE turno = 'NF')   AS non_in_forza
-                    FROM roster WHERE data BETWEEN '{d0}' AND '{d1}' AND deposito IN ({deps_str})
-                    GROUP BY data, deposito ORDER BY data, deposito;
-                """, get_conn())
-                df_nominali["giorno"] = pd.to_datetime(df_nominali["giorno"])
-                nom_daily = df_nominali.groupby("giorno")[["ps","aspettativa","congedo_straord","non_in_forza"]].sum().reset_index()
-                stat_daily = df_filtered.groupby("giorno").agg(
-                    infortuni=("infortuni","sum"), malattie=("malattie","sum"), legge_104=("legge_104","sum"),
-                    altre_assenze=("altre_assenze","sum"), congedo_parentale=("congedo_parentale","sum"),
-                    permessi_vari=("permessi_vari","sum")).reset_index()
-                df_assenze_full = stat_daily.merge(nom_daily, on="giorno", how="left").fillna(0)
-
-                k1,k2,k3,k4,k5,k6 = st.columns(6)
-                with k1: st.metric("🤕 Infortuni",    f"{int(df_assenze_full['infortuni'].sum()):,}")
-                with k2: st.metric("🤒 Malattie",      f"{int(df_assenze_full['malattie'].sum()):,}")
-                with k3: st.metric("♿ L.104",          f"{int(df_assenze_full['legge_104'].sum()):,}")
-                with k4: st.metric("📋 PS",            f"{int(df_assenze_full['ps'].sum()):,}")
-                with k5: st.metric("⏸️ Aspettativa",  f"{int(df_assenze_full['aspettativa'].sum()):,}")
-                with k6: st.metric("🔴 Non in forza", f"{int(df_assenze_full['non_in_forza'].sum()):,}")
-
-                palette_stat = [("infortuni","Infortuni","#ef4444"),("malattie","Malattie","#f97316"),
-                    ("legge_104","L.104","#eab308"),("altre_assenze","Altre assenze","#a78bfa"),
-                    ("congedo_parentale","Congedo parentale","#06b6d4"),("permessi_vari","Permessi vari","#22c55e")]
-                palette_nom = [("ps","PS","#f43f5e"),("aspettativa","AP (Aspettativa)","#8b5cf6"),
-                    ("congedo_straord","PADm (Cong. straord.)","#0ea5e9"),("non_in_forza","NF (Non in forza)","#64748b")]
-
-                fig_ass = go.Figure()
-                for col, label, colore in palette_stat:
-                    fig_ass.add_trace(go.Bar(x=df_assenze_full["giorno"], y=df_assenze_full[col], name=label, marker_color=colore))
-                for col, label, colore in palette_nom:
-                    fig_ass.add_trace(go.Bar(x=df_assenze_full["giorno"], y=df_assenze_full[col], name=label, marker_color=colore,
-                        marker_line=dict(width=1, color="rgba(255,255,255,0.4)")))
-                fig_ass.update_layout(barmode="stack", height=520, hovermode="x unified",
-                    plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)",
-                    font=dict(color="#cbd5e1", family="Arial, sans-serif"),
-                    legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1,font=dict(size=10)),
-                    xaxis=dict(title="Data",tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                    yaxis=dict(title="Persone assenti",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
-                st.plotly_chart(fig_ass, use_container_width=True, key="pc_10")
-
-                with st.expander("🔍 Dettaglio singolo deposito"):
-                    dep_ass = st.selectbox("Deposito", sorted(deposito_sel), key="dep_ass_detail", format_func=lambda x: x.title())
-                    df_dep_stat = df_filtered[df_filtered["deposito"] == dep_ass].groupby("giorno").agg(
-                        infortuni=("infortuni","sum"), malattie=("malattie","sum"), legge_104=("legge_104","sum"),
-                        altre_assenze=("altre_assenze","sum"), congedo_parentale=("congedo_parentale","sum"),
+                    st.markdown("---")
+                    st.markdown("#### <i class='fas fa-chart-line'></i> Trend Assenze per Tipologia", unsafe_allow_html=True)
+                    trend_df = df_filtered.groupby("giorno").agg(
+                        infortuni=("infortuni","sum"), malattie=("malattie","sum"),
+                        legge_104=("legge_104","sum"), congedo_parentale=("congedo_parentale","sum"),
                         permessi_vari=("permessi_vari","sum")).reset_index()
-                    df_dep_nom = df_nominali[df_nominali["deposito"] == dep_ass].copy()
-                    df_dep_full = df_dep_stat.merge(df_dep_nom[["giorno","ps","aspettativa","congedo_straord","non_in_forza"]], on="giorno", how="left").fillna(0)
-                    fig_dep_ass = go.Figure()
-                    for col, label, colore in palette_stat + palette_nom:
-                        fig_dep_ass.add_trace(go.Bar(x=df_dep_full["giorno"], y=df_dep_full[col], name=label, marker_color=colore))
-                    fig_dep_ass.update_layout(barmode="stack", height=420, hovermode="x unified",
-                        title=f"Assenze — {dep_ass.title()}",
-                        plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
-                        legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1,font=dict(size=10)),
-                        xaxis=dict(tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                        yaxis=dict(title="Persone",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
-                    st.plotly_chart(fig_dep_ass, use_container_width=True, key="pc_11")
-            except Exception as e:
-                st.warning(f"⚠️ Errore assenze: {e}")
+                    fig_trend = go.Figure()
+                    for col, label, colore in [("infortuni","Infortuni","#ef4444"),("malattie","Malattie","#f97316"),
+                        ("legge_104","L.104","#eab308"),("congedo_parentale","Congedo parent.","#06b6d4"),("permessi_vari","Permessi vari","#22c55e")]:
+                        fig_trend.add_trace(serie(trend_df["giorno"], trend_df[col], mode="lines+markers",
+                            name=label, line=dict(color=colore, width=2), marker=dict(size=5),
+                            hovertemplate=f"<b>{label}</b><br>%{{x|%d/%m/%Y}}: <b>%{{y:.1f}}</b><extra></extra>"))
+                    fig_trend.update_layout(height=400, hovermode="x unified", legend=dict(orientation="h", y=-0.18), **PLOTLY_TEMPLATE)
+                    plotly_chart(fig_trend, use_container_width=True, key="pc_7")
+
+            with st2_b:
+                if tab_aperto(st2_b):
+                    try:
+                        d0 = df_filtered["giorno"].min().date()
+                        d1 = df_filtered["giorno"].max().date()
+                        with span("loader.ferie_riposi") as rec:
+                            df_fp_r = load_ferie_riposi(crea_filtro(deposito_sel, d0, d1))
+                            misura(rec, df_fp_r)
+                        df_fp_r["giorno"] = pd.to_datetime(df_fp_r["giorno"])
+                        fp_r_daily = df_fp_r.groupby("giorno")[["ferie_programmate","riposi"]].sum().reset_index()
+
+                        k1,k2,k3,k4 = st.columns(4)
+                        with k1: st.metric("🏖️ Tot. Ferie Programmate", f"{int(fp_r_daily['ferie_programmate'].sum()):,}")
+                        with k2: st.metric("💤 Tot. Riposi", f"{int(fp_r_daily['riposi'].sum()):,}")
+                        with k3: st.metric("📅 Media FP/giorno", f"{fp_r_daily['ferie_programmate'].mean():.1f}")
+                        with k4: st.metric("📅 Media Riposi/giorno", f"{fp_r_daily['riposi'].mean():.1f}")
+
+                        grafico_ferie_riposi(df_fp_r, fp_r_daily)
+                    except Exception as e:
+                        st.warning(f"⚠️ Errore ferie/riposi: {e}")
+
+            with st2_c:
+                if tab_aperto(st2_c):
+                    try:
+                        d0 = df_filtered["giorno"].min().date()
+                        d1 = df_filtered["giorno"].max().date()
+                        with span("loader.assenze_nominali") as rec:
+                            df_nominali = load_assenze_nominali(crea_filtro(deposito_sel, d0, d1))
+                            misura(rec, df_nominali)
+                        df_nominali["giorno"] = pd.to_datetime(df_nominali["giorno"])
+                        nom_daily = df_nominali.groupby("giorno")[["ps","aspettativa","congedo_straord","non_in_forza"]].sum().reset_index()
+                        stat_daily = df_filtered.groupby("giorno").agg(
+                            infortuni=("infortuni","sum"), malattie=("malattie","sum"), legge_104=("legge_104","sum"),
+                            altre_assenze=("altre_assenze","sum"), congedo_parentale=("congedo_parentale","sum"),
+                            permessi_vari=("permessi_vari","sum")).reset_index()
+                        df_assenze_full = stat_daily.merge(nom_daily, on="giorno", how="left").fillna(0)
+
+                        k1,k2,k3,k4,k5,k6 = st.columns(6)
+                        with k1: st.metric("🤕 Infortuni",    f"{int(df_assenze_full['infortuni'].sum()):,}")
+                        with k2: st.metric("🤒 Malattie",      f"{int(df_assenze_full['malattie'].sum()):,}")
+                        with k3: st.metric("♿ L.104",          f"{int(df_assenze_full['legge_104'].sum()):,}")
+                        with k4: st.metric("📋 PS",            f"{int(df_assenze_full['ps'].sum()):,}")
+                        with k5: st.metric("⏸️ Aspettativa",  f"{int(df_assenze_full['aspettativa'].sum()):,}")
+                        with k6: st.metric("🔴 Non in forza", f"{int(df_assenze_full['non_in_forza'].sum()):,}")
+
+                        palette_stat = [("infortuni","Infortuni","#ef4444"),("malattie","Malattie","#f97316"),
+                            ("legge_104","L.104","#eab308"),("altre_assenze","Altre assenze","#a78bfa"),
+                            ("congedo_parentale","Congedo parentale","#06b6d4"),("permessi_vari","Permessi vari","#22c55e")]
+                        palette_nom = [("ps","PS","#f43f5e"),("aspettativa","AP (Aspettativa)","#8b5cf6"),
+                            ("congedo_straord","PADm (Cong. straord.)","#0ea5e9"),("non_in_forza","NF (Non in forza)","#64748b")]
+
+                        fig_ass = go.Figure()
+                        for col, label, colore in palette_stat:
+                            fig_ass.add_trace(go.Bar(x=df_assenze_full["giorno"], y=df_assenze_full[col], name=label, marker_color=colore))
+                        for col, label, colore in palette_nom:
+                            fig_ass.add_trace(go.Bar(x=df_assenze_full["giorno"], y=df_assenze_full[col], name=label, marker_color=colore,
+                                marker_line=dict(width=1, color="rgba(255,255,255,0.4)")))
+                        fig_ass.update_layout(barmode="stack", height=520, hovermode="x unified",
+                            plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)",
+                            font=dict(color="#cbd5e1", family="Arial, sans-serif"),
+                            legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1,font=dict(size=10)),
+                            xaxis=dict(title="Data",tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+                            yaxis=dict(title="Persone assenti",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
+                        plotly_chart(fig_ass, use_container_width=True, key="pc_10")
+
+                        with st.expander("🔍 Dettaglio singolo deposito"):
+                            dettaglio_assenze_deposito(df_filtered, df_nominali, deposito_sel, palette_stat, palette_nom)
+                    except Exception as e:
+                        st.warning(f"⚠️ Errore assenze: {e}")
 
 
 # ══════════════════════════════════════════════════
 # TAB 3 — TURNI CALENDARIO
 # ══════════════════════════════════════════════════
-with tab3:
-    st.markdown("### <i class='fas fa-calendar-check'></i> Turni per Deposito — Validità Temporale", unsafe_allow_html=True)
+@st.cache_data(max_entries=4, show_spinner=False)
+def griglia_codici(versione: str, _df_codici: pd.DataFrame) -> str:
+    colori = {d: get_colore_deposito(d) for d in _df_codici["deposito"].unique()}
+    return html_griglia_codici(_df_codici, colori)
 
-    if not turni_cal_ok or len(df_tc_filtered) == 0:
-        st.warning("Nessun record trovato per il periodo selezionato.")
-        st.info("**Debug rapido**: controlla che i valori di `valid` nella tabella `turni` (`Lu-Ve`, `Sa`, `Do`) coincidano esattamente con i valori di `daytype` in `calendar`, e che le date `dal`/`al` rientrino nel periodo selezionato.")
-    else:
-        tc_col1, tc_col2, tc_col3 = st.columns([1,1,2])
-        with tc_col1:
-            bar_mode = st.radio("Modalità barre", ["Impilate","Affiancate"], horizontal=True)
-            bmode    = "stack" if bar_mode == "Impilate" else "group"
-        with tc_col2:
-            show_totale = st.checkbox("Mostra linea totale", value=True)
-        with tc_col3:
-            dep_tc = st.multiselect("Depositi visibili nel grafico",
-                options=sorted(df_tc_filtered["deposito"].unique()),
-                default=sorted(df_tc_filtered["deposito"].unique()), key="dep_tc_filter")
-
-        df_tc_plot = df_tc_filtered[df_tc_filtered["deposito"].isin(dep_tc)].copy()
-
-        if len(df_tc_plot) > 0:
-            df_tc_agg = df_tc_plot.groupby(["giorno","deposito"])["turni"].sum().reset_index().sort_values(["giorno","deposito"])
-            fig_tc = go.Figure()
-            for dep in sorted(df_tc_agg["deposito"].unique()):
-                df_dep = df_tc_agg[df_tc_agg["deposito"] == dep]
-                fig_tc.add_trace(go.Bar(x=df_dep["giorno"], y=df_dep["turni"], name=dep.title(),
-                    marker_color=get_colore_deposito(dep),
-                    hovertemplate=f"<b>{dep.title()}</b><br>Data: %{{x|%d/%m/%Y}}<br>Turni: <b>%{{y}}</b><extra></extra>"))
-            if show_totale:
-                totale_gg = df_tc_agg.groupby("giorno")["turni"].sum().reset_index()
-                fig_tc.add_trace(go.Scatter(x=totale_gg["giorno"], y=totale_gg["turni"], name="Totale",
-                    mode="lines+markers", line=dict(color="#ffffff", width=2.5, dash="dot"),
-                    marker=dict(size=7, symbol="diamond")))
-            fig_tc.update_layout(barmode=bmode, height=550, hovermode="x unified",
-                plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)",
-                font=dict(color="#cbd5e1"), legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1),
-                xaxis=dict(title="Data",tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                yaxis=dict(title="Turni Richiesti",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
-            st.plotly_chart(fig_tc, use_container_width=True, key="pc_13")
 
-            st.markdown("---")
-            st.markdown("#### <i class='fas fa-search'></i> Esplora Codici Turno per Deposito", unsafe_allow_html=True)
-            try:
-                df_codici = pd.read_sql("SELECT deposito, codice_turno, valid, dal, al FROM turni ORDER BY deposito, valid, codice_turno;", get_conn())
-                df_codici["dal"] = pd.to_datetime(df_codici["dal"]).dt.strftime("%d/%m/%Y")
-                df_codici["al"]  = pd.to_datetime(df_codici["al"]).dt.strftime("%d/%m/%Y")
-                dep_esplora = st.selectbox("📍 Seleziona deposito", options=sorted(df_codici["deposito"].unique()), format_func=lambda x: x.title(), key="dep_esplora")
-                tipi_disponibili = sorted(df_codici[df_codici["deposito"] == dep_esplora]["valid"].unique())
-                tipo_sel = st.radio("Tipo giorno", options=["Tutti"]+tipi_disponibili, horizontal=True, key="tipo_esplora")
-                df_dep_codici = df_codici[df_codici["deposito"] == dep_esplora].copy()
-                if tipo_sel != "Tutti":
-                    df_dep_codici = df_dep_codici[df_dep_codici["valid"] == tipo_sel]
-                k1,k2,k3 = st.columns(3)
-                with k1: st.metric("🔢 Codici turno", len(df_dep_codici))
-                with k2: st.metric("📋 Tipi giorno", df_dep_codici["valid"].nunique())
-                with k3:
-                    periodo = f"{df_dep_codici['dal'].iloc[0]} → {df_dep_codici['al'].iloc[0]}" if len(df_dep_codici) > 0 else "—"
-                    st.metric("📅 Validità", periodo)
-                if len(df_dep_codici) > 0:
-                    colore_dep = get_colore_deposito(dep_esplora)
-                    for tipo in sorted(df_dep_codici["valid"].unique()):
-                        df_tipo = df_dep_codici[df_dep_codici["valid"] == tipo]
-                        label_tipo = {"Lu-Ve":"📅 Lunedì — Venerdì","Sa":"📅 Sabato","Do":"📅 Domenica"}.get(tipo, tipo)
-                        st.markdown(f"<p style='color:#93c5fd;font-weight:700;font-size:1rem;margin:16px 0 8px;'>{label_tipo} <span style='color:#64748b;font-size:0.8rem;font-weight:400;'>({len(df_tipo)} turni · {df_tipo['dal'].iloc[0]} → {df_tipo['al'].iloc[0]})</span></p>", unsafe_allow_html=True)
-                        codici = df_tipo["codice_turno"].tolist()
-                        for i in range(0, len(codici), 8):
-                            cols = st.columns(8)
-                            for j, codice in enumerate(codici[i:i+8]):
-                                with cols[j]:
-                                    st.markdown(f"<div style='background:rgba(15,23,42,0.8);border:1px solid {colore_dep}55;border-left:3px solid {colore_dep};border-radius:8px;padding:8px 6px;text-align:center;font-size:0.85rem;font-weight:700;color:#e2e8f0;margin-bottom:6px;'>{codice}</div>", unsafe_allow_html=True)
-            except Exception as e:
-                st.warning(f"⚠️ Impossibile caricare i codici turno: {e}")
+def esplora_codici_turno() -> None:
+    """
+    Esploratore codici turno: un solo componente HTML con il catalogo in
+    cache; deposito, tipo giorno e prefisso si filtrano nel browser.
+    """
+    try:
+        with span("loader.catalogo_turni") as rec:
+            df_codici = load_catalogo_turni()
+            misura(rec, df_codici)
+        if len(df_codici) == 0:
+            st.info("Nessun codice turno in archivio.")
+            return
+        components.html(griglia_codici(_versione(df_codici), df_codici), height=ALTEZZA_GRIGLIA)
+    except Exception as e:
+        st.warning(f"⚠️ Impossibile caricare i codici turno: {e}")
+
+
+@fragment_tracciato
+def sezione_turni_calendario(df_tc_filtered: pd.DataFrame, calendario: pd.DataFrame) -> None:
+    """Grafici turni del tab 3: i widget della sezione la rieseguono da sola, non tutto lo script."""
+    tc_col1, tc_col2, tc_col3 = st.columns([1,1,2])
+    with tc_col1:
+        bar_mode = st.radio("Modalità barre", ["Impilate","Affiancate"], horizontal=True)
+        bmode    = "stack" if bar_mode == "Impilate" else "group"
+    with tc_col2:
+        show_totale = st.checkbox("Mostra linea totale", value=True)
+    with tc_col3:
+        dep_tc = st.multiselect("Depositi visibili nel grafico",
+            options=sorted(df_tc_filtered["deposito"].unique()),
+            default=sorted(df_tc_filtered["deposito"].unique()), key="dep_tc_filter")
+
+    df_tc_plot = df_tc_filtered[df_tc_filtered["deposito"].isin(dep_tc)].copy()
+
+    if len(df_tc_plot) > 0:
+        df_tc_agg = df_tc_plot.groupby(["giorno","deposito"], observed=True)["turni"].sum().reset_index().sort_values(["giorno","deposito"])
+        fig_tc = go.Figure()
+        for dep in sorted(df_tc_agg["deposito"].unique()):
+            df_dep = df_tc_agg[df_tc_agg["deposito"] == dep]
+            fig_tc.add_trace(go.Bar(x=df_dep["giorno"], y=df_dep["turni"], name=dep.title(),
+                marker_color=get_colore_deposito(dep),
+                hovertemplate=f"<b>{dep.title()}</b><br>Data: %{{x|%d/%m/%Y}}<br>Turni: <b>%{{y}}</b><extra></extra>"))
+        if show_totale:
+            totale_gg = df_tc_agg.groupby("giorno")["turni"].sum().reset_index()
+            fig_tc.add_trace(serie(totale_gg["giorno"], totale_gg["turni"], name="Totale",
+                mode="lines+markers", line=dict(color="#ffffff", width=2.5, dash="dot"),
+                marker=dict(size=7, symbol="diamond")))
+        fig_tc.update_layout(barmode=bmode, height=550, hovermode="x unified",
+            plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)",
+            font=dict(color="#cbd5e1"), legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1),
+            xaxis=dict(title="Data",tickformat="%d/%m",tickangle=-45,gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+            yaxis=dict(title="Turni Richiesti",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"))
+        plotly_chart(fig_tc, use_container_width=True, key="pc_13")
 
-            st.markdown("---")
-            st.markdown("#### <i class='fas fa-chart-pie'></i> Distribuzione Turni per Deposito", unsafe_allow_html=True)
-            totale_per_dep = df_tc_agg.groupby("deposito")["turni"].sum().reset_index()
-            fig_pie_tc = go.Figure(go.Pie(
-                labels=[d.title() for d in totale_per_dep["deposito"]], values=totale_per_dep["turni"],
-                marker=dict(colors=[get_colore_deposito(d) for d in totale_per_dep["deposito"]]),
-                hole=0.4, textinfo="label+percent+value"))
-            fig_pie_tc.update_layout(height=450, showlegend=True, paper_bgcolor="rgba(15,23,42,0.5)",
-                legend=dict(font=dict(color="#cbd5e1")), margin=dict(l=20,r=20,t=20,b=20))
-            st.plotly_chart(fig_pie_tc, use_container_width=True, key="pc_14")
+        st.markdown("---")
+        st.markdown("#### <i class='fas fa-search'></i> Esplora Codici Turno per Deposito", unsafe_allow_html=True)
+        esplora_codici_turno()
 
-            st.markdown("---")
-            st.markdown("#### <i class='fas fa-calendar-week'></i> Turni per Giorno — Lu-Ve / Sabato / Domenica", unsafe_allow_html=True)
-            try:
-                date_list = df_tc_plot["giorno"].dt.date.unique().tolist()
-                date_str  = ",".join([f"'{d}'" for d in date_list])
-                df_cal_mini = pd.read_sql(f"SELECT data, daytype FROM calendar WHERE data IN ({date_str});", get_conn())
-                df_cal_mini["data"] = pd.to_datetime(df_cal_mini["data"])
-                df_tc_daytype = df_tc_plot.merge(df_cal_mini, left_on="giorno", right_on="data", how="left")
-
-                def daytype_to_categoria(dt):
-                    dt = (dt or "").strip().lower()
-                    if dt in ["lunedi","martedi","mercoledi","giovedi","venerdi"]: return "Lu-Ve"
-                    elif dt == "sabato": return "Sabato"
-                    elif dt == "domenica": return "Domenica"
-                    return dt.title()
-
-                df_tc_daytype["categoria"] = df_tc_daytype["daytype"].apply(daytype_to_categoria)
-                cat_order = ["Lu-Ve","Sabato","Domenica"]
-                primo_giorno_per_cat = df_tc_daytype.groupby("categoria")["giorno"].min().to_dict()
-                agg_daytype_list = []
-                for cat, primo_gg in primo_giorno_per_cat.items():
-                    df_giorno = df_tc_daytype[df_tc_daytype["giorno"] == primo_gg][["deposito","turni","categoria"]]
-                    agg_daytype_list.append(df_giorno)
-                agg_daytype = pd.concat(agg_daytype_list, ignore_index=True) if agg_daytype_list else pd.DataFrame()
-                agg_daytype["categoria"] = pd.Categorical(agg_daytype["categoria"], categories=cat_order, ordered=True)
-                agg_daytype = agg_daytype.sort_values(["categoria","deposito"])
-                totale_cat = agg_daytype.groupby("categoria")["turni"].sum().reindex(cat_order, fill_value=0)
-
-                fig_daytype = go.Figure()
-                for dep in sorted(agg_daytype["deposito"].unique()):
-                    dep_data = agg_daytype[agg_daytype["deposito"] == dep]
-                    valori = [dep_data[dep_data["categoria"] == cat]["turni"].sum() if cat in dep_data["categoria"].values else 0 for cat in cat_order]
-                    fig_daytype.add_trace(go.Bar(x=cat_order, y=valori, name=dep.title(),
-                        marker_color=get_colore_deposito(dep),
-                        text=[f"{v:,}" if v > 0 else "" for v in valori],
-                        textposition="inside", textfont=dict(size=11, color="white")))
-                fig_daytype.update_layout(barmode="stack", height=480, hovermode="x unified",
-                    plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
-                    legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1,font=dict(size=11)),
-                    xaxis=dict(title="Tipo Giorno",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                    yaxis=dict(title="Turni Totali",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
-                    annotations=[dict(x=cat, y=totale_cat[cat], text=f"<b>{int(totale_cat[cat]):,}</b>",
-                        xanchor="center", yanchor="bottom", showarrow=False, font=dict(size=13,color="#ffffff"), yshift=6)
-                        for cat in cat_order if totale_cat[cat] > 0])
-                st.plotly_chart(fig_daytype, use_container_width=True, key="pc_15")
-                k1,k2,k3 = st.columns(3)
-                with k1: st.metric("📅 Turni/giorno Lu-Ve",    f"{int(totale_cat.get('Lu-Ve',0)):,}")
-                with k2: st.metric("📅 Turni/giorno Sabato",   f"{int(totale_cat.get('Sabato',0)):,}")
-                with k3: st.metric("📅 Turni/giorno Domenica", f"{int(totale_cat.get('Domenica',0)):,}")
-            except Exception as e:
-                st.warning(f"⚠️ Impossibile caricare analisi per tipo giorno: {e}")
+        st.markdown("---")
+        st.markdown("#### <i class='fas fa-chart-pie'></i> Distribuzione Turni per Deposito", unsafe_allow_html=True)
+        totale_per_dep = df_tc_agg.groupby("deposito", observed=True)["turni"].sum().reset_index()
+        fig_pie_tc = go.Figure(go.Pie(
+            labels=[d.title() for d in totale_per_dep["deposito"]], values=totale_per_dep["turni"],
+            marker=dict(colors=[get_colore_deposito(d) for d in totale_per_dep["deposito"]]),
+            hole=0.4, textinfo="label+percent+value"))
+        fig_pie_tc.update_layout(height=450, showlegend=True, paper_bgcolor="rgba(15,23,42,0.5)",
+            legend=dict(font=dict(color="#cbd5e1")), margin=dict(l=20,r=20,t=20,b=20))
+        plotly_chart(fig_pie_tc, use_container_width=True, key="pc_14")
+
+        st.markdown("---")
+        st.markdown("#### <i class='fas fa-calendar-week'></i> Turni per Giorno — Lu-Ve / Sabato / Domenica", unsafe_allow_html=True)
+        try:
+            df_tc_daytype = df_tc_plot.join(calendario["categoria_giorno"].rename("categoria"), on="giorno")
+            cat_order = ["Lu-Ve","Sabato","Domenica"]
+            primo_giorno_per_cat = df_tc_daytype.groupby("categoria")["giorno"].min().to_dict()
+            agg_daytype_list = []
+            for cat, primo_gg in primo_giorno_per_cat.items():
+                df_giorno = df_tc_daytype[df_tc_daytype["giorno"] == primo_gg][["deposito","turni","categoria"]]
+                agg_daytype_list.append(df_giorno)
+            agg_daytype = pd.concat(agg_daytype_list, ignore_index=True) if agg_daytype_list else pd.DataFrame()
+            agg_daytype["categoria"] = pd.Categorical(agg_daytype["categoria"], categories=cat_order, ordered=True)
+            agg_daytype = agg_daytype.sort_values(["categoria","deposito"])
+            totale_cat = agg_daytype.groupby("categoria")["turni"].sum().reindex(cat_order, fill_value=0)
+
+            fig_daytype = go.Figure()
+            for dep in sorted(agg_daytype["deposito"].unique()):
+                dep_data = agg_daytype[agg_daytype["deposito"] == dep]
+                valori = [dep_data[dep_data["categoria"] == cat]["turni"].sum() if cat in dep_data["categoria"].values else 0 for cat in cat_order]
+                fig_daytype.add_trace(go.Bar(x=cat_order, y=valori, name=dep.title(),
+                    marker_color=get_colore_deposito(dep),
+                    text=[f"{v:,}" if v > 0 else "" for v in valori],
+                    textposition="inside", textfont=dict(size=11, color="white")))
+            fig_daytype.update_layout(barmode="stack", height=480, hovermode="x unified",
+                plot_bgcolor="rgba(15,23,42,0.8)", paper_bgcolor="rgba(15,23,42,0.5)", font=dict(color="#cbd5e1"),
+                legend=dict(orientation="h",yanchor="bottom",y=1.02,xanchor="right",x=1,font=dict(size=11)),
+                xaxis=dict(title="Tipo Giorno",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+                yaxis=dict(title="Turni Totali",gridcolor="rgba(96,165,250,0.1)",linecolor="rgba(96,165,250,0.3)"),
+                annotations=[dict(x=cat, y=totale_cat[cat], text=f"<b>{int(totale_cat[cat]):,}</b>",
+                    xanchor="center", yanchor="bottom", showarrow=False, font=dict(size=13,color="#ffffff"), yshift=6)
+                    for cat in cat_order if totale_cat[cat] > 0])
+            plotly_chart(fig_daytype, use_container_width=True, key="pc_15")
+            k1,k2,k3 = st.columns(3)
+            with k1: st.metric("📅 Turni/giorno Lu-Ve",    f"{int(totale_cat.get('Lu-Ve',0)):,}")
+            with k2: st.metric("📅 Turni/giorno Sabato",   f"{int(totale_cat.get('Sabato',0)):,}")
+            with k3: st.metric("📅 Turni/giorno Domenica", f"{int(totale_cat.get('Domenica',0)):,}")
+        except Exception as e:
+            st.warning(f"⚠️ Impossibile caricare analisi per tipo giorno: {e}")
+
+
+with tab3, span("tab.turni_calendario"):
+    if tab_aperto(tab3):
+        st.markdown("### <i class='fas fa-calendar-check'></i> Turni per Deposito — Validità Temporale", unsafe_allow_html=True)
+
+        if not turni_cal_ok or len(df_tc_filtered) == 0:
+            st.warning("Nessun record trovato per il periodo selezionato.")
+            st.info("**Debug rapido**: controlla che i valori di `valid` nella tabella `turni` (`Lu-Ve`, `Sa`, `Do`) coincidano esattamente con i valori di `daytype` in `calendar`, e che le date `dal`/`al` rientrino nel periodo selezionato.")
+        else:
+            sezione_turni_calendario(df_tc_filtered, calendario)
 
 
 # ══════════════════════════════════════════════════
 # TAB 4 — DEPOSITI
 # ══════════════════════════════════════════════════
-with tab4:
-    if len(df_filtered) > 0 and len(by_deposito) > 0:
-        st.markdown("#### <i class='fas fa-trophy'></i> Ranking Depositi per Gap Medio", unsafe_allow_html=True)
-        colors_dep = ['#dc2626' if g < soglia_gap else '#fb923c' if g < 0 else '#22c55e' for g in by_deposito["media_gap_giorno"]]
-        fig_dep = go.Figure(go.Bar(y=by_deposito["deposito"], x=by_deposito["media_gap_giorno"], orientation='h',
-            marker=dict(color=colors_dep), text=by_deposito["media_gap_giorno"], texttemplate='%{text:.1f}', textposition='outside'))
-        fig_dep.add_vline(x=0, line_width=3, line_color="#60a5fa")
-        fig_dep.update_layout(height=max(400, len(by_deposito)*35), showlegend=False, **PLOTLY_TEMPLATE)
-        st.plotly_chart(fig_dep, use_container_width=True, key="pc_16")
+with tab4, span("tab.depositi"):
+    if tab_aperto(tab4):
+        if len(df_filtered) > 0 and len(by_deposito) > 0:
+            st.markdown("#### <i class='fas fa-trophy'></i> Ranking Depositi per Gap Medio", unsafe_allow_html=True)
+            colors_dep = ['#dc2626' if g < soglia_gap else '#fb923c' if g < 0 else '#22c55e' for g in by_deposito["media_gap_giorno"]]
+            fig_dep = go.Figure(go.Bar(y=by_deposito["deposito"], x=by_deposito["media_gap_giorno"], orientation='h',
+                marker=dict(color=colors_dep), text=by_deposito["media_gap_giorno"], texttemplate='%{text:.1f}', textposition='outside'))
+            fig_dep.add_vline(x=0, line_width=3, line_color="#60a5fa")
+            fig_dep.update_layout(height=max(400, len(by_deposito)*35), showlegend=False, **PLOTLY_TEMPLATE)
+            plotly_chart(fig_dep, use_container_width=True, key="pc_16")
 
-        st.markdown("---")
-        st.markdown("#### <i class='fas fa-chart-radar'></i> Comparazione Multi-Dimensionale", unsafe_allow_html=True)
-        by_dep_n = by_deposito.copy()
-        for col in ['turni_richiesti','disponibili_netti','assenze_previste']:
-            mx = by_dep_n[col].max()
-            by_dep_n[f'{col}_n'] = by_dep_n[col] / mx * 100 if mx > 0 else 0
-        fig_radar = go.Figure()
-        for _, row in by_deposito.head(6).iterrows():
-            nr = by_dep_n[by_dep_n['deposito'] == row['deposito']]
-            if len(nr) > 0:
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=[nr['turni_richiesti_n'].values[0], nr['disponibili_netti_n'].values[0],
-                       100-nr['assenze_previste_n'].values[0], row['tasso_copertura_%']],
-                    theta=['Turni Richiesti','Disponibili','Presenza','Copertura %'],
-                    fill='toself', name=row['deposito'].title(), line=dict(color=get_colore_deposito(row['deposito']))))
-        fig_radar.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0,100], gridcolor='rgba(96,165,250,0.2)'), bgcolor='rgba(15,23,42,0.8)'),
-            height=500, paper_bgcolor='rgba(15,23,42,0.5)', font={'color': '#cbd5e1'})
-        st.plotly_chart(fig_radar, use_container_width=True, key="pc_17")
+            st.markdown("---")
+            st.markdown("#### <i class='fas fa-chart-radar'></i> Comparazione Multi-Dimensionale", unsafe_allow_html=True)
+            by_dep_n = by_deposito.copy()
+            for col in ['turni_richiesti','disponibili_netti','assenze_previste']:
+                mx = by_dep_n[col].max()
+                by_dep_n[f'{col}_n'] = by_dep_n[col] / mx * 100 if mx > 0 else 0
+            fig_radar = go.Figure()
+            for _, row in by_deposito.head(6).iterrows():
+                nr = by_dep_n[by_dep_n['deposito'] == row['deposito']]
+                if len(nr) > 0:
+                    fig_radar.add_trace(go.Scatterpolar(
+                        r=[nr['turni_richiesti_n'].values[0], nr['disponibili_netti_n'].values[0],
+                           100-nr['assenze_previste_n'].values[0], row['tasso_copertura_%']],
+                        theta=['Turni Richiesti','Disponibili','Presenza','Copertura %'],
+                        fill='toself', name=row['deposito'].title(), line=dict(color=get_colore_deposito(row['deposito']))))
+            fig_radar.update_layout(
+                polar=dict(radialaxis=dict(visible=True, range=[0,100], gridcolor='rgba(96,165,250,0.2)'), bgcolor='rgba(15,23,42,0.8)'),
+                height=500, paper_bgcolor='rgba(15,23,42,0.5)', font={'color': '#cbd5e1'})
+            plotly_chart(fig_radar, use_container_width=True, key="pc_17")
 
-        st.markdown("---")
-        st.markdown("#### <i class='fas fa-table'></i> Tabella Dettagliata", unsafe_allow_html=True)
-        st.dataframe(by_deposito[["deposito","dipendenti_medi_giorno","giorni_periodo","disponibili_netti","assenze_previste","media_gap_giorno","tasso_copertura_%"]].rename(columns={
-            "deposito":"Deposito","dipendenti_medi_giorno":"Autisti medi","giorni_periodo":"Giorni",
-            "disponibili_netti":"Disponibili","assenze_previste":"Assenze","media_gap_giorno":"Gap/Giorno","tasso_copertura_%":"Copertura %"}),
-            use_container_width=True, hide_index=True)
+            st.markdown("---")
+            st.markdown("#### <i class='fas fa-table'></i> Tabella Dettagliata", unsafe_allow_html=True)
+            st.dataframe(by_deposito[["deposito","dipendenti_medi_giorno","giorni_periodo","disponibili_netti","assenze_previste","media_gap_giorno","tasso_copertura_%"]].rename(columns={
+                "deposito":"Deposito","dipendenti_medi_giorno":"Autisti medi","giorni_periodo":"Giorni",
+                "disponibili_netti":"Disponibili","assenze_previste":"Assenze","media_gap_giorno":"Gap/Giorno","tasso_copertura_%":"Copertura %"}),
+                use_container_width=True, hide_index=True)
 
 
 # ══════════════════════════════════════════════════
 # TAB 5 — EXPORT
 # ══════════════════════════════════════════════════
-with tab5:
-    st.markdown("#### <i class='fas fa-download'></i> Export Dati e Report", unsafe_allow_html=True)
-    col_exp1, col_exp2 = st.columns(2)
-
-    df_export = df_filtered.copy()
-    df_export["giorno"] = df_export["giorno"].dt.strftime('%d/%m/%Y')
-
-    with col_exp1:
-        st.markdown("##### 📊 Dataset Filtrato (CSV)")
-        csv = df_export.to_csv(index=False).encode('utf-8')
-        st.download_button("⬇️ Scarica CSV", data=csv,
-            file_name=f"estate2026_data_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv")
-        st.info(f"📦 {len(df_export):,} righe × {len(df_export.columns)} colonne")
-
-    with col_exp2:
-        st.markdown("##### 📈 Summary Report (Excel)")
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df_export.to_excel(writer, sheet_name='Staffing', index=False)
-            if len(by_deposito) > 0:
-                by_deposito.to_excel(writer, sheet_name='Per_Deposito', index=False)
-            if turni_cal_ok and len(df_tc_filtered) > 0:
-                tc_exp = df_tc_filtered.copy()
-                tc_exp["giorno"] = tc_exp["giorno"].dt.strftime('%d/%m/%Y')
-                tc_exp.to_excel(writer, sheet_name='Turni_Calendario', index=False)
-        st.download_button("⬇️ Scarica Excel Report", data=output.getvalue(),
-            file_name=f"estate2026_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        st.success("✅ Include: Staffing · Per deposito · Turni calendario")
+# I file si generano al click (download_button riceve una funzione) e
+# restano in cache per chiave di filtro: ripetere il download non li
+# ricostruisce. I frame (`_dati`, `_fogli`) non vengono hashati.
+@st.cache_data(max_entries=8, show_spinner=False)
+def export_csv(chiave: tuple, _dati: pd.DataFrame) -> bytes:
+    return csv_a_blocchi(_dati, formatta=date_italiane)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def export_excel(chiave: tuple, _fogli: dict) -> bytes:
+    return excel_streaming(_fogli, formatta=date_italiane)
+
+
+# Parquet e zip per gli strumenti BI: date come date, niente formattazione
+@st.cache_data(max_entries=8, show_spinner=False)
+def export_parquet(chiave: tuple, _dati: pd.DataFrame) -> bytes:
+    return parquet_streaming(_dati)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def export_zip(chiave: tuple, _dataset: dict, _manifesto: dict) -> bytes:
+    return zip_parquet(_dataset, _manifesto)
+
+
+with tab5, span("tab.export"):
+    if tab_aperto(tab5):
+        st.markdown("#### <i class='fas fa-download'></i> Export Dati e Report", unsafe_allow_html=True)
+        col_exp1, col_exp2 = st.columns(2)
+
+        chiave_export = (*_chiave_filtri, _versione(df_depositi))
+
+        with col_exp1:
+            st.markdown("##### 📊 Dataset Filtrato (CSV)")
+            st.download_button("⬇️ Scarica CSV", data=lambda: export_csv(chiave_export, df_filtered),
+                file_name=f"estate2026_data_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv")
+            st.info(f"📦 {len(df_filtered):,} righe × {len(df_filtered.columns)} colonne")
+
+        with col_exp2:
+            st.markdown("##### 📈 Summary Report (Excel)")
+            fogli_report = {
+                "Staffing":         df_filtered,
+                "Per_Deposito":     by_deposito if len(by_deposito) > 0 else None,
+                "Turni_Calendario": df_tc_filtered if turni_cal_ok and len(df_tc_filtered) > 0 else None,
+            }
+            st.download_button("⬇️ Scarica Excel Report", data=lambda: export_excel(("report", *chiave_export), fogli_report),
+                file_name=f"estate2026_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                mime=MIME_XLSX)
+            st.success("✅ Include: Staffing · Per deposito · Turni calendario")
+
+        if PARQUET_DISPONIBILE:
+            col_exp3, col_exp4 = st.columns(2)
+            oggi = datetime.now().strftime('%Y%m%d')
+
+            with col_exp3:
+                st.markdown("##### 🗜️ Dataset Filtrato (Parquet)")
+                st.download_button("⬇️ Scarica Parquet", data=lambda: export_parquet(chiave_export, df_filtered),
+                    file_name=f"estate2026_data_{oggi}.parquet", mime="application/vnd.apache.parquet")
+                st.caption("Colonnare, compresso, tipi conservati (deposito e tipo giorno a dizionario)")
+
+            with col_exp4:
+                st.markdown("##### 📦 Pacchetto completo (ZIP di Parquet)")
+                dataset_zip = {
+                    "staffing":          df_filtered,
+                    "per_deposito":      by_deposito if len(by_deposito) > 0 else None,
+                    "turni_calendario":  df_tc_filtered if turni_cal_ok and len(df_tc_filtered) > 0 else None,
+                    "copertura_roster":  df_copertura_filtered if len(df_copertura_filtered) > 0 else None,
+                    "copertura_roster2": df_copertura2_filtered if len(df_copertura2_filtered) > 0 else None,
+                }
+                manifesto_zip = {"filtri": {
+                    "depositi": sorted(deposito_sel), "periodo": [str(d) for d in date_range],
+                    "ferie_10": ferie_10, "gap_min": min_gap_filter, "gap_max": max_gap_filter,
+                }}
+                st.download_button("⬇️ Scarica pacchetto ZIP",
+                    data=lambda: export_zip(("zip", *chiave_export), dataset_zip, manifesto_zip),
+                    file_name=f"estate2026_dataset_{oggi}.zip", mime="application/zip")
+                st.caption("Un file Parquet per dataset: " + " · ".join(n for n, d in dataset_zip.items() if d is not None))
 
-    st.markdown("---")
-    st.markdown("##### 👀 Anteprima Dataset")
-    st.dataframe(df_export.head(100), use_container_width=True, height=400)
+        st.markdown("---")
+        st.markdown("##### 👀 Anteprima Dataset")
+        st.dataframe(date_italiane(df_filtered.head(100)), use_container_width=True, height=400)
 
 
 # --------------------------------------------------
@@ -2140,36 +2850,29 @@ with tab5:
 # ══════════════════════════════════════════════════
 # TAB 6 — CONFRONTO ROSTER vs ROSTER2 & ASSUNZIONI
 # ══════════════════════════════════════════════════
-def _build_copertura_fig(df_cop_raw: pd.DataFrame, titolo: str, chart_key: str) -> None:
-    """Costruisce e mostra il grafico copertura stacked (identico al Tab 1)."""
-    if len(df_cop_raw) == 0:
+@tracciata("grafico.copertura")
+def _build_copertura_fig(cop: pd.DataFrame, cop_graf: pd.DataFrame, titolo: str, chart_key: str) -> None:
+    """
+    Costruisce e mostra il grafico copertura stacked (identico al Tab 1):
+    KPI sugli aggregati giornalieri `cop`, grafico su quelli per periodo `cop_graf`.
+    """
+    if len(cop) == 0:
         st.info(f"Nessun dato disponibile per: {titolo}")
         return
 
-    cop = (
-        df_cop_raw.groupby("giorno")
-        .agg(
-            persone_in_forza=("persone_in_forza", "sum"),
-            turni_richiesti=("turni_richiesti", "sum"),
-            assenze_nominali=("assenze_nominali", "sum"),
-            assenze_statistiche=("assenze_statistiche", "sum"),
-            gap=("gap", "sum"),
-        )
-        .reset_index()
-    )
-
     c1, c2, c3, c4 = st.columns(4)
     with c1: st.metric("👥 Media/gg", f"{cop['persone_in_forza'].mean():.0f}")
     with c2: st.metric("✅ Giorni OK", f"{int((cop['gap'] >= 0).sum())}")
     with c3: st.metric("🚨 Deficit", f"{int((cop['gap'] < 0).sum())}")
     with c4: st.metric("📉 Gap medio", f"{cop['gap'].mean():.1f}", delta=f"min: {cop['gap'].min():.0f}")
 
-    cop["disponibili_netti"] = (
-        cop["persone_in_forza"] - cop["assenze_nominali"] - cop["assenze_statistiche"]
+    cop_graf = cop_graf.copy()
+    cop_graf["disponibili_netti"] = (
+        cop_graf["persone_in_forza"] - cop_graf["assenze_nominali"] - cop_graf["assenze_statistiche"]
     ).clip(lower=0)
-    cop["turni_coperti"] = cop[["turni_richiesti", "disponibili_netti"]].min(axis=1)
-    cop["buffer"]  = cop["gap"].clip(lower=0)
-    cop["deficit"] = (-cop["gap"]).clip(lower=0)
+    cop_graf["turni_coperti"] = cop_graf[["turni_richiesti", "disponibili_netti"]].min(axis=1)
+    cop_graf["buffer"]  = cop_graf["gap"].clip(lower=0)
+    cop_graf["deficit"] = (-cop_graf["gap"]).clip(lower=0)
 
     fig = make_subplots(
         rows=2, cols=1, row_heights=[0.70, 0.30],
@@ -2177,22 +2880,22 @@ def _build_copertura_fig(df_cop_raw: pd.DataFrame, titolo: str, chart_key: str)
         subplot_titles=(titolo, "Buffer / Deficit"),
     )
 
-    fig.add_trace(go.Bar(x=cop["giorno"], y=cop["assenze_nominali"],
+    fig.add_trace(go.Bar(x=cop_graf["giorno"], y=cop_graf["assenze_nominali"],
         name="Assenze roster", marker_color="#ef4444", opacity=0.85), row=1, col=1)
-    fig.add_trace(go.Bar(x=cop["giorno"], y=cop["assenze_statistiche"],
+    fig.add_trace(go.Bar(x=cop_graf["giorno"], y=cop_graf["assenze_statistiche"],
         name="Assenze statistiche", marker_color="#f97316", opacity=0.85), row=1, col=1)
-    fig.add_trace(go.Bar(x=cop["giorno"], y=cop["turni_coperti"],
+    fig.add_trace(go.Bar(x=cop_graf["giorno"], y=cop_graf["turni_coperti"],
         name="Turni coperti", marker_color="#3b82f6", opacity=0.9), row=1, col=1)
-    fig.add_trace(go.Bar(x=cop["giorno"], y=cop["buffer"],
+    fig.add_trace(go.Bar(x=cop_graf["giorno"], y=cop_graf["buffer"],
         name="Buffer", marker_color="#22c55e", opacity=0.85), row=1, col=1)
-    fig.add_trace(go.Bar(x=cop["giorno"], y=cop["deficit"],
+    fig.add_trace(go.Bar(x=cop_graf["giorno"], y=cop_graf["deficit"],
         name="Deficit", marker_color="#dc2626", opacity=0.95), row=1, col=1)
-    fig.add_trace(go.Scatter(x=cop["giorno"], y=cop["persone_in_forza"],
+    fig.add_trace(go.Scatter(x=cop_graf["giorno"], y=cop_graf["persone_in_forza"],
         mode="lines", name="Organico totale",
         line=dict(color="#fbbf24", width=2, dash="dot")), row=1, col=1)
 
-    colors_gap = ["#22c55e" if v >= 0 else "#ef4444" for v in cop["gap"]]
-    fig.add_trace(go.Bar(x=cop["giorno"], y=cop["gap"],
+    colors_gap = colori_segno(cop_graf["gap"], "#22c55e", "#ef4444")
+    fig.add_trace(go.Bar(x=cop_graf["giorno"], y=cop_graf["gap"],
         name="Gap", marker_color=colors_gap, opacity=0.85), row=2, col=1)
     fig.add_hline(y=0, line_color="#fbbf24", line_dash="dot", line_width=1.5, row=2, col=1)
 
@@ -2205,278 +2908,280 @@ def _build_copertura_fig(df_cop_raw: pd.DataFrame, titolo: str, chart_key: str)
     )
     fig.update_xaxes(gridcolor="#e2e8f0", showgrid=True)
     fig.update_yaxes(gridcolor="#e2e8f0", showgrid=True)
-    st.plotly_chart(fig, use_container_width=True, key=chart_key)
-
-
-with tab6:
-    st.markdown("## 🔄 Confronto Roster Originale vs Roster2 (ferie spostate)")
-
-    ha_cop1 = len(df_copertura_filtered) > 0
-    ha_cop2 = len(df_copertura2_filtered) > 0
-
-    if not ha_cop1 and not ha_cop2:
-        st.info("Dati copertura non disponibili. Verifica che le tabelle roster e roster2 siano popolate.")
-    else:
-        # ── SEZIONE 1: grafici copertura affiancati ──────────────────────
-        st.markdown("### 📊 Sezione 1 — Copertura giornaliera a confronto")
-        col_r1, col_r2 = st.columns(2)
+    plotly_chart(fig, use_container_width=True, key=chart_key)
 
-        with col_r1:
-            st.markdown(
-                "<div style='border:2px solid #2563eb;border-radius:10px;padding:8px 14px;"
-                "margin-bottom:8px;background:#eff6ff;color:#1e40af;font-weight:700;'>ROSTER ORIGINALE</div>",
-                unsafe_allow_html=True,
-            )
-            if ha_cop1:
-                _build_copertura_fig(df_copertura_filtered, "Roster Originale", "pc6_cop1")
-            else:
-                st.info("Dati roster non disponibili.")
 
-        with col_r2:
-            st.markdown(
-                "<div style='border:2px solid #d97706;border-radius:10px;padding:8px 14px;"
-                "margin-bottom:8px;background:#fffbeb;color:#92400e;font-weight:700;'>ROSTER2 — FERIE SPOSTATE</div>",
-                unsafe_allow_html=True,
-            )
-            if ha_cop2:
-                _build_copertura_fig(df_copertura2_filtered, "Roster2 — Ferie Spostate", "pc6_cop2")
-            else:
-                st.info("Dati roster2 non disponibili. Esegui l'import di roster2 nel database.")
+with tab6, span("tab.confronto"):
+    if tab_aperto(tab6):
+        st.markdown("## 🔄 Confronto Roster Originale vs Roster2 (ferie spostate)")
 
-        st.markdown("---")
+        ha_cop1 = len(df_copertura_filtered) > 0
+        ha_cop2 = len(df_copertura2_filtered) > 0
 
-        # ── SEZIONE 2: gap sovrapposto ───────────────────────────────────
-        if ha_cop1 and ha_cop2:
-            st.markdown("### 📈 Sezione 2 — Gap sovrapposto & miglioramenti")
-
-            gap1 = (df_copertura_filtered.groupby("giorno")["gap"].sum()
-                    .reset_index().rename(columns={"gap": "gap1"}))
-            gap2 = (df_copertura2_filtered.groupby("giorno")["gap"].sum()
-                    .reset_index().rename(columns={"gap": "gap2"}))
-            gap_merge = gap1.merge(gap2, on="giorno", how="outer").fillna(0).sort_values("giorno")
-            gap_merge["delta"] = gap_merge["gap2"] - gap_merge["gap1"]
-
-            fig_gap = make_subplots(
-                rows=2, cols=1, row_heights=[0.65, 0.35],
-                shared_xaxes=True, vertical_spacing=0.06,
-                subplot_titles=("Gap giornaliero: Roster vs Roster2", "Miglioramento (Δ gap)"),
-            )
-            fig_gap.add_trace(go.Scatter(
-                x=gap_merge["giorno"], y=gap_merge["gap1"],
-                name="Roster originale", line=dict(color="#3b82f6", width=2, dash="dot"),
-                mode="lines",
-            ), row=1, col=1)
-            fig_gap.add_trace(go.Scatter(
-                x=gap_merge["giorno"], y=gap_merge["gap2"],
-                name="Roster2 (ferie spostate)", line=dict(color="#f59e0b", width=2.5),
-                mode="lines",
-            ), row=1, col=1)
-            fig_gap.add_hline(y=0, line_color="#ef4444", line_dash="dot", line_width=1.2, row=1, col=1)
-
-            delta_colors = ["#22c55e" if v > 0 else "#ef4444" if v < 0 else "#64748b"
-                            for v in gap_merge["delta"]]
-            fig_gap.add_trace(go.Bar(
-                x=gap_merge["giorno"], y=gap_merge["delta"],
-                name="Δ gap (verde=miglioramento)", marker_color=delta_colors, opacity=0.85,
-            ), row=2, col=1)
-            fig_gap.add_hline(y=0, line_color="#fbbf24", line_dash="dot", line_width=1, row=2, col=1)
-
-            fig_gap.update_layout(
-                height=480, barmode="relative",
-                paper_bgcolor="#ffffff", plot_bgcolor="#ffffff",
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1,
-                            font=dict(color="#1e293b", size=11)),
-                margin=dict(l=0, r=0, t=30, b=0),
-            )
-            fig_gap.update_xaxes(gridcolor="#e2e8f0")
-            fig_gap.update_yaxes(gridcolor="#e2e8f0")
-            st.plotly_chart(fig_gap, use_container_width=True, key="pc6_gap")
-
-            st.markdown("---")
-
-        # ── SEZIONE 3: per deposito ──────────────────────────────────────
-        if ha_cop1 and ha_cop2:
-            st.markdown("### 🏭 Sezione 3 — Gap medio per deposito")
-
-            gap_dep1 = (df_copertura_filtered.groupby("deposito")["gap"]
-                        .mean().reset_index().rename(columns={"gap": "gap_roster"}))
-            gap_dep2 = (df_copertura2_filtered.groupby("deposito")["gap"]
-                        .mean().reset_index().rename(columns={"gap": "gap_roster2"}))
-            dep_merge = gap_dep1.merge(gap_dep2, on="deposito", how="outer").fillna(0)
-            dep_merge = dep_merge.sort_values("gap_roster")
-
-            fig_dep = go.Figure()
-            fig_dep.add_trace(go.Bar(
-                y=dep_merge["deposito"], x=dep_merge["gap_roster"],
-                name="Roster originale", orientation="h",
-                marker_color="#3b82f6", opacity=0.85,
-            ))
-            fig_dep.add_trace(go.Bar(
-                y=dep_merge["deposito"], x=dep_merge["gap_roster2"],
-                name="Roster2 (ferie spostate)", orientation="h",
-                marker_color="#f59e0b", opacity=0.85,
-            ))
-            fig_dep.update_layout(
-                barmode="group", height=400,
-                xaxis_title="Gap medio giornaliero",
-                paper_bgcolor="#ffffff", plot_bgcolor="#ffffff",
-                legend=dict(font=dict(color="#1e293b")),
-                margin=dict(l=0, r=0, t=10, b=0),
-            )
-            fig_dep.add_vline(x=0, line_color="#ef4444", line_dash="dot", line_width=1.5)
-            st.plotly_chart(fig_dep, use_container_width=True, key="pc6_dep")
-
-            st.markdown("---")
-
-        # ── SEZIONE 4: stima assunzioni ──────────────────────────────────
-        st.markdown("### 👷 Sezione 4 — Fabbisogno di personale")
-
-        if ha_cop2:
-            from math import ceil
+        if not ha_cop1 and not ha_cop2:
+            st.info("Dati copertura non disponibili. Verifica che le tabelle roster e roster2 siano popolate.")
+        else:
+            # ── SEZIONE 1: grafici copertura affiancati ──────────────────────
+            st.markdown("### 📊 Sezione 1 — Copertura giornaliera a confronto")
+            col_r1, col_r2 = st.columns(2)
 
-            # Badge stato simulazione ferie
-            if ferie_10:
+            with col_r1:
                 st.markdown(
-                    "<div style='background:#fffbeb;border:1px solid #fcd34d;border-left:5px solid #f59e0b;"
-                    "border-radius:10px;padding:10px 16px;margin-bottom:12px;color:#78350f;font-weight:700;font-size:0.9rem;'>"
-                    "🏖️ <b>Simulazione attiva:</b> +10 giornate di ferie (5 Ancona + 5 altri depositi) "
-                    "già incluse nel calcolo.</div>",
+                    "<div style='border:2px solid #2563eb;border-radius:10px;padding:8px 14px;"
+                    "margin-bottom:8px;background:#eff6ff;color:#1e40af;font-weight:700;'>ROSTER ORIGINALE</div>",
                     unsafe_allow_html=True,
                 )
-            else:
+                if ha_cop1:
+                    _build_copertura_fig(rollup_giorno["copertura"], rollup_periodo["copertura"], "Roster Originale", "pc6_cop1")
+                else:
+                    st.info("Dati roster non disponibili.")
+
+            with col_r2:
                 st.markdown(
-                    "<div style='background:#f0f9ff;border:1px solid #7dd3fc;border-left:5px solid #0369a1;"
-                    "border-radius:10px;padding:10px 16px;margin-bottom:12px;color:#0c4a6e;font-weight:600;font-size:0.9rem;'>"
-                    "ℹ️ Calcolo basato su Roster2 senza ferie aggiuntive. "
-                    "Attiva <b>«Con 10 giornate di ferie»</b> nella sidebar per lo scenario peggiore.</div>",
+                    "<div style='border:2px solid #d97706;border-radius:10px;padding:8px 14px;"
+                    "margin-bottom:8px;background:#fffbeb;color:#92400e;font-weight:700;'>ROSTER2 — FERIE SPOSTATE</div>",
                     unsafe_allow_html=True,
                 )
+                if ha_cop2:
+                    _build_copertura_fig(rollup_giorno["copertura2"], rollup_periodo["copertura2"], "Roster2 — Ferie Spostate", "pc6_cop2")
+                else:
+                    st.info("Dati roster2 non disponibili. Esegui l'import di roster2 nel database.")
 
-            dep_gaps = df_copertura2_filtered.groupby("deposito")["gap"].mean().reset_index()
-            dep_gaps.columns = ["deposito", "gap_medio"]
-            dep_gaps["deficit_medio"] = dep_gaps["gap_medio"].apply(
-                lambda x: abs(x) if x < 0 else 0
-            )
-            dep_gaps["assunzioni_stimate"] = dep_gaps["deficit_medio"].apply(
-                lambda x: ceil(x) if x > 0 else 0
-            )
-            dep_gaps_deficit = dep_gaps[dep_gaps["assunzioni_stimate"] > 0].sort_values(
-                "assunzioni_stimate", ascending=False
-            )
+            st.markdown("---")
 
-            if len(dep_gaps_deficit) == 0:
-                st.markdown(
-                    "<div style='background:#f0fdf4;border:2px solid #86efac;border-radius:14px;"
-                    "padding:24px 28px;text-align:center;'>"
-                    "<p style='font-size:2rem;margin:0;'>✅</p>"
-                    "<p style='font-size:1.3rem;font-weight:800;color:#14532d;margin:8px 0 4px;'>"
-                    "Nessuna assunzione necessaria</p>"
-                    "<p style='color:#166534;font-size:0.95rem;margin:0;'>"
-                    "Il piano ferie del Roster2 è sostenibile con l'organico attuale.</p>"
-                    "</div>",
-                    unsafe_allow_html=True,
+            # ── SEZIONE 2: gap sovrapposto ───────────────────────────────────
+            if ha_cop1 and ha_cop2:
+                st.markdown("### 📈 Sezione 2 — Gap sovrapposto & miglioramenti")
+
+                gap1 = rollup_periodo["copertura"][["giorno", "gap"]].rename(columns={"gap": "gap1"})
+                gap2 = rollup_periodo["copertura2"][["giorno", "gap"]].rename(columns={"gap": "gap2"})
+                gap_merge = gap1.merge(gap2, on="giorno", how="outer").fillna(0).sort_values("giorno")
+                gap_merge["delta"] = gap_merge["gap2"] - gap_merge["gap1"]
+
+                fig_gap = make_subplots(
+                    rows=2, cols=1, row_heights=[0.65, 0.35],
+                    shared_xaxes=True, vertical_spacing=0.06,
+                    subplot_titles=(
+                        "Gap giornaliero: Roster vs Roster2" if risoluzione == "giorno"
+                        else f"Gap medio giornaliero per {risoluzione}: Roster vs Roster2",
+                        "Miglioramento (Δ gap)",
+                    ),
                 )
-            else:
-                totale_assunzioni = int(dep_gaps_deficit["assunzioni_stimate"].sum())
-                sim_label = " (con +10gg ferie)" if ferie_10 else ""
-
-                # Banner principale fabbisogno
-                st.markdown(
-                    f"<div style='background:linear-gradient(135deg,#1e40af 0%,#2563eb 100%);"
-                    f"border-radius:16px;padding:28px 32px;text-align:center;margin:8px 0 20px;'>"
-                    f"<p style='color:rgba(255,255,255,0.75);font-size:0.9rem;font-weight:600;"
-                    f"text-transform:uppercase;letter-spacing:1px;margin:0 0 6px;'>"
-                    f"FABBISOGNO STIMATO{sim_label}</p>"
-                    f"<p style='color:#ffffff;font-size:3.2rem;font-weight:900;margin:0;line-height:1;'>"
-                    f"{totale_assunzioni}</p>"
-                    f"<p style='color:rgba(255,255,255,0.85);font-size:1.1rem;font-weight:700;margin:8px 0 0;'>"
-                    f"autisti da assumere</p>"
-                    f"</div>",
-                    unsafe_allow_html=True,
+                fig_gap.add_trace(serie(
+                    gap_merge["giorno"], gap_merge["gap1"],
+                    name="Roster originale", line=dict(color="#3b82f6", width=2, dash="dot"),
+                    mode="lines",
+                ), row=1, col=1)
+                fig_gap.add_trace(serie(
+                    gap_merge["giorno"], gap_merge["gap2"],
+                    name="Roster2 (ferie spostate)", line=dict(color="#f59e0b", width=2.5),
+                    mode="lines",
+                ), row=1, col=1)
+                fig_gap.add_hline(y=0, line_color="#ef4444", line_dash="dot", line_width=1.2, row=1, col=1)
+
+                delta_colors = colori_segno(gap_merge["delta"], "#22c55e", "#ef4444", zero="#64748b")
+                fig_gap.add_trace(go.Bar(
+                    x=gap_merge["giorno"], y=gap_merge["delta"],
+                    name="Δ gap (verde=miglioramento)", marker_color=delta_colors, opacity=0.85,
+                ), row=2, col=1)
+                fig_gap.add_hline(y=0, line_color="#fbbf24", line_dash="dot", line_width=1, row=2, col=1)
+
+                fig_gap.update_layout(
+                    height=480, barmode="relative",
+                    paper_bgcolor="#ffffff", plot_bgcolor="#ffffff",
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1,
+                                font=dict(color="#1e293b", size=11)),
+                    margin=dict(l=0, r=0, t=30, b=0),
                 )
-
-                # Metriche riepilogative
-                mc1, mc2, mc3 = st.columns(3)
-                with mc1:
-                    st.metric("Depositi in deficit", f"{len(dep_gaps_deficit)}")
-                with mc2:
-                    worst_dep = dep_gaps_deficit.iloc[0]
-                    st.metric("Deposito più critico", worst_dep["deposito"],
-                              delta=f"{int(worst_dep['assunzioni_stimate'])} autisti", delta_color="inverse")
-                with mc3:
-                    deficit_max = dep_gaps_deficit["deficit_medio"].max()
-                    st.metric("Deficit medio max/gg", f"{deficit_max:.1f}")
-
-                st.markdown("#### Distribuzione per deposito")
-
-                # Grafico a barre orizzontale con gradiente di severità
-                dep_chart = dep_gaps_deficit.sort_values("assunzioni_stimate", ascending=True)
-                bar_colors = ["#dc2626" if v >= 5 else "#f97316" if v >= 3 else "#f59e0b"
-                              for v in dep_chart["assunzioni_stimate"]]
-                fig_ass = go.Figure(go.Bar(
-                    y=dep_chart["deposito"],
-                    x=dep_chart["assunzioni_stimate"],
-                    orientation="h",
-                    marker_color=bar_colors,
-                    text=[f"<b>{int(v)}</b>" for v in dep_chart["assunzioni_stimate"]],
-                    textposition="outside",
-                    textfont=dict(size=14, color="#1e293b"),
+                fig_gap.update_xaxes(gridcolor="#e2e8f0")
+                fig_gap.update_yaxes(gridcolor="#e2e8f0")
+                plotly_chart(fig_gap, use_container_width=True, key="pc6_gap")
+
+                st.markdown("---")
+
+            # ── SEZIONE 3: per deposito ──────────────────────────────────────
+            if ha_cop1 and ha_cop2:
+                st.markdown("### 🏭 Sezione 3 — Gap medio per deposito")
+
+                gap_dep1 = (df_copertura_filtered.groupby("deposito", observed=True)["gap"]
+                            .mean().reset_index().rename(columns={"gap": "gap_roster"}))
+                gap_dep2 = (df_copertura2_filtered.groupby("deposito", observed=True)["gap"]
+                            .mean().reset_index().rename(columns={"gap": "gap_roster2"}))
+                dep_merge = gap_dep1.merge(gap_dep2, on="deposito", how="outer").fillna(0)
+                dep_merge = dep_merge.sort_values("gap_roster")
+
+                fig_dep = go.Figure()
+                fig_dep.add_trace(go.Bar(
+                    y=dep_merge["deposito"], x=dep_merge["gap_roster"],
+                    name="Roster originale", orientation="h",
+                    marker_color="#3b82f6", opacity=0.85,
+                ))
+                fig_dep.add_trace(go.Bar(
+                    y=dep_merge["deposito"], x=dep_merge["gap_roster2"],
+                    name="Roster2 (ferie spostate)", orientation="h",
+                    marker_color="#f59e0b", opacity=0.85,
                 ))
-                fig_ass.update_layout(
-                    height=max(300, len(dep_chart) * 52 + 60),
-                    xaxis_title="Autisti da assumere",
+                fig_dep.update_layout(
+                    barmode="group", height=400,
+                    xaxis_title="Gap medio giornaliero",
                     paper_bgcolor="#ffffff", plot_bgcolor="#ffffff",
-                    font=dict(color="#1e293b"),
-                    xaxis=dict(gridcolor="#e2e8f0"),
-                    yaxis=dict(gridcolor="#f1f5f9"),
-                    margin=dict(l=0, r=60, t=10, b=0),
+                    legend=dict(font=dict(color="#1e293b")),
+                    margin=dict(l=0, r=0, t=10, b=0),
                 )
-                st.plotly_chart(fig_ass, use_container_width=True, key="pc6_ass")
+                fig_dep.add_vline(x=0, line_color="#ef4444", line_dash="dot", line_width=1.5)
+                plotly_chart(fig_dep, use_container_width=True, key="pc6_dep")
 
-                # Legenda colori
-                st.markdown(
-                    "<div style='display:flex;gap:16px;margin:4px 0 16px;font-size:0.82rem;color:#475569;'>"
-                    "<span>🔴 ≥5 autisti &nbsp;&nbsp;</span>"
-                    "<span>🟠 3–4 autisti &nbsp;&nbsp;</span>"
-                    "<span>🟡 1–2 autisti</span>"
-                    "</div>",
-                    unsafe_allow_html=True,
-                )
+                st.markdown("---")
 
-                st.markdown("#### Dettaglio analitico per deposito")
-                display_df = dep_gaps_deficit[["deposito", "gap_medio", "deficit_medio", "assunzioni_stimate"]].copy()
-                display_df.columns = ["Deposito", "Gap medio/gg", "Deficit medio/gg", "Autisti da assumere"]
-                display_df["Gap medio/gg"] = display_df["Gap medio/gg"].round(1)
-                display_df["Deficit medio/gg"] = display_df["Deficit medio/gg"].round(1)
-                st.dataframe(display_df, use_container_width=True, hide_index=True)
+            # ── SEZIONE 4: stima assunzioni ──────────────────────────────────
+            st.markdown("### 👷 Sezione 4 — Fabbisogno di personale")
 
-                # Note metodologiche
-                st.markdown(
-                    "<div style='background:#f8fafc;border:1px solid #e2e8f0;border-radius:10px;"
-                    "padding:14px 18px;margin-top:12px;font-size:0.85rem;color:#64748b;'>"
-                    "<b>📐 Metodologia:</b> Il fabbisogno è <code>⌈|gap medio giornaliero|⌉</code> "
-                    "per ogni deposito con gap negativo sul periodo selezionato. "
-                    "Gap = organico in forza − assenze nominali − assenze statistiche − turni richiesti."
-                    "</div>",
-                    unsafe_allow_html=True,
-                )
+            if ha_cop2:
+                from math import ceil
+
+                # Badge stato simulazione ferie
+                if ferie_10:
+                    st.markdown(
+                        "<div style='background:#fffbeb;border:1px solid #fcd34d;border-left:5px solid #f59e0b;"
+                        "border-radius:10px;padding:10px 16px;margin-bottom:12px;color:#78350f;font-weight:700;font-size:0.9rem;'>"
+                        "🏖️ <b>Simulazione attiva:</b> +10 giornate di ferie (5 Ancona + 5 altri depositi) "
+                        "già incluse nel calcolo.</div>",
+                        unsafe_allow_html=True,
+                    )
+                else:
+                    st.markdown(
+                        "<div style='background:#f0f9ff;border:1px solid #7dd3fc;border-left:5px solid #0369a1;"
+                        "border-radius:10px;padding:10px 16px;margin-bottom:12px;color:#0c4a6e;font-weight:600;font-size:0.9rem;'>"
+                        "ℹ️ Calcolo basato su Roster2 senza ferie aggiuntive. "
+                        "Attiva <b>«Con 10 giornate di ferie»</b> nella sidebar per lo scenario peggiore.</div>",
+                        unsafe_allow_html=True,
+                    )
 
-                # Export Excel con foglio parametri
-                output_ass = BytesIO()
-                with pd.ExcelWriter(output_ass, engine="xlsxwriter") as writer:
-                    display_df.to_excel(writer, sheet_name="Assunzioni", index=False)
-                    pd.DataFrame({
-                        "Parametro": ["Simulazione ferie +10gg", "Totale assunzioni stimate"],
-                        "Valore": ["Sì" if ferie_10 else "No", str(totale_assunzioni)],
-                    }).to_excel(writer, sheet_name="Parametri", index=False)
-                st.download_button(
-                    "⬇️ Scarica piano assunzioni (Excel)",
-                    data=output_ass.getvalue(),
-                    file_name=f"piano_assunzioni{'_ferie10' if ferie_10 else ''}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                dep_gaps = df_copertura2_filtered.groupby("deposito", observed=True)["gap"].mean().reset_index()
+                dep_gaps.columns = ["deposito", "gap_medio"]
+                dep_gaps["deficit_medio"] = dep_gaps["gap_medio"].apply(
+                    lambda x: abs(x) if x < 0 else 0
+                )
+                dep_gaps["assunzioni_stimate"] = dep_gaps["deficit_medio"].apply(
+                    lambda x: ceil(x) if x > 0 else 0
+                )
+                dep_gaps_deficit = dep_gaps[dep_gaps["assunzioni_stimate"] > 0].sort_values(
+                    "assunzioni_stimate", ascending=False
                 )
-        else:
-            st.info("Popola la tabella roster2 nel database per ottenere la stima delle assunzioni.")
+
+                if len(dep_gaps_deficit) == 0:
+                    st.markdown(
+                        "<div style='background:#f0fdf4;border:2px solid #86efac;border-radius:14px;"
+                        "padding:24px 28px;text-align:center;'>"
+                        "<p style='font-size:2rem;margin:0;'>✅</p>"
+                        "<p style='font-size:1.3rem;font-weight:800;color:#14532d;margin:8px 0 4px;'>"
+                        "Nessuna assunzione necessaria</p>"
+                        "<p style='color:#166534;font-size:0.95rem;margin:0;'>"
+                        "Il piano ferie del Roster2 è sostenibile con l'organico attuale.</p>"
+                        "</div>",
+                        unsafe_allow_html=True,
+                    )
+                else:
+                    totale_assunzioni = int(dep_gaps_deficit["assunzioni_stimate"].sum())
+                    sim_label = " (con +10gg ferie)" if ferie_10 else ""
+
+                    # Banner principale fabbisogno
+                    st.markdown(
+                        f"<div style='background:linear-gradient(135deg,#1e40af 0%,#2563eb 100%);"
+                        f"border-radius:16px;padding:28px 32px;text-align:center;margin:8px 0 20px;'>"
+                        f"<p style='color:rgba(255,255,255,0.75);font-size:0.9rem;font-weight:600;"
+                        f"text-transform:uppercase;letter-spacing:1px;margin:0 0 6px;'>"
+                        f"FABBISOGNO STIMATO{sim_label}</p>"
+                        f"<p style='color:#ffffff;font-size:3.2rem;font-weight:900;margin:0;line-height:1;'>"
+                        f"{totale_assunzioni}</p>"
+                        f"<p style='color:rgba(255,255,255,0.85);font-size:1.1rem;font-weight:700;margin:8px 0 0;'>"
+                        f"autisti da assumere</p>"
+                        f"</div>",
+                        unsafe_allow_html=True,
+                    )
+
+                    # Metriche riepilogative
+                    mc1, mc2, mc3 = st.columns(3)
+                    with mc1:
+                        st.metric("Depositi in deficit", f"{len(dep_gaps_deficit)}")
+                    with mc2:
+                        worst_dep = dep_gaps_deficit.iloc[0]
+                        st.metric("Deposito più critico", worst_dep["deposito"],
+                                  delta=f"{int(worst_dep['assunzioni_stimate'])} autisti", delta_color="inverse")
+                    with mc3:
+                        deficit_max = dep_gaps_deficit["deficit_medio"].max()
+                        st.metric("Deficit medio max/gg", f"{deficit_max:.1f}")
+
+                    st.markdown("#### Distribuzione per deposito")
+
+                    # Grafico a barre orizzontale con gradiente di severità
+                    dep_chart = dep_gaps_deficit.sort_values("assunzioni_stimate", ascending=True)
+                    bar_colors = ["#dc2626" if v >= 5 else "#f97316" if v >= 3 else "#f59e0b"
+                                  for v in dep_chart["assunzioni_stimate"]]
+                    fig_ass = go.Figure(go.Bar(
+                        y=dep_chart["deposito"],
+                        x=dep_chart["assunzioni_stimate"],
+                        orientation="h",
+                        marker_color=bar_colors,
+                        text=[f"<b>{int(v)}</b>" for v in dep_chart["assunzioni_stimate"]],
+                        textposition="outside",
+                        textfont=dict(size=14, color="#1e293b"),
+                    ))
+                    fig_ass.update_layout(
+                        height=max(300, len(dep_chart) * 52 + 60),
+                        xaxis_title="Autisti da assumere",
+                        paper_bgcolor="#ffffff", plot_bgcolor="#ffffff",
+                        font=dict(color="#1e293b"),
+                        xaxis=dict(gridcolor="#e2e8f0"),
+                        yaxis=dict(gridcolor="#f1f5f9"),
+                        margin=dict(l=0, r=60, t=10, b=0),
+                    )
+                    plotly_chart(fig_ass, use_container_width=True, key="pc6_ass")
+
+                    # Legenda colori
+                    st.markdown(
+                        "<div style='display:flex;gap:16px;margin:4px 0 16px;font-size:0.82rem;color:#475569;'>"
+                        "<span>🔴 ≥5 autisti &nbsp;&nbsp;</span>"
+                        "<span>🟠 3–4 autisti &nbsp;&nbsp;</span>"
+                        "<span>🟡 1–2 autisti</span>"
+                        "</div>",
+                        unsafe_allow_html=True,
+                    )
+
+                    st.markdown("#### Dettaglio analitico per deposito")
+                    display_df = dep_gaps_deficit[["deposito", "gap_medio", "deficit_medio", "assunzioni_stimate"]].copy()
+                    display_df.columns = ["Deposito", "Gap medio/gg", "Deficit medio/gg", "Autisti da assumere"]
+                    display_df["Gap medio/gg"] = display_df["Gap medio/gg"].round(1)
+                    display_df["Deficit medio/gg"] = display_df["Deficit medio/gg"].round(1)
+                    st.dataframe(display_df, use_container_width=True, hide_index=True)
+
+                    # Note metodologiche
+                    st.markdown(
+                        "<div style='background:#f8fafc;border:1px solid #e2e8f0;border-radius:10px;"
+                        "padding:14px 18px;margin-top:12px;font-size:0.85rem;color:#64748b;'>"
+                        "<b>📐 Metodologia:</b> Il fabbisogno è <code>⌈|gap medio giornaliero|⌉</code> "
+                        "per ogni deposito con gap negativo sul periodo selezionato. "
+                        "Gap = organico in forza − assenze nominali − assenze statistiche − turni richiesti."
+                        "</div>",
+                        unsafe_allow_html=True,
+                    )
+
+                    # Export Excel con foglio parametri
+                    fogli_ass = {
+                        "Assunzioni": display_df,
+                        "Parametri": pd.DataFrame({
+                            "Parametro": ["Simulazione ferie +10gg", "Totale assunzioni stimate"],
+                            "Valore": ["Sì" if ferie_10 else "No", str(totale_assunzioni)],
+                        }),
+                    }
+                    st.download_button(
+                        "⬇️ Scarica piano assunzioni (Excel)",
+                        data=lambda: export_excel(("assunzioni", *_chiave_filtri), fogli_ass),
+                        file_name=f"piano_assunzioni{'_ferie10' if ferie_10 else ''}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                        mime=MIME_XLSX,
+                    )
+            else:
+                st.info("Popola la tabella roster2 nel database per ottenere la stima delle assunzioni.")
 
 
 # --------------------------------------------------
@@ -2496,3 +3201,27 @@ st.markdown(f"""
     </p>
 </div>
 """, unsafe_allow_html=True)
+
+
+# --------------------------------------------------
+# PANNELLO TEMPI (solo admin)
+# --------------------------------------------------
+if traccia is not None:
+    traccia.chiudi_rerun()
+    with st.sidebar.expander("⏱️ Tempi rerun (admin)"):
+        st.caption(f"Ultimo rerun · {traccia.reruns} rerun in questa sessione")
+        st.dataframe(
+            traccia.dettaglio().round(1), hide_index=True, use_container_width=True,
+            column_config={"byte": st.column_config.NumberColumn(format="%d")},
+        )
+        dett = traccia.dettaglio()
+        oltre = dett[dett["span"].str.startswith("plotly.") & (pd.to_numeric(dett["byte"]) > GRAFICO_KB_MAX * 1024)]
+        for r in oltre.itertuples():
+            st.warning(f"📦 {r.span[len('plotly.'):]}: {r.byte / 1024:,.0f} KB (budget {GRAFICO_KB_MAX:,.0f} KB)")
+        st.caption("Storico per span (ultimi 200 campioni)")
+        st.dataframe(traccia.percentili().round(1), hide_index=True, use_container_width=True)
+        st.download_button(
+            "📥 Esporta JSON", traccia.esporta_json(),
+            file_name=f"tempi_rerun_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+        )
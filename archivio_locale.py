@@ -0,0 +1,173 @@
+# ===============================================
+# ESTATE 2026 - ARCHIVIO LOCALE (DuckDB)
+# Le tabelle esportate in Parquet, interrogate in-process
+# ===============================================
+#
+# Per l'uso offline (portatili in deposito, analisi senza rete):
+#
+#   1. esportazione, dove il database è raggiungibile:
+#        python archivio_locale.py --dsn postgresql://... --directory dati_locali
+#   2. nei secrets dell'app, al posto di DATABASE_URL:
+#        LOCAL_DATA_DIR = "dati_locali"
+#
+# All'avvio le relazioni esportate sono caricate come tabelle in un DuckDB
+# in memoria; i loader dell'app vi eseguono le stesse query (dialetto in
+# dialetto.py, parametri tradotti da fetch_duckdb).
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # archivio locale non disponibile: solo Postgres
+    duckdb = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+# Relazioni lette dall'app. Le viste sono esportate materializzate: in
+# locale v_staffing è una tabella con le stesse colonne.
+RELAZIONI = (
+    "calendar", "roster", "roster2", "turni", "turni_giornalieri", "assenze",
+    "v_staffing", "v_depositi_organico_medio",
+)
+MANIFESTO = "manifesto.json"
+
+
+# --------------------------------------------------
+# ESPORTAZIONE DA POSTGRES
+# --------------------------------------------------
+def _come_date(table):
+    """timestamp a mezzanotte → date32 (in DuckDB tornano colonne DATE, come in Postgres)."""
+    for i, campo in enumerate(table.schema):
+        if pa.types.is_timestamp(campo.type) and campo.type.tz is None:
+            try:
+                table = table.set_column(i, campo.name, table.column(i).cast(pa.date32()))
+            except pa.ArrowInvalid:  # ha una parte oraria: resta timestamp
+                pass
+    return table
+
+
+def esporta(conn, directory: str, relazioni=RELAZIONI) -> dict:
+    """Scrive ogni relazione in `directory/<nome>.parquet`; restituisce il manifesto."""
+    from db import fetch_copy
+
+    if pq is None:
+        raise RuntimeError("pyarrow non installato: impossibile scrivere i Parquet")
+    os.makedirs(directory, exist_ok=True)
+    righe = {}
+    for nome in relazioni:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (nome,))
+            if not cur.fetchone()[0]:
+                continue
+        df = fetch_copy(conn, f"SELECT * FROM {nome}")
+        tmp = os.path.join(directory, f"{nome}.parquet.tmp")
+        pq.write_table(_come_date(pa.Table.from_pandas(df, preserve_index=False)), tmp, compression="zstd")
+        os.replace(tmp, os.path.join(directory, f"{nome}.parquet"))
+        righe[nome] = len(df)
+    manifesto = {"esportato_il": time.time(), "righe": righe}
+    with open(os.path.join(directory, MANIFESTO), "w") as f:
+        json.dump(manifesto, f, indent=2)
+    return manifesto
+
+
+# --------------------------------------------------
+# LETTURA IN-PROCESS
+# --------------------------------------------------
+class ArchivioLocale:
+    """
+    DuckDB in memoria con una tabella per ogni Parquet di `directory`.
+
+    `connection()` presta un cursore dedicato (DuckDB: un cursore per
+    thread), da usare come `with archivio.connection() as conn:`.
+    """
+
+    def __init__(self, directory: str):
+        if duckdb is None:
+            raise RuntimeError("duckdb non installato: archivio locale non disponibile")
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._con = duckdb.connect(":memory:")
+        self.tabelle = {}
+        for nome in RELAZIONI:
+            path = os.path.join(directory, f"{nome}.parquet")
+            if os.path.exists(path):
+                self._con.execute(f"CREATE TABLE {nome} AS SELECT * FROM read_parquet(?)", [path])
+                self.tabelle[nome] = self._con.execute(f"SELECT COUNT(*) FROM {nome}").fetchone()[0]
+        if not self.tabelle:
+            raise FileNotFoundError(f"Nessun Parquet dell'archivio in {directory}")
+        try:
+            with open(os.path.join(directory, MANIFESTO)) as f:
+                self.esportato_il = json.load(f).get("esportato_il")
+        except (OSError, ValueError):
+            self.esportato_il = None
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self._lock:
+            cur = self._con.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    def stato(self) -> dict:
+        return {
+            "directory": self.directory,
+            "tabelle": dict(self.tabelle),
+            "esportato_il": self.esportato_il,
+        }
+
+
+_PARAMETRO = re.compile(r"%\((\w+)\)s")
+
+
+def fetch_duckdb(conn, sql: str, params: dict = None) -> pd.DataFrame:
+    """
+    Esegue `sql` (stile psycopg2) su DuckDB e restituisce un DataFrame.
+
+    Con parametri, `%(nome)s` diventa `$nome` e `%%` torna `%`, come farebbe
+    psycopg2; i parametri non usati dalla query non vengono passati (DuckDB
+    li rifiuta). Senza parametri il testo resta invariato.
+    """
+    if params is None:
+        return conn.execute(sql).df()
+    usati = set(_PARAMETRO.findall(sql))
+    corpo = _PARAMETRO.sub(r"$\1", sql).replace("%%", "%")
+    return conn.execute(corpo, {k: v for k, v in params.items() if k in usati}).df()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Esporta le tabelle della dashboard in Parquet per l'archivio locale")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--directory", default="dati_locali")
+    args = ap.parse_args()
+    if not args.dsn:
+        ap.error("serve --dsn o DATABASE_URL")
+
+    import psycopg2
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        manifesto = esporta(conn, args.directory)
+    finally:
+        conn.close()
+    for nome, n in manifesto["righe"].items():
+        print(f"  {nome:<28} {n:>12,}")
+    print(f"\nArchivio locale in {args.directory}: impostare LOCAL_DATA_DIR = \"{args.directory}\"")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# ===============================================
+# ESTATE 2026 - BENCHMARK ESPORTAZIONI
+# esportazioni.py contro gli export costruiti per intero con pandas
+# ===============================================
+#
+# Su un frame sintetico nello schema compatto dello staffing (nessun
+# database) confronta, per tempo (mediana) e picco di memoria Python
+# (tracemalloc):
+#
+#   CSV    df.to_csv del frame formattato   vs  csv_a_blocchi
+#   Excel  pd.ExcelWriter + to_excel         vs  excel_streaming
+#   Parquet                                      parquet_streaming (con la dimensione rispetto al CSV)
+#
+# e controlla che il CSV sia identico byte per byte a quello di pandas
+# (anche con blocchi piccoli), che il workbook riletto abbia gli stessi
+# fogli, colonne e valori e che il Parquet riletto sia il frame di
+# partenza, con le date come date32 e depositi e tipi giorno a dizionario.
+# Esce con codice 1 se un controllo fallisce.
+#
+#   python benchmarks/bench_esportazioni.py [--righe 50000] [--ripetizioni 3]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from esportazioni import (  # noqa: E402
+    COLONNE_DIZIONARIO, PARQUET_DISPONIBILE, csv_a_blocchi, date_italiane, excel_streaming, parquet_streaming,
+)
+from schema import compatta  # noqa: E402
+
+DEPOSITI = ("ancona", "jesi", "osimo", "fabriano", "senigallia", "moie", "civitanova", "macerata")
+
+
+def staffing_sintetico(righe: int, seme: int = 2026) -> pd.DataFrame:
+    """Frame con le colonne di load_staffing, una riga per (giorno, deposito)."""
+    rng = np.random.default_rng(seme)
+    giorni = -(-righe // len(DEPOSITI))
+    df = pd.DataFrame({
+        "giorno": np.repeat(pd.date_range("2026-06-01", periods=giorni, freq="D"), len(DEPOSITI))[:righe],
+        "deposito": np.tile(DEPOSITI, giorni)[:righe],
+    })
+    dow = df["giorno"].dt.dayofweek
+    df["tipo_giorno"] = np.select([dow == 5, dow == 6], ["Sabato", "Domenica"], "Feriale")
+    df["totale_autisti"] = rng.integers(80, 400, righe)
+    df["assenze_programmate"] = rng.integers(0, 40, righe)
+    for c in ("assenze_previste", "infortuni", "malattie", "legge_104", "altre_assenze",
+              "congedo_parentale", "permessi_vari"):
+        df[c] = rng.gamma(2.0, 2.0, righe).round(2)
+    df.loc[rng.random(righe) < 0.01, "infortuni"] = np.nan
+    df["turni_richiesti"] = rng.integers(60, 300, righe)
+    df["disponibili_netti"] = df["totale_autisti"] - df["assenze_programmate"] - df["assenze_previste"]
+    df["gap"] = df["disponibili_netti"] - df["turni_richiesti"]
+    return compatta(df)
+
+
+def misura(fn, ripetizioni: int) -> dict:
+    """Tempo mediano (s) e picco tracemalloc (MB, su un'esecuzione a parte)."""
+    tempi = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        fn()
+        tempi.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    picco = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"s": statistics.median(tempi), "picco_mb": picco / 2**20}
+
+
+def csv_pandas(df: pd.DataFrame) -> bytes:
+    return date_italiane(df).to_csv(index=False).encode("utf-8")
+
+
+def excel_pandas(fogli: dict) -> bytes:
+    out = BytesIO()
+    with pd.ExcelWriter(out, engine="xlsxwriter") as writer:
+        for nome, df in fogli.items():
+            date_italiane(df).to_excel(writer, sheet_name=nome, index=False)
+    return out.getvalue()
+
+
+def controlli_parquet(df: pd.DataFrame) -> list:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tabella = pq.read_table(BytesIO(parquet_streaming(df, righe=7_777)))
+    errori = []
+    if tabella.schema.field("giorno").type != pa.date32():
+        errori.append(f"Parquet: giorno è {tabella.schema.field('giorno').type}, atteso date32")
+    for c in set(COLONNE_DIZIONARIO) & set(df.columns):
+        if not pa.types.is_dictionary(tabella.schema.field(c).type):
+            errori.append(f"Parquet: {c} non è a dizionario")
+    riletto = tabella.to_pandas().assign(giorno=lambda d: pd.to_datetime(d["giorno"]).astype(df["giorno"].dtype))
+    try:
+        pd.testing.assert_frame_equal(riletto, df, check_categorical=False)
+    except AssertionError as e:
+        errori.append(f"Parquet riletto diverso: {str(e).splitlines()[0]}")
+    return errori
+
+
+def controlli(df: pd.DataFrame, fogli: dict) -> list:
+    errori = []
+    atteso = csv_pandas(df)
+    for righe in (None, 7_777):
+        ottenuto = csv_a_blocchi(df, formatta=date_italiane, **({"righe": righe} if righe else {}))
+        if ottenuto != atteso:
+            errori.append(f"CSV diverso da pandas (blocchi di {righe or 'default'} righe)")
+    try:
+        a = pd.read_excel(BytesIO(excel_pandas(fogli)), sheet_name=None)
+        b = pd.read_excel(BytesIO(excel_streaming(fogli, formatta=date_italiane)), sheet_name=None)
+    except ImportError as e:   # read_excel vuole openpyxl
+        print(f"controllo Excel saltato: {e}")
+        return errori
+    if list(a) != list(b):
+        errori.append(f"fogli Excel diversi: {list(a)} / {list(b)}")
+    for nome in set(a) & set(b):
+        try:
+            pd.testing.assert_frame_equal(a[nome], b[nome], check_dtype=False)
+        except AssertionError as e:
+            errori.append(f"foglio {nome} diverso: {str(e).splitlines()[0]}")
+    return errori
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark degli export CSV/Excel/Parquet")
+    ap.add_argument("--righe", type=int, default=50_000)
+    ap.add_argument("--ripetizioni", type=int, default=3)
+    args = ap.parse_args()
+
+    df = staffing_sintetico(args.righe)
+    per_deposito = df.groupby("deposito", observed=True)[["totale_autisti", "gap"]].mean().reset_index()
+    fogli = {"Staffing": df, "Per_Deposito": per_deposito}
+    print(f"{len(df):,} righe × {len(df.columns)} colonne", flush=True)
+
+    casi = {
+        "CSV pandas":        lambda: csv_pandas(df),
+        "CSV a blocchi":     lambda: csv_a_blocchi(df, formatta=date_italiane),
+        "Excel pandas":      lambda: excel_pandas(fogli),
+        "Excel streaming":   lambda: excel_streaming(fogli, formatta=date_italiane),
+    }
+    if PARQUET_DISPONIBILE:
+        casi["Parquet"] = lambda: parquet_streaming(df)
+    risultati = pd.DataFrame({nome: misura(fn, args.ripetizioni) for nome, fn in casi.items()}).T
+    print(risultati.round(3).to_string(), flush=True)
+    if PARQUET_DISPONIBILE:
+        kb_csv = len(csv_a_blocchi(df, formatta=date_italiane)) / 1024
+        kb_parquet = len(parquet_streaming(df)) / 1024
+        print(f"CSV {kb_csv:,.0f} KB · Parquet {kb_parquet:,.0f} KB (x{kb_csv / kb_parquet:.1f})", flush=True)
+
+    errori = controlli(df, fogli) + (controlli_parquet(df) if PARQUET_DISPONIBILE else [])
+    for e in errori:
+        print("   ", e)
+    print("OK" if not errori else f"{len(errori)} CONTROLLI FALLITI", flush=True)
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == "__main__":
+    main()
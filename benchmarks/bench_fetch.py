@@ -0,0 +1,137 @@
+# ===============================================
+# ESTATE 2026 - BENCHMARK FETCH
+# pd.read_sql (tuple per riga) vs COPY ... TO STDOUT (db.fetch_copy)
+# ===============================================
+#
+# Genera una stagione sintetica in uno schema dedicato e misura il tempo di
+# caricamento delle query di dimensione "roster" con i due percorsi.
+#
+#   python benchmarks/bench_fetch.py --dsn postgresql://... [--autisti 400] [--giorni 120]
+#
+# Lo schema di prova viene eliminato alla fine (salvo --mantieni).
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import warnings
+
+import pandas as pd
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import fetch_copy  # noqa: E402
+
+SCHEMA = "bench_estate2026"
+
+DEPOSITI = ("ancona", "jesi", "osimo", "fabriano", "senigallia", "moie", "civitanova", "macerata")
+CODICI   = ("T1", "T2", "T3", "T4", "T5", "R", "FP", "AP", "PADm", "NF", "FI", "MAL", "INF")
+
+QUERY = {
+    "roster (righe)": f"""
+        SELECT data AS giorno, deposito, matricola, turno
+        FROM {SCHEMA}.roster
+        ORDER BY data, deposito, matricola
+    """,
+    "staffing (aggregato)": f"""
+        SELECT
+            r.data AS giorno, r.deposito,
+            COUNT(DISTINCT r.matricola) AS totale_autisti,
+            COUNT(*) FILTER (WHERE r.turno IN ('R','FP','AP','PADm','NF','FI')) AS assenti,
+            COUNT(*) FILTER (WHERE r.turno LIKE 'T%%') AS turni
+        FROM {SCHEMA}.roster r
+        GROUP BY r.data, r.deposito
+        ORDER BY r.data, r.deposito
+    """,
+}
+
+
+def genera_stagione(conn, autisti: int, giorni: int) -> int:
+    """Roster sintetico: `autisti` per deposito × `giorni` dal 1° giugno 2026."""
+    codici = "ARRAY[" + ",".join(f"'{c}'" for c in CODICI) + "]"
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+        cur.execute("SELECT setseed(0.2026);")
+        cur.execute(f"""
+            CREATE TABLE {SCHEMA}.roster AS
+            SELECT
+                d::date                                   AS data,
+                dep                                       AS deposito,
+                left(dep, 3) || lpad(a::text, 4, '0')     AS matricola,
+                ({codici})[1 + floor(random() * {len(CODICI)})::int] AS turno
+            FROM generate_series(DATE '2026-06-01', DATE '2026-06-01' + %(g)s - 1, INTERVAL '1 day') AS d
+            CROSS JOIN unnest(%(depositi)s::text[]) AS dep
+            CROSS JOIN generate_series(1, %(a)s) AS a;
+            ANALYZE {SCHEMA}.roster;
+        """, {"g": giorni, "a": autisti, "depositi": list(DEPOSITI)})
+        cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.roster;")
+        return cur.fetchone()[0]
+
+
+def misura(fn, ripetizioni: int) -> dict:
+    fn()  # riscaldamento (cache del server, tipi colonne)
+    tempi = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        df = fn()
+        tempi.append(time.perf_counter() - t0)
+    return {
+        "mediana_s": statistics.median(tempi),
+        "min_s": min(tempi),
+        "righe": len(df),
+        "memoria_mb": df.memory_usage(deep=True).sum() / 2**20,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--autisti", type=int, default=400, help="autisti per deposito")
+    ap.add_argument("--giorni", type=int, default=120)
+    ap.add_argument("--ripetizioni", type=int, default=5)
+    ap.add_argument("--json", help="salva i risultati in questo file")
+    ap.add_argument("--mantieni", action="store_true", help="non eliminare lo schema di prova")
+    args = ap.parse_args()
+    if not args.dsn:
+        ap.error("serve --dsn o DATABASE_URL")
+
+    warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy")
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    try:
+        righe = genera_stagione(conn, args.autisti, args.giorni)
+        print(f"Stagione sintetica: {righe:,} righe roster "
+              f"({len(DEPOSITI)} depositi × {args.autisti} autisti × {args.giorni} giorni)\n")
+
+        risultati = []
+        for nome, sql in QUERY.items():
+            percorsi = {
+                "pd.read_sql": lambda sql=sql: pd.read_sql(sql, conn),
+                "COPY": lambda sql=sql: fetch_copy(conn, sql),
+            }
+            for percorso, fn in percorsi.items():
+                risultati.append({"query": nome, "percorso": percorso, **misura(fn, args.ripetizioni)})
+
+        print(f"{'query':<22} {'percorso':<12} {'righe':>10} {'mediana':>9} {'min':>9} {'MB':>8} {'speedup':>8}")
+        base = {}
+        for r in risultati:
+            base.setdefault(r["query"], r["mediana_s"])
+            print(f"{r['query']:<22} {r['percorso']:<12} {r['righe']:>10,} "
+                  f"{r['mediana_s']:>8.3f}s {r['min_s']:>8.3f}s {r['memoria_mb']:>8.1f} "
+                  f"{base[r['query']] / r['mediana_s']:>7.2f}x")
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"righe_roster": righe, "parametri": vars(args) | {"dsn": None},
+                           "risultati": risultati}, f, indent=2)
+    finally:
+        if not args.mantieni:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
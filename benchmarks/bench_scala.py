@@ -0,0 +1,193 @@
+# ===============================================
+# ESTATE 2026 - BENCHMARK DI SCALA
+# La dashboard vera su stagioni sintetiche di dimensione crescente
+# ===============================================
+#
+# Per ogni punto di scala genera la stagione (benchmarks/stagione.py) ed
+# esegue app.py con streamlit.testing come sessione admin: la traccia dei
+# tempi (perf.py) fornisce gli span di loader, pipeline filtri, simulazione
+# ferie, tab e grafici. Ogni ripetizione parte a freddo (cache Streamlit e
+# snapshot svuotati) e percorre:
+#
+#   avvio  → ferie (simulazione +10gg attiva) → ogni tab/sotto-tab
+#
+#   python benchmarks/bench_scala.py [--dsn ...] [--scale base anno] --json risultati.json
+#   python benchmarks/bench_scala.py --json nuovo.json --confronta risultati.json
+#
+# Il report JSON contiene mediane per (scala, fase, span) e si confronta
+# con un report precedente (--confronta) span per span.
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import pandas as pd
+import psycopg2
+
+QUI = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(QUI, "..", "app.py")
+sys.path.insert(0, QUI)
+from stagione import SCHEMA, Scala, dsn_locale, dsn_schema, genera  # noqa: E402
+
+SCALE = {
+    "base":         Scala(depositi=6,  autisti=40,  giorni=92),
+    "anno":         Scala(depositi=6,  autisti=40,  giorni=365),
+    "50_depositi":  Scala(depositi=50, autisti=40,  giorni=92),
+    "5000_autisti": Scala(depositi=10, autisti=500, giorni=92),
+    "completo":     Scala(depositi=50, autisti=100, giorni=365),
+}
+SCALE_PREDEFINITE = ("base", "anno", "50_depositi", "5000_autisti")
+
+# Viste percorse dopo l'avvio: (tab principale, sotto-tab di Analisi)
+VISTE = (
+    ("📊 Overview", None),
+    ("📈 Analisi & Assenze", "📉 Gap & Waterfall"),
+    ("📈 Analisi & Assenze", "🏖️ Ferie & Riposi"),
+    ("📈 Analisi & Assenze", "🤒 Assenze Complete"),
+    ("🚌 Turni Calendario", None),
+    ("🎯 Depositi", None),
+    ("📥 Export", None),
+    ("🔄 Confronto & Assunzioni", None),
+)
+
+TIMEOUT_RUN = 600  # secondi per singolo rerun (scala "completo")
+
+
+def _spans(at, scala: str, ripetizione: int, fase: str) -> list:
+    if at.exception:
+        raise RuntimeError(f"{scala}/{fase}: {at.exception[0].value}")
+    traccia = at.session_state["traccia"]
+    return [
+        {"scala": scala, "ripetizione": ripetizione, "fase": fase, **rec}
+        for rec in traccia.ultimo
+    ]
+
+
+def sessione(dsn: str, scala: str, ripetizione: int) -> list:
+    """Una sessione admin a freddo su tutte le fasi; restituisce gli span di ogni rerun."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_data.clear()
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT_RUN)
+    at.secrets["DATABASE_URL"] = dsn
+    at.secrets["APP_PASSWORD"] = "bench"
+    at.session_state["password_correct"] = True
+    at.session_state["is_admin"] = True
+    at.session_state["splash_done"] = True
+
+    righe = _spans(at.run(), scala, ripetizione, "avvio")
+    ferie = next(c for c in at.sidebar.checkbox if "ferie" in c.label)
+    righe += _spans(ferie.check().run(), scala, ripetizione, "ferie")
+    for tab, sotto in VISTE:
+        at.session_state["tab_principale"] = tab
+        if sotto:
+            at.session_state["tab_analisi"] = sotto
+        righe += _spans(at.run(), scala, ripetizione, f"vista:{sotto or tab}")
+    return righe
+
+
+def riepilogo(righe: list) -> pd.DataFrame:
+    df = pd.DataFrame(righe)
+    return (
+        df.groupby(["scala", "fase", "span"], sort=False)
+        .agg(n=("ms", "size"), mediana_ms=("ms", "median"), max_ms=("ms", "max"),
+             righe=("righe", "max"), byte=("byte", "max"))
+        .reset_index()
+    )
+
+
+def confronta(attuale: pd.DataFrame, precedente: pd.DataFrame) -> pd.DataFrame:
+    chiave = ["scala", "fase", "span"]
+    m = attuale.merge(precedente[chiave + ["mediana_ms"]], on=chiave, how="left", suffixes=("", "_prima"))
+    m["rapporto"] = m["mediana_ms"] / m["mediana_ms_prima"]
+    return m
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=QUI,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark di scala della dashboard")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    ap.add_argument("--scale", nargs="+", choices=SCALE, default=SCALE_PREDEFINITE)
+    ap.add_argument("--ripetizioni", type=int, default=3)
+    ap.add_argument("--json", help="salva il report in questo file")
+    ap.add_argument("--confronta", help="report JSON precedente da confrontare")
+    ap.add_argument("--mantieni", action="store_true", help="non eliminare lo schema di prova")
+    args = ap.parse_args()
+
+    warnings.filterwarnings("ignore")
+    from streamlit import config, logger
+    config.set_option("logger.level", "error")  # avvisi di bare mode/deprecazione a ogni rerun
+    logger.set_log_level(logging.ERROR)
+    dsn = args.dsn or dsn_locale()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+
+    # Snapshot dell'app in una directory usa e getta, svuotata a ogni ripetizione
+    snapshot_dir = tempfile.mkdtemp(prefix="estate2026_snap_")
+    os.environ["ESTATE2026_SNAPSHOT_DIR"] = snapshot_dir
+
+    righe, generazione = [], {}
+    try:
+        for nome in args.scale:
+            scala = SCALE[nome]
+            t0 = time.perf_counter()
+            conteggi = genera(conn, scala)
+            generazione[nome] = {"scala": scala._asdict(), "righe": conteggi,
+                                 "generazione_s": time.perf_counter() - t0}
+            print(f"[{nome}] {scala}: {conteggi['roster']:,} righe roster "
+                  f"(generate in {generazione[nome]['generazione_s']:.1f}s)", flush=True)
+            for r in range(args.ripetizioni):
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                os.makedirs(snapshot_dir)
+                righe += sessione(dsn_schema(dsn), nome, r)
+    finally:
+        if not args.mantieni:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.close()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    report = riepilogo(righe)
+    principali = report[
+        report["span"].str.match(r"rerun$|loader\.|filtri$|ferie\.|grafico\.|tab\.")
+        & ~(report["span"].str.startswith("tab.") & (report["max_ms"] < 0.1))  # tab non aperti
+    ]
+    if args.confronta:
+        with open(args.confronta) as f:
+            precedente = pd.DataFrame(json.load(f)["riepilogo"])
+        principali = confronta(principali, precedente)
+    with pd.option_context("display.max_rows", None, "display.width", 200, "display.float_format", "{:,.1f}".format):
+        for nome, df in principali.groupby("scala", sort=False):
+            print(f"\n── {nome} " + "─" * 60)
+            print(df.drop(columns="scala").to_string(index=False))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "eseguito_il": dt.datetime.now().isoformat(timespec="seconds"),
+                "commit": _commit(),
+                "ripetizioni": args.ripetizioni,
+                "scale": generazione,
+                "riepilogo": report.astype(object).where(report.notna(), None).to_dict(orient="records"),
+                "span": righe,
+            }, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# ===============================================
+# ESTATE 2026 - CONFRONTO ARCHIVIO LOCALE vs POSTGRES
+# Stesse metriche e stessi dati dei grafici con i due motori
+# ===============================================
+#
+# Genera la stagione sintetica (benchmarks/stagione.py), la esporta con
+# archivio_locale.esporta ed esegue app.py con streamlit.testing due
+# volte per scenario di filtro: con DATABASE_URL sullo schema generato e
+# con LOCAL_DATA_DIR sull'archivio. Per ogni vista (tab e sotto-tab)
+# raccoglie eccezioni, metriche e i dati delle tracce Plotly; esce con
+# codice 1 se almeno uno scenario differisce.
+#
+#   python benchmarks/confronto_locale.py [--dsn ...] [--giorni 60] [--scenari base ferie]
+
+import argparse
+import base64
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+import psycopg2
+
+QUI = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(QUI, "..", "app.py")
+sys.path.insert(0, QUI)
+from bench_scala import VISTE  # noqa: E402
+from stagione import SCHEMA, Scala, dsn_locale, dsn_schema, genera  # noqa: E402
+
+# Scenari di filtro: (depositi, periodo, simulazione ferie). depositi e
+# periodo None = i default della sidebar; 2 = i primi due depositi / 7 giorni.
+SCENARI = {
+    "base":            (None, None, False),
+    "ristretto":       (2,    7,    False),
+    "ferie":           (None, None, True),
+    "ferie_ristretto": (2,    None, True),
+}
+
+TIMEOUT_RUN = 300
+
+
+def _valori(v):
+    """bdata Plotly → liste di float arrotondati (conta il valore, non il dtype)."""
+    if isinstance(v, dict) and "bdata" in v:
+        a = np.frombuffer(base64.b64decode(v["bdata"]), dtype=v["dtype"])
+        if "shape" in v:
+            a = a.reshape([int(x) for x in str(v["shape"]).split(",")])
+        return _valori(a.astype(float).tolist())
+    if isinstance(v, list):
+        return [_valori(x) for x in v]
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return round(float(v), 6)
+    return v
+
+
+def _raccogli(at, vista: str, out: dict) -> None:
+    out["eccezioni"] += [f"{vista}: {e.value}" for e in at.exception]
+    out["metriche"] |= {f"{vista} | {m.label} = {m.value} ({m.delta})" for m in at.metric}
+    for i, c in enumerate(at.get("plotly_chart")):
+        for j, t in enumerate(json.loads(c.proto.spec).get("data", [])):
+            dati = {k: _valori(t.get(k)) for k in ("x", "y", "z", "values", "labels", "text", "r")}
+            impronta = hashlib.md5(json.dumps(dati, sort_keys=True, default=str).encode()).hexdigest()
+            out["tracce"][f"{vista} | grafico {i} traccia {j} ({t.get('type')}, {t.get('name')})"] = impronta
+
+
+def sessione(secrets: dict, scenario: tuple, app: str = APP) -> dict:
+    """Una sessione a freddo su tutte le viste; restituisce eccezioni, metriche e impronte delle tracce."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    at = AppTest.from_file(app, default_timeout=TIMEOUT_RUN)
+    for k, v in secrets.items():
+        at.secrets[k] = v
+    at.secrets["APP_PASSWORD"] = "confronto"
+    at.session_state["password_correct"] = True
+    at.session_state["splash_done"] = True
+    at.run()
+
+    depositi, giorni, ferie = scenario
+    if depositi:
+        sel = at.sidebar.multiselect[0]
+        sel.set_value(sorted(sel.options)[:depositi]).run()
+    if giorni:
+        dal = at.sidebar.date_input[0].value[0]
+        at.sidebar.date_input[0].set_value((dal, dal + dt.timedelta(days=giorni - 1))).run()
+    if ferie:
+        next(c for c in at.sidebar.checkbox if "ferie" in c.label).check().run()
+
+    out = {"eccezioni": [], "metriche": set(), "tracce": {}}
+    for tab, sotto in VISTE:
+        at.session_state["tab_principale"] = tab
+        if sotto:
+            at.session_state["tab_analisi"] = sotto
+        _raccogli(at.run(), sotto or tab, out)
+    return out
+
+
+def differenze(a: dict, b: dict, nomi: tuple = ("postgres", "locale")) -> list:
+    diff = [f"eccezione ({nomi[1]}): {e}" for e in b["eccezioni"]]
+    diff += [f"eccezione ({nomi[0]}): {e}" for e in a["eccezioni"]]
+    diff += [f"solo {nomi[0]}: {m}" for m in sorted(a["metriche"] - b["metriche"])]
+    diff += [f"solo {nomi[1]}: {m}" for m in sorted(b["metriche"] - a["metriche"])]
+    for chiave in sorted(a["tracce"].keys() | b["tracce"].keys()):
+        if a["tracce"].get(chiave) != b["tracce"].get(chiave):
+            diff.append(f"traccia diversa: {chiave}")
+    return diff
+
+
+def main() -> None:
+    predefinita = Scala(giorni=60)
+    ap = argparse.ArgumentParser(description="Confronta la dashboard su Postgres e sull'archivio locale DuckDB")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    ap.add_argument("--depositi", type=int, default=predefinita.depositi)
+    ap.add_argument("--autisti", type=int, default=predefinita.autisti)
+    ap.add_argument("--giorni", type=int, default=predefinita.giorni)
+    ap.add_argument("--scenari", nargs="+", choices=SCENARI, default=list(SCENARI))
+    ap.add_argument("--mantieni", action="store_true", help="non eliminare schema e archivio di prova")
+    args = ap.parse_args()
+
+    sys.path.insert(0, os.path.join(QUI, ".."))
+    from archivio_locale import esporta
+
+    warnings.filterwarnings("ignore")
+    from streamlit import config, logger
+    config.set_option("logger.level", "error")
+    logger.set_log_level(logging.ERROR)
+    dsn = args.dsn or dsn_locale()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+
+    archivio = tempfile.mkdtemp(prefix="estate2026_locale_")
+    snapshot_dir = tempfile.mkdtemp(prefix="estate2026_snap_")
+    os.environ["ESTATE2026_SNAPSHOT_DIR"] = snapshot_dir
+    esito = 0
+    try:
+        scala = Scala(args.depositi, args.autisti, args.giorni)
+        genera(conn, scala)
+        with psycopg2.connect(dsn_schema(dsn)) as conn_schema:
+            esporta(conn_schema, archivio)
+        print(f"Stagione {scala} · archivio in {archivio}", flush=True)
+
+        for nome in args.scenari:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            os.makedirs(snapshot_dir)
+            pg = sessione({"DATABASE_URL": dsn_schema(dsn)}, SCENARI[nome])
+            locale = sessione({"LOCAL_DATA_DIR": archivio}, SCENARI[nome])
+            diff = differenze(pg, locale)
+            print(f"[{nome}] {'IDENTICO' if not diff else f'{len(diff)} DIFFERENZE'} · "
+                  f"{len(pg['metriche'])} metriche, {len(pg['tracce'])} tracce", flush=True)
+            for d in diff[:20]:
+                print("   ", d)
+            esito = esito or bool(diff)
+    finally:
+        if not args.mantieni:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            shutil.rmtree(archivio, ignore_errors=True)
+        conn.close()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    sys.exit(esito)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# ===============================================
+# ESTATE 2026 - CONFRONTO TRA DUE VERSIONI DELL'APP
+# Stesse metriche e stessi dati dei grafici prima e dopo una modifica
+# ===============================================
+#
+# Estrae il commit di riferimento (e l'eventuale secondo commit) in un
+# worktree temporaneo (git worktree add), genera la stagione sintetica
+# (benchmarks/stagione.py) ed esegue app.py del riferimento e del secondo
+# commit, o dell'albero corrente, sugli stessi dati, per
+# ogni scenario di filtro di confronto_locale.py e su tutte le viste.
+# Ogni sessione gira in un processo a sé, con i moduli della propria
+# versione. Esce con codice 1 se almeno uno scenario differisce.
+#
+# Il riferimento deve avere i tab pigri (session_state "tab_principale"
+# e "tab_analisi"), come l'albero corrente.
+#
+#   python benchmarks/confronto_versioni.py HEAD~1 [--dsn ...] [--scenari base ferie]
+#   python benchmarks/confronto_versioni.py abc123~1 abc123   # prima e dopo un commit
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
+
+import psycopg2
+
+QUI = os.path.dirname(os.path.abspath(__file__))
+RADICE = os.path.dirname(QUI)
+sys.path.insert(0, QUI)
+from confronto_locale import SCENARI, differenze, sessione  # noqa: E402
+from stagione import SCHEMA, Scala, dsn_locale, dsn_schema, genera  # noqa: E402
+
+TIMEOUT_SESSIONE = 1800
+
+
+def _sessione_figlia(radice: str, uscita: str, dsn: str, scenario: str) -> None:
+    """Nel processo figlio: una sessione dell'app in `radice`, risultato in JSON su `uscita`."""
+    sys.path.insert(0, radice)
+    warnings.filterwarnings("ignore")
+    from streamlit import config, logger
+    config.set_option("logger.level", "error")
+    logger.set_log_level(logging.ERROR)
+    out = sessione({"DATABASE_URL": dsn}, SCENARI[scenario], app=os.path.join(radice, "app.py"))
+    with open(uscita, "w") as f:
+        json.dump({**out, "metriche": sorted(out["metriche"])}, f)
+
+
+def estrai(rif: str) -> str:
+    """Worktree temporaneo (staccato) del commit `rif`."""
+    percorso = tempfile.mkdtemp(prefix="estate2026_rif_")
+    subprocess.run(["git", "-C", RADICE, "worktree", "add", "--detach", "-f", percorso, rif],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return percorso
+
+
+def esegui(radice: str, dsn: str, scenario: str) -> dict:
+    """Sessione a freddo (cache e snapshot vuoti) dell'app in `radice`, in un processo separato."""
+    snapshot_dir = tempfile.mkdtemp(prefix="estate2026_snap_")
+    fd, uscita = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        figlio = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--figlio", radice, uscita, "--dsn", dsn, "--scenari", scenario],
+            env={**os.environ, "ESTATE2026_SNAPSHOT_DIR": snapshot_dir},
+            cwd=radice, timeout=TIMEOUT_SESSIONE, capture_output=True, text=True,
+        )
+        if figlio.returncode:
+            raise RuntimeError(f"sessione di {radice} fallita:\n{figlio.stderr[-2000:]}")
+        with open(uscita) as f:
+            out = json.load(f)
+    finally:
+        os.remove(uscita)
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    out["metriche"] = set(out["metriche"])
+    return out
+
+
+def main() -> None:
+    predefinita = Scala(giorni=60)
+    ap = argparse.ArgumentParser(description="Confronta la dashboard tra due commit, o tra un commit e l'albero corrente")
+    ap.add_argument("rif", nargs="?", default="HEAD", help="commit di riferimento (default: HEAD)")
+    ap.add_argument("contro", nargs="?", help="commit da confrontare (default: l'albero corrente)")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    ap.add_argument("--depositi", type=int, default=predefinita.depositi)
+    ap.add_argument("--autisti", type=int, default=predefinita.autisti)
+    ap.add_argument("--giorni", type=int, default=predefinita.giorni)
+    ap.add_argument("--scenari", nargs="+", choices=SCENARI, default=list(SCENARI))
+    ap.add_argument("--mantieni", action="store_true", help="non eliminare lo schema di prova")
+    ap.add_argument("--figlio", nargs=2, metavar=("RADICE", "USCITA"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    dsn = args.dsn or dsn_locale()
+    if args.figlio:
+        _sessione_figlia(*args.figlio, dsn, args.scenari[0])
+        return
+
+    worktree = {rif: estrai(rif) for rif in (args.rif, args.contro) if rif}
+    radici = (worktree[args.rif], worktree.get(args.contro, RADICE))
+    nomi = (args.rif, args.contro or "corrente")
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    esito = 0
+    try:
+        scala = Scala(args.depositi, args.autisti, args.giorni)
+        genera(conn, scala)
+        print(f"Stagione {scala} · {nomi[0]} contro {nomi[1]}", flush=True)
+        for nome in args.scenari:
+            prima = esegui(radici[0], dsn_schema(dsn), nome)
+            dopo = esegui(radici[1], dsn_schema(dsn), nome)
+            diff = differenze(prima, dopo, nomi=nomi)
+            print(f"[{nome}] {'IDENTICO' if not diff else f'{len(diff)} DIFFERENZE'} · "
+                  f"{len(dopo['metriche'])} metriche, {len(dopo['tracce'])} tracce", flush=True)
+            for d in diff[:20]:
+                print("   ", d)
+            esito = esito or bool(diff)
+    finally:
+        if not args.mantieni:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.close()
+        for percorso in worktree.values():
+            subprocess.run(["git", "-C", RADICE, "worktree", "remove", "--force", percorso],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(percorso, ignore_errors=True)
+    sys.exit(esito)
+
+
+if __name__ == "__main__":
+    main()
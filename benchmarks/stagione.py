@@ -0,0 +1,288 @@
+# ===============================================
+# ESTATE 2026 - GENERATORE STAGIONE SINTETICA
+# Schema completo interrogato dalla dashboard, a scala configurabile
+# ===============================================
+#
+# Crea in uno schema dedicato le tabelle e le viste lette da app.py:
+#
+#   calendar, roster, roster2, turni, turni_giornalieri, assenze,
+#   v_staffing, v_depositi_organico_medio
+#
+# Il contenuto dipende solo da (scala, seme): ogni valore "casuale" è un
+# hash md5 della sua chiave (matricola, giorno, ...), quindi due generazioni
+# con gli stessi parametri sono identiche riga per riga, qualunque sia il
+# piano di esecuzione scelto da Postgres.
+#
+#   python benchmarks/stagione.py --depositi 50 --autisti 100 --giorni 365
+#
+# Senza --dsn (né DATABASE_URL) si usa un Postgres locale di pgserver, se
+# installato. L'app si punta sullo schema generato con il search_path:
+#
+#   DATABASE_URL = "postgresql://...?options=-csearch_path%3Dstagione_sintetica"
+
+import argparse
+import datetime as dt
+import os
+import tempfile
+from typing import NamedTuple
+from urllib.parse import quote
+
+import psycopg2
+
+try:
+    import pgserver
+except ImportError:  # serve allora un --dsn esplicito
+    pgserver = None
+
+
+SCHEMA = "stagione_sintetica"
+INIZIO = dt.date(2026, 6, 1)
+
+# I primi depositi hanno nomi reali (la simulazione ferie usa "ancona");
+# oltre, nomi numerati.
+NOMI_DEPOSITI = (
+    "ancona", "jesi", "osimo", "fabriano", "senigallia", "moie", "civitanova",
+    "macerata", "filottrano", "falconara", "recanati", "loreto",
+)
+
+# Quote giornaliere dei codici di assenza nominale (il resto lavora su T1..T5).
+# R è il riposo settimanale a rotazione e FP il blocco di ferie estive:
+# entrambi sono assegnati a parte.
+QUOTE_ASSENZE = (("AP", 0.010), ("PADm", 0.005), ("NF", 0.010), ("FI", 0.005), ("PS", 0.020))
+GIORNI_FERIE = 14
+SPOSTAMENTO_ROSTER2 = 7  # roster2 = stesso piano con le ferie spostate di una settimana
+
+# Turni da coprire per autista in organico, per validità del codice turno
+TURNI_PER_AUTISTA = {"Lu-Ve": 0.70, "Sa": 0.55, "Do": 0.40}
+
+
+class Scala(NamedTuple):
+    depositi: int = 6
+    autisti: int = 40       # per deposito
+    giorni: int = 92        # dal 1° giugno 2026
+    seme: int = 2026
+
+    @property
+    def righe_roster(self) -> int:
+        return self.depositi * self.autisti * self.giorni
+
+    def __str__(self) -> str:
+        return f"{self.depositi} depositi × {self.autisti} autisti × {self.giorni} giorni"
+
+
+def nomi_depositi(n: int) -> list:
+    return list(NOMI_DEPOSITI[:n]) + [f"deposito{i:02d}" for i in range(len(NOMI_DEPOSITI) + 1, n + 1)]
+
+
+def dsn_schema(dsn: str, schema: str = SCHEMA) -> str:
+    """DSN con search_path sullo schema generato (per DATABASE_URL dell'app)."""
+    opzione = quote(f"-csearch_path={schema}")
+    return f"{dsn}{'&' if '?' in dsn else '?'}options={opzione}"
+
+
+def dsn_locale(directory: str = None) -> str:
+    """Avvia (o riusa) un Postgres locale con pgserver e ne restituisce il DSN."""
+    if pgserver is None:
+        raise RuntimeError("pgserver non installato: passare --dsn o impostare DATABASE_URL")
+    directory = directory or os.path.join(tempfile.gettempdir(), "estate2026_pg")
+    return pgserver.get_server(directory, cleanup_mode=None).get_uri()
+
+
+def genera(conn, scala: Scala = Scala(), schema: str = SCHEMA) -> dict:
+    """(Ri)crea `schema` con la stagione sintetica; restituisce le righe per tabella."""
+    fine = INIZIO + dt.timedelta(days=scala.giorni - 1)
+    p = {
+        "inizio": INIZIO, "fine": fine, "autisti": scala.autisti, "seme": str(scala.seme),
+        "depositi": nomi_depositi(scala.depositi), "giorni_ferie": GIORNI_FERIE,
+        "finestra_ferie": max(scala.giorni - GIORNI_FERIE, 1), "spostamento": SPOSTAMENTO_ROSTER2,
+    }
+    soglie, cumulata = [], 0.0
+    for codice, quota in QUOTE_ASSENZE:
+        cumulata += quota
+        soglie.append(f"WHEN u(%(seme)s || m.matricola || d.data) < {cumulata} THEN '{codice}'")
+    assenza = "\n                    ".join(soglie)
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}; SET search_path TO {schema};")
+        # uniforme in [0, 1) dalla chiave: deterministica e indipendente dall'ordine delle righe
+        cur.execute("""
+            CREATE FUNCTION u(chiave text) RETURNS double precision
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE
+            AS $$ SELECT ('x' || substr(md5(chiave), 1, 8))::bit(32)::bigint / 4294967296.0 $$;
+        """)
+
+        # ── calendario: daytype senza accento (come la tabella assenze) ──
+        cur.execute("""
+            CREATE TABLE calendar (data date PRIMARY KEY, daytype text NOT NULL);
+            INSERT INTO calendar
+            SELECT d::date, (ARRAY['lunedi','martedi','mercoledi','giovedi','venerdi','sabato','domenica'])
+                            [EXTRACT(ISODOW FROM d)::int]
+            FROM generate_series(%(inizio)s::date, %(fine)s::date, INTERVAL '1 day') AS d;
+        """, p)
+
+        # ── anagrafica autisti: giorno di riposo e inizio del blocco ferie ──
+        cur.execute("""
+            CREATE TEMP TABLE autisti AS
+            SELECT
+                dep AS deposito,
+                left(dep, 3) || lpad(a::text, 4, '0')                          AS matricola,
+                a %% 7                                                         AS turno_riposo,
+                floor(u(%(seme)s || dep || a) * %(finestra_ferie)s)::int          AS inizio_ferie
+            FROM unnest(%(depositi)s::text[]) AS dep
+            CROSS JOIN generate_series(1, %(autisti)s) AS a;
+        """, p)
+
+        # ── roster e roster2 (ferie spostate): stessi codici salvo il blocco FP ──
+        for tabella, spostamento in (("roster", 0), ("roster2", SPOSTAMENTO_ROSTER2)):
+            cur.execute(f"""
+                CREATE TABLE {tabella} (
+                    id bigserial PRIMARY KEY, data date NOT NULL, deposito text NOT NULL,
+                    matricola text NOT NULL, turno text, daytype text
+                );
+                INSERT INTO {tabella} (data, deposito, matricola, turno, daytype)
+                SELECT
+                    d.data, m.deposito, m.matricola,
+                    CASE
+                    WHEN (d.data - %(inizio)s::date) - m.inizio_ferie - {spostamento}
+                         BETWEEN 0 AND %(giorni_ferie)s - 1 THEN 'FP'
+                    WHEN (d.data - %(inizio)s::date) %% 7 = m.turno_riposo THEN 'R'
+                    {assenza}
+                    ELSE 'T' || (1 + floor(u(%(seme)s || 't' || m.matricola || d.data) * 5))::int
+                    END,
+                    (ARRAY['lunedì','martedì','mercoledì','giovedì','venerdì','sabato','domenica'])
+                        [EXTRACT(ISODOW FROM d.data)::int]
+                FROM calendar d CROSS JOIN autisti m
+                ORDER BY d.data, m.deposito, m.matricola;
+            """, p)
+
+        # ── turni: codici per deposito e validità, attivi su tutto il periodo ──
+        cur.execute("""
+            CREATE TABLE turni (
+                id bigserial PRIMARY KEY, deposito text NOT NULL, codice_turno text NOT NULL,
+                valid text NOT NULL, dal date NOT NULL, al date NOT NULL
+            );
+            INSERT INTO turni (deposito, codice_turno, valid, dal, al)
+            SELECT dep, upper(left(dep, 2)) || left(v.valid, 1) || lpad(k::text, 3, '0'),
+                   v.valid, %(inizio)s, %(fine)s
+            FROM unnest(%(depositi)s::text[]) AS dep
+            CROSS JOIN (VALUES ('Lu-Ve', %(lv)s), ('Sa', %(sa)s), ('Do', %(do)s)) AS v(valid, quota)
+            CROSS JOIN LATERAL generate_series(
+                1, greatest(round(%(autisti)s * v.quota * (0.9 + 0.2 * u(%(seme)s || dep || v.valid)))::int, 1)
+            ) AS k;
+        """, {**p, "lv": TURNI_PER_AUTISTA["Lu-Ve"], "sa": TURNI_PER_AUTISTA["Sa"], "do": TURNI_PER_AUTISTA["Do"]})
+
+        # ── turni_giornalieri: codici espansi per data secondo la validità ──
+        cur.execute("""
+            CREATE TABLE turni_giornalieri (
+                id bigserial PRIMARY KEY, data date NOT NULL, deposito text NOT NULL, codice_turno text NOT NULL
+            );
+            INSERT INTO turni_giornalieri (data, deposito, codice_turno)
+            SELECT c.data, t.deposito, t.codice_turno
+            FROM calendar c
+            JOIN turni t
+              ON t.valid = CASE c.daytype WHEN 'sabato' THEN 'Sa' WHEN 'domenica' THEN 'Do' ELSE 'Lu-Ve' END
+             AND c.data BETWEEN t.dal AND t.al
+            ORDER BY c.data, t.deposito, t.codice_turno;
+        """)
+
+        # ── assenze statistiche: medie storiche per deposito e daytype ──
+        cur.execute("""
+            CREATE TABLE assenze (
+                deposito text NOT NULL, daytype text NOT NULL,
+                infortuni numeric, malattie numeric, legge_104 numeric,
+                altre_assenze numeric, congedo_parentale numeric, permessi_vari numeric
+            );
+            INSERT INTO assenze
+            SELECT dep, dt,
+                round((%(autisti)s * 0.004 * u(%(seme)s || dep || dt || 'inf'))::numeric, 2),
+                round((%(autisti)s * 0.030 * u(%(seme)s || dep || dt || 'mal'))::numeric, 2),
+                round((%(autisti)s * 0.010 * u(%(seme)s || dep || dt || '104'))::numeric, 2),
+                round((%(autisti)s * 0.006 * u(%(seme)s || dep || dt || 'alt'))::numeric, 2),
+                round((%(autisti)s * 0.005 * u(%(seme)s || dep || dt || 'cp'))::numeric, 2),
+                round((%(autisti)s * 0.008 * u(%(seme)s || dep || dt || 'pv'))::numeric, 2)
+            FROM unnest(%(depositi)s::text[]) AS dep
+            CROSS JOIN unnest(ARRAY['lunedi','martedi','mercoledi','giovedi','venerdi','sabato','domenica']) AS dt;
+        """, p)
+
+        cur.execute(VISTE)
+        cur.execute("""
+            CREATE INDEX ON roster (data, deposito);
+            CREATE INDEX ON roster2 (data, deposito);
+            CREATE INDEX ON turni_giornalieri (data, deposito);
+            ANALYZE;
+            DROP TABLE autisti;
+            RESET search_path;
+        """)
+        conteggi = {}
+        for tabella in ("calendar", "roster", "roster2", "turni", "turni_giornalieri", "assenze"):
+            cur.execute(f"SELECT COUNT(*) FROM {schema}.{tabella};")
+            conteggi[tabella] = cur.fetchone()[0]
+    return conteggi
+
+
+# Viste con le stesse colonne di quelle di produzione
+VISTE = """
+    CREATE VIEW v_staffing AS
+    WITH organico AS (
+        SELECT data, deposito,
+               COUNT(DISTINCT matricola)                                            AS totale,
+               COUNT(*) FILTER (WHERE turno IN ('R','FP','AP','PADm','NF','FI'))    AS programmate
+        FROM roster GROUP BY data, deposito
+    ), richiesti AS (
+        SELECT data, deposito, COUNT(*) AS turni FROM turni_giornalieri GROUP BY data, deposito
+    ), stat AS (
+        SELECT deposito, daytype, infortuni, malattie, legge_104, altre_assenze, congedo_parentale, permessi_vari,
+               COALESCE(infortuni + malattie + legge_104 + altre_assenze + congedo_parentale + permessi_vari, 0) AS totale
+        FROM assenze
+    )
+    SELECT
+        o.data                                   AS giorno,
+        c.daytype                                AS tipo_giorno,
+        o.deposito,
+        o.totale                                 AS totale_autisti,
+        o.programmate                            AS assenze_programmate,
+        o.programmate + COALESCE(s.totale, 0)    AS assenze_previste,
+        s.infortuni, s.malattie, s.legge_104, s.altre_assenze, s.congedo_parentale, s.permessi_vari,
+        COALESCE(t.turni, 0)                     AS turni_richiesti,
+        o.totale - o.programmate - COALESCE(s.totale, 0)                          AS disponibili_netti,
+        o.totale - o.programmate - COALESCE(s.totale, 0) - COALESCE(t.turni, 0)   AS gap
+    FROM organico o
+    JOIN calendar c        ON c.data = o.data
+    LEFT JOIN stat s       ON s.deposito = o.deposito AND s.daytype = c.daytype
+    LEFT JOIN richiesti t  ON t.data = o.data AND t.deposito = o.deposito;
+
+    CREATE VIEW v_depositi_organico_medio AS
+    SELECT deposito,
+           COUNT(DISTINCT data)                                         AS giorni_attivi,
+           ROUND(COUNT(*)::numeric / NULLIF(COUNT(DISTINCT data), 0), 1) AS dipendenti_medi_giorno
+    FROM roster GROUP BY deposito;
+"""
+
+
+def main() -> None:
+    predefinita = Scala()
+    ap = argparse.ArgumentParser(description="Genera la stagione sintetica nello schema " + SCHEMA)
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    ap.add_argument("--schema", default=SCHEMA)
+    ap.add_argument("--depositi", type=int, default=predefinita.depositi)
+    ap.add_argument("--autisti", type=int, default=predefinita.autisti, help="autisti per deposito")
+    ap.add_argument("--giorni", type=int, default=predefinita.giorni)
+    ap.add_argument("--seme", type=int, default=predefinita.seme)
+    args = ap.parse_args()
+
+    dsn = args.dsn or dsn_locale()
+    scala = Scala(args.depositi, args.autisti, args.giorni, args.seme)
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        conteggi = genera(conn, scala, args.schema)
+    finally:
+        conn.close()
+    print(f"Stagione sintetica ({scala}) nello schema {args.schema}:")
+    for tabella, n in conteggi.items():
+        print(f"  {tabella:<18} {n:>12,}")
+    print(f"\nDATABASE_URL per l'app:\n  {dsn_schema(dsn, args.schema)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# ===============================================
+# ESTATE 2026 - VERIFICA GRIGLIA CODICI TURNO
+# Quante celle finiscono nel DOM con un catalogo grande
+# ===============================================
+#
+# Costruisce con griglia.html_griglia_codici la pagina dell'esploratore per
+# un catalogo sintetico ed esegue il suo script con node, su un DOM minimo
+# (solo gli elementi e le proprietà che lo script usa). Controlla che:
+#
+#   - all'apertura, dopo uno scroll e con un filtro di prefisso, nel DOM ci
+#     siano solo le righe della finestra visibile (più il margine);
+#   - il KPI conti tutti i codici del deposito scelto, e quelli filtrati.
+#
+# Esce con codice 1 se un controllo fallisce, 2 se node non è installato.
+#
+#   python benchmarks/verifica_griglia.py [--codici 3000] [--depositi 6]
+
+import argparse
+import datetime as dt
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from griglia import ALTEZZA_GRIGLIA, ALTEZZA_RIGA, LARGHEZZA_CELLA, html_griglia_codici  # noqa: E402
+
+LARGHEZZA_VISTA = 900   # px simulati dell'iframe
+
+# DOM minimo: getElementById, innerHTML, style, dimensioni, eventi. Lo
+# script della pagina è incollato al posto di __SCRIPT__; alla fine si
+# stampano le misure come JSON.
+_NODE = """
+const el = {};
+function elemento(id) {
+  return el[id] = el[id] || {
+    id, innerHTML: "", style: {}, value: "", options: [], scrollTop: 0, listeners: {},
+    clientWidth: __LARGHEZZA__, clientHeight: __ALTEZZA__ - 56,
+    add(o) { this.options.push(o); if (!this.value) this.value = o.value; },
+    addEventListener(tipo, fn) { this.listeners[tipo] = fn; },
+  };
+}
+global.document = { getElementById: elemento };
+global.Option = function (testo, valore) { this.text = testo; this.value = valore; };
+global.ResizeObserver = function () { this.observe = () => {}; };
+global.requestAnimationFrame = fn => fn();
+
+__SCRIPT__
+
+const contaCelle = () => (el.spazio.innerHTML.match(/class="cella"/g) || []).length;
+const contaRighe = () => (el.spazio.innerHTML.match(/class="riga/g) || []).length;
+const misure = {apertura: {celle: contaCelle(), righe: contaRighe(), kpi: el.kpi.innerHTML}};
+el.vista.scrollTop = Math.floor(parseFloat(el.spazio.style.height) / 2);
+el.vista.listeners.scroll();
+misure.scroll = {celle: contaCelle(), righe: contaRighe()};
+el.prefisso.value = "__PREFISSO__";
+el.prefisso.listeners.input();
+misure.prefisso = {celle: contaCelle(), righe: contaRighe(), kpi: el.kpi.innerHTML};
+misure.html_kb = __HTML_KB__;
+console.log(JSON.stringify(misure));
+"""
+
+
+def catalogo_sintetico(codici: int, depositi: int) -> pd.DataFrame:
+    """`codici` codici turno per deposito, ripartiti tra Lu-Ve, Sa e Do."""
+    righe = []
+    for d in range(depositi):
+        dep = f"deposito{d:02d}"
+        for k in range(codici):
+            valid = ("Lu-Ve", "Lu-Ve", "Sa", "Do")[k % 4]
+            righe.append((dep, f"{dep[-2:]}{valid[0]}{k:05d}", valid, dt.date(2026, 6, 1), dt.date(2026, 8, 31)))
+    return pd.DataFrame(righe, columns=["deposito", "codice_turno", "valid", "dal", "al"])
+
+
+def esegui(html: str, prefisso: str) -> dict:
+    script = re.search(r"<script>(.*)</script>", html, re.S).group(1)
+    sorgente = (
+        _NODE.replace("__SCRIPT__", script).replace("__LARGHEZZA__", str(LARGHEZZA_VISTA))
+        .replace("__ALTEZZA__", str(ALTEZZA_GRIGLIA)).replace("__PREFISSO__", prefisso)
+        .replace("__HTML_KB__", f"{len(html.encode()) / 1024:.1f}")
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False) as f:
+        f.write(sorgente)
+    try:
+        out = subprocess.run(["node", f.name], capture_output=True, text=True, timeout=60)
+    finally:
+        os.remove(f.name)
+    if out.returncode:
+        raise RuntimeError(f"script della griglia fallito in node:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Verifica la virtualizzazione della griglia dei codici turno")
+    ap.add_argument("--codici", type=int, default=3000, help="codici per deposito")
+    ap.add_argument("--depositi", type=int, default=6)
+    args = ap.parse_args()
+    if shutil.which("node") is None:
+        print("node non installato: verifica non eseguibile")
+        sys.exit(2)
+
+    df = catalogo_sintetico(args.codici, args.depositi)
+    prefisso = df["codice_turno"].iloc[0][:4]
+    filtrati = int(df[df["deposito"] == df["deposito"].iloc[0]]["codice_turno"].str.startswith(prefisso).sum())
+    misure = esegui(html_griglia_codici(df, {}), prefisso)
+
+    per_riga = max(1, (LARGHEZZA_VISTA - 4) // LARGHEZZA_CELLA)
+    righe_max = math.ceil((ALTEZZA_GRIGLIA - 56) / ALTEZZA_RIGA) + 10   # finestra + margine di 5 sopra e sotto
+    print(f"{len(df):,} codici ({args.codici:,} per deposito) · pagina {misure['html_kb']} KB · "
+          f"{per_riga} celle per riga, al massimo {righe_max} righe nel DOM", flush=True)
+    errori = []
+    for fase in ("apertura", "scroll", "prefisso"):
+        m = misure[fase]
+        print(f"  {fase:<9} {m['righe']:>3} righe, {m['celle']:>4} celle nel DOM", flush=True)
+        if m["righe"] > righe_max or m["celle"] > righe_max * per_riga:
+            errori.append(f"{fase}: {m['righe']} righe / {m['celle']} celle oltre la finestra visibile")
+        if m["celle"] == 0:
+            errori.append(f"{fase}: nessuna cella nel DOM")
+    if f"<b>{args.codici}</b> codici" not in misure["apertura"]["kpi"]:
+        errori.append(f"KPI all'apertura: {misure['apertura']['kpi']}")
+    if f"<b>{filtrati}</b> codici" not in misure["prefisso"]["kpi"]:
+        errori.append(f"KPI con prefisso {prefisso!r} (attesi {filtrati}): {misure['prefisso']['kpi']}")
+
+    for e in errori:
+        print("   ", e)
+    print("OK" if not errori else f"{len(errori)} CONTROLLI FALLITI", flush=True)
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# ===============================================
+# ESTATE 2026 - VERIFICA RILETTURA INCREMENTALE DEGLI SNAPSHOT
+# Snapshot fusi dopo le modifiche = lettura completa a freddo
+# ===============================================
+#
+# Sulla stagione sintetica (benchmarks/stagione.py), con i trigger di
+# notifiche.py installati:
+#
+#   1. una sessione app.py su tutte le viste scrive gli snapshot;
+#   2. si cambia il roster di un solo autista in un solo giorno: ogni
+#      dataset rivalidato deve rileggere un riquadro e non più delle righe
+#      di un giorno;
+#   3. si modificano roster, roster2, turni_giornalieri, assenze, calendar
+#      e turni (UPDATE, INSERT e DELETE); l'ascoltatore delle notifiche
+#      rivalida gli snapshot dal registro delle modifiche;
+#   4. una seconda sessione a freddo, su una cartella di snapshot vuota,
+#      legge tutto dal database.
+#
+# Ogni snapshot fuso ai passi 2 e 3 deve essere uguale a quello del passo
+# 4, e i dataset per (giorno, deposito) devono essere stati riletti per
+# riquadri, non per intero. Esce con codice 1 se un controllo fallisce.
+#
+#   python benchmarks/verifica_incrementale.py [--dsn ...]
+
+import argparse
+import datetime as dt
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import pandas as pd
+import psycopg2
+import pyarrow.parquet as pq
+
+QUI = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(QUI, "..", "app.py")
+sys.path.insert(0, QUI)
+sys.path.insert(0, os.path.join(QUI, ".."))
+from bench_scala import VISTE  # noqa: E402
+from notifiche import installa_trigger  # noqa: E402
+from stagione import INIZIO, SCHEMA, Scala, dsn_locale, dsn_schema, genera  # noqa: E402
+
+TIMEOUT_RUN = 300
+ATTESA_RIVALIDAZIONE = 60   # secondi massimi tra il commit e gli snapshot rivalidati
+
+# Dataset per (giorno, deposito): devono passare dai riquadri
+PARTIZIONATI = ("staffing", "turni_calendario", "staffing_roster2", "copertura", "ferie_riposi", "assenze_nominali")
+
+_G = lambda n: INIZIO + dt.timedelta(days=n)  # noqa: E731
+PUNTUALE = (
+    ("UPDATE roster SET turno = 'R' WHERE data = %s AND deposito = 'ancona' AND matricola = 'anc0002'", (_G(25),)),
+)
+MODIFICHE = (
+    ("UPDATE roster SET turno = 'FP' WHERE data BETWEEN %s AND %s AND deposito = 'jesi' AND turno LIKE 'T%%'",
+     (_G(10), _G(12))),
+    ("DELETE FROM roster WHERE data = %s AND deposito = 'osimo' AND matricola = 'osi0001'", (_G(20),)),
+    ("UPDATE roster2 SET turno = 'R' WHERE data = %s AND deposito = 'ancona' AND turno LIKE 'T%%'", (_G(5),)),
+    ("DELETE FROM turni_giornalieri WHERE data = %s AND deposito = 'ancona' AND codice_turno LIKE '%%1'", (_G(15),)),
+    ("INSERT INTO turni_giornalieri (data, deposito, codice_turno) VALUES (%s, 'jesi', 'JEX999')", (_G(3),)),
+    ("UPDATE assenze SET malattie = malattie + 2 WHERE deposito = 'osimo' AND daytype = 'sabato'", ()),
+    ("UPDATE calendar SET daytype = 'domenica' WHERE data = %s", (_G(1),)),
+    ("INSERT INTO turni (deposito, codice_turno, valid, dal, al) VALUES ('jesi', 'JEX999', 'Sa', %s, %s)",
+     (_G(0), _G(29))),
+)
+
+
+class _Riquadri(logging.Handler):
+    """Raccoglie i messaggi "riquadri riletti" di snapshot.py: {dataset: (riquadri, righe)}."""
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.riletti = {}
+
+    def emit(self, record):
+        m = re.match(r"Snapshot (\w+): (\d+) riquadri riletti \((\d+) righe\)", record.getMessage())
+        if m:
+            self.riletti[m.group(1)] = (int(m.group(2)), int(m.group(3)))
+
+
+def sessione(dsn: str):
+    """Una sessione su tutte le viste (carica ogni dataset); restituisce l'AppTest."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT_RUN)
+    at.secrets["DATABASE_URL"] = dsn
+    at.secrets["APP_PASSWORD"] = "verifica"
+    at.session_state["password_correct"] = True
+    at.session_state["splash_done"] = True
+    at.run()
+    for tab, sotto in VISTE:
+        at.session_state["tab_principale"] = tab
+        if sotto:
+            at.session_state["tab_analisi"] = sotto
+        at.run()
+    return at
+
+
+def snapshot(directory: str) -> dict:
+    return {
+        os.path.basename(p)[:-len(".parquet")]: pq.read_table(p).to_pandas()
+        for p in glob.glob(os.path.join(directory, "*.parquet"))
+    }
+
+
+def segni(directory: str) -> dict:
+    out = {}
+    for p in glob.glob(os.path.join(directory, "*.stato.json")):
+        with open(p) as f:
+            out[os.path.basename(p)[:-len(".stato.json")]] = json.load(f).get("segno")
+    return out
+
+
+def applica(conn, modifiche: tuple, snapshot_dir: str, attesi: set) -> None:
+    """Esegue le modifiche (una transazione ciascuna) e aspetta che `attesi` siano rivalidati."""
+    prima = segni(snapshot_dir)
+    with conn.cursor() as cur:
+        for sql, params in modifiche:
+            cur.execute(sql, params)
+            print(f"  {cur.rowcount:>4} righe · {sql.split(' WHERE')[0][:60]}", flush=True)
+            conn.commit()
+    scadenza = time.time() + ATTESA_RIVALIDAZIONE
+    while time.time() < scadenza:
+        dopo = segni(snapshot_dir)
+        if all(dopo.get(n) != prima.get(n) for n in attesi):
+            break
+        time.sleep(1)
+    time.sleep(1)   # l'ultima rivalidazione finisce di scrivere
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Verifica la rilettura incrementale degli snapshot")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    ap.add_argument("--mantieni", action="store_true", help="non eliminare lo schema di prova")
+    args = ap.parse_args()
+
+    warnings.filterwarnings("ignore")
+    import streamlit as st
+    from streamlit import config, logger
+    config.set_option("logger.level", "error")
+    logger.set_log_level(logging.ERROR)
+    riquadri = _Riquadri()
+    logging.getLogger("snapshot").addHandler(riquadri)
+    logging.getLogger("snapshot").setLevel(logging.INFO)
+
+    dsn = args.dsn or dsn_locale()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    fusi_dir, freddi_dir = tempfile.mkdtemp(prefix="estate2026_snap_"), tempfile.mkdtemp(prefix="estate2026_snap_")
+    errori = []
+    try:
+        scala = Scala(depositi=4, autisti=20, giorni=45)
+        genera(conn, scala)
+        print(f"Stagione {scala}", flush=True)
+        with psycopg2.connect(dsn_schema(dsn)) as conn_schema:
+            print("trigger su:", ", ".join(installa_trigger(conn_schema)), flush=True)
+
+            os.environ["ESTATE2026_SNAPSHOT_DIR"] = fusi_dir
+            st.cache_data.clear()
+            st.cache_resource.clear()
+            sessione(dsn_schema(dsn))
+            time.sleep(3)   # l'ascoltatore si connette in background
+            iniziali = snapshot(fusi_dir)
+
+            print("modifica puntuale:", flush=True)
+            applica(conn_schema, PUNTUALE, fusi_dir, {"staffing"})
+            puntuale = dict(riquadri.riletti)
+            riquadri.riletti.clear()
+            print("modifiche su tutte le tabelle:", flush=True)
+            applica(conn_schema, MODIFICHE, fusi_dir, set(iniziali) - {"depositi"})
+            fusi = snapshot(fusi_dir)
+
+            os.environ["ESTATE2026_SNAPSHOT_DIR"] = freddi_dir
+            st.cache_data.clear()
+            st.cache_resource.clear()
+            sessione(dsn_schema(dsn))
+            freddi = snapshot(freddi_dir)
+    finally:
+        if not args.mantieni:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.close()
+        shutil.rmtree(fusi_dir, ignore_errors=True)
+        shutil.rmtree(freddi_dir, ignore_errors=True)
+
+    per_giorno = {n: len(df) / scala.giorni for n, df in iniziali.items()}
+    for nome, (n, righe) in sorted(puntuale.items()):
+        print(f"  puntuale · {nome:<18} {n} riquadri, {righe:>5} righe rilette su {len(iniziali[nome]):>6}", flush=True)
+        if n != 1 or righe > per_giorno[nome]:
+            errori.append(f"{nome}: {n} riquadri / {righe} righe per un solo (giorno, deposito)")
+    if "staffing" not in puntuale:
+        errori.append("staffing: non riletto per riquadri dopo la modifica puntuale")
+    for nome, (n, righe) in sorted(riquadri.riletti.items()):
+        print(f"  estesa  · {nome:<18} {n} riquadri, {righe:>5} righe rilette su {len(fusi[nome]):>6}", flush=True)
+    for nome in sorted(freddi.keys() | fusi.keys()):
+        if nome not in fusi or nome not in freddi:
+            errori.append(f"{nome}: snapshot solo {'a freddo' if nome in freddi else 'fuso'}")
+            continue
+        try:
+            pd.testing.assert_frame_equal(fusi[nome], freddi[nome], check_categorical=False)
+            esito = "uguale"
+        except AssertionError as e:
+            esito = "DIVERSO"
+            errori.append(f"{nome}: {str(e).splitlines()[0]}")
+        print(f"  {nome:<18} {len(freddi[nome]):>7} righe · fuso {esito} alla lettura a freddo", flush=True)
+    for nome in PARTIZIONATI:
+        if nome in fusi and nome not in riquadri.riletti:
+            errori.append(f"{nome}: non riletto per riquadri")
+
+    for e in errori:
+        print("   ", e)
+    print("OK" if not errori else f"{len(errori)} CONTROLLI FALLITI", flush=True)
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == "__main__":
+    main()
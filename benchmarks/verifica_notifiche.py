@@ -0,0 +1,171 @@
+# ===============================================
+# ESTATE 2026 - VERIFICA AGGIORNAMENTO SU NOTIFICA
+# Dalla modifica in tabella ai dati della sessione aperta, senza TTL
+# ===============================================
+#
+# Sulla stagione sintetica (benchmarks/stagione.py):
+#
+#   1. tipi per COPY: dopo un ALTER COLUMN la cache di fetch_copy tiene il
+#      tipo vecchio finché svuota_tipi_query() non la svuota;
+#   2. notifiche: con i trigger installati, una sessione app.py aperta vede
+#      un UPDATE su roster al rerun successivo (ascoltatore → rivalidazione
+#      dello snapshot → cache svuotata), e le sue metriche sono identiche a
+#      quelle di una sessione a freddo sui dati modificati.
+#
+# Esce con codice 1 se un controllo fallisce.
+#
+#   python benchmarks/verifica_notifiche.py [--dsn ...]
+
+import argparse
+import datetime as dt
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import psycopg2
+
+QUI = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(QUI, "..", "app.py")
+sys.path.insert(0, QUI)
+sys.path.insert(0, os.path.join(QUI, ".."))
+from db import fetch_copy, svuota_tipi_query  # noqa: E402
+from notifiche import installa_trigger  # noqa: E402
+from stagione import INIZIO, SCHEMA, Scala, dsn_locale, dsn_schema, genera  # noqa: E402
+
+TIMEOUT_RUN = 300
+ATTESA_NOTIFICA = 30   # secondi massimi tra il commit e la rivalidazione vista dalla sessione
+
+
+def verifica_tipi(conn) -> list:
+    """Cache dei tipi di fetch_copy prima e dopo un cambio di tipo della colonna."""
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE tipi_prova (x text); INSERT INTO tipi_prova VALUES ('2026-06-01');")
+    conn.commit()
+    sql = "SELECT x FROM tipi_prova"
+    prima = fetch_copy(conn, sql)["x"].dtype
+    with conn.cursor() as cur:
+        cur.execute("ALTER TABLE tipi_prova ALTER COLUMN x TYPE date USING x::date;")
+    conn.commit()
+    in_cache = fetch_copy(conn, sql)["x"].dtype
+    svuota_tipi_query()
+    dopo = fetch_copy(conn, sql)["x"].dtype
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE tipi_prova;")
+    conn.commit()
+    print(f"tipi: {prima} → ALTER → {in_cache} (in cache) → svuota → {dopo}", flush=True)
+    errori = []
+    if in_cache != prima:
+        errori.append("la cache dei tipi non ha tenuto il tipo vecchio")
+    if dopo.kind != "M":
+        errori.append(f"dopo svuota_tipi_query il tipo è {dopo}, atteso datetime64")
+    return errori
+
+
+def _sessione(dsn: str):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT_RUN)
+    at.secrets["DATABASE_URL"] = dsn
+    at.secrets["APP_PASSWORD"] = "verifica"
+    at.session_state["password_correct"] = True
+    at.session_state["splash_done"] = True
+    return at.run()
+
+
+def _metriche(at) -> list:
+    return sorted(f"{m.label} = {m.value} ({m.delta})" for m in at.metric)
+
+
+def _didascalia(at) -> str:
+    return next((c.value for c in at.sidebar.caption if "Aggiornamento automatico" in c.value), "")
+
+
+def verifica_notifiche(conn, dsn: str, snapshot_dir: str) -> list:
+    import streamlit as st
+
+    print("trigger su:", ", ".join(installa_trigger(conn)), flush=True)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    at = _sessione(dsn)
+    scadenza = time.time() + ATTESA_NOTIFICA
+    while not _didascalia(at) and time.time() < scadenza:
+        time.sleep(1)
+        at.run()
+    if not _didascalia(at):
+        return ["l'ascoltatore delle notifiche non si è connesso"]
+    prima = _metriche(at)
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE roster SET turno = 'FP'
+            WHERE data BETWEEN %s AND %s AND turno NOT IN ('R', 'FP');
+        """, (INIZIO + dt.timedelta(days=9), INIZIO + dt.timedelta(days=11)))
+        modificate = cur.rowcount
+    conn.commit()
+    print(f"UPDATE roster: {modificate} righe", flush=True)
+
+    scadenza = time.time() + ATTESA_NOTIFICA
+    while "ultima modifica" not in _didascalia(at) and time.time() < scadenza:
+        time.sleep(1)
+        at.run()
+    dopo = _metriche(at)
+    print(f"sessione aperta: {_didascalia(at)}", flush=True)
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.makedirs(snapshot_dir)
+    freddo = _metriche(_sessione(dsn))
+
+    errori = []
+    if "ultima modifica" not in _didascalia(at):
+        errori.append(f"nessuna notifica ricevuta entro {ATTESA_NOTIFICA}s")
+    if dopo == prima:
+        errori.append("le metriche della sessione aperta non sono cambiate")
+    for m in sorted(set(dopo) ^ set(freddo)):
+        errori.append(f"{'solo sessione aperta' if m in dopo else 'solo lettura a freddo'}: {m}")
+    print(f"metriche cambiate: {len(set(prima) - set(dopo))} · "
+          f"uguali alla lettura a freddo: {dopo == freddo}", flush=True)
+    return errori
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Verifica l'aggiornamento della dashboard su notifica di modifica")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    ap.add_argument("--mantieni", action="store_true", help="non eliminare lo schema di prova")
+    args = ap.parse_args()
+
+    warnings.filterwarnings("ignore")
+    from streamlit import config, logger
+    config.set_option("logger.level", "error")
+    logger.set_log_level(logging.ERROR)
+    dsn = args.dsn or dsn_locale()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    snapshot_dir = tempfile.mkdtemp(prefix="estate2026_snap_")
+    os.environ["ESTATE2026_SNAPSHOT_DIR"] = snapshot_dir
+    try:
+        scala = Scala(depositi=3, autisti=20, giorni=30)
+        genera(conn, scala)
+        print(f"Stagione {scala}", flush=True)
+        with psycopg2.connect(dsn_schema(dsn)) as conn_schema:
+            errori = verifica_tipi(conn_schema) + verifica_notifiche(conn_schema, dsn_schema(dsn), snapshot_dir)
+    finally:
+        if not args.mantieni:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.close()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    for e in errori:
+        print("   ", e)
+    print("OK" if not errori else f"{len(errori)} CONTROLLI FALLITI", flush=True)
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == "__main__":
+    main()
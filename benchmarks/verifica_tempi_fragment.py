@@ -0,0 +1,111 @@
+# ===============================================
+# ESTATE 2026 - VERIFICA TEMPI DEI FRAGMENT
+# Un fragment rieseguito da solo è un rerun a sé nella traccia admin
+# ===============================================
+#
+# Sulla stagione sintetica (benchmarks/stagione.py) apre app.py come admin
+# sul sotto-tab Ferie & Riposi, poi riesegue solo il fragment della pagina
+# (come fa Streamlit quando cambia un suo widget: l'id del fragment nella
+# coda del rerun). Controlla che la traccia conti un rerun in più e che
+# l'ultimo rerun sia quello del fragment, con i suoi span.
+#
+# streamlit.testing non espone i rerun di un solo fragment: la coda si
+# passa al RerunData del runner di test. Esce con codice 1 se un controllo
+# fallisce.
+#
+#   python benchmarks/verifica_tempi_fragment.py [--dsn ...]
+
+import argparse
+import functools
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+
+import psycopg2
+
+QUI = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(QUI, "..", "app.py")
+sys.path.insert(0, QUI)
+sys.path.insert(0, os.path.join(QUI, ".."))
+from stagione import SCHEMA, Scala, dsn_locale, dsn_schema, genera  # noqa: E402
+
+TIMEOUT_RUN = 300
+VISTA = ("📈 Analisi & Assenze", "🏖️ Ferie & Riposi")
+FRAGMENT = "grafico_ferie_riposi"
+
+
+def verifica(dsn: str) -> list:
+    import streamlit.testing.v1.local_script_runner as runner
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT_RUN)
+    at.secrets["DATABASE_URL"] = dsn
+    at.secrets["APP_PASSWORD"] = "verifica"
+    at.session_state["password_correct"] = True
+    at.session_state["splash_done"] = True
+    at.session_state["is_admin"] = True
+    at.session_state["tab_principale"], at.session_state["tab_analisi"] = VISTA
+    at.run()
+    traccia = at.session_state["traccia"]
+    completo = [r["span"] for r in traccia.ultimo]
+    reruns = traccia.reruns
+    print(f"rerun completo: {len(completo)} span, tra cui fragment.{FRAGMENT}: {f'fragment.{FRAGMENT}' in completo}")
+
+    ids = list(at._fragment_storage._fragments)
+    rerun_data = runner.RerunData
+    runner.RerunData = functools.partial(rerun_data, fragment_id_queue=ids)
+    try:
+        at.run()
+    finally:
+        runner.RerunData = rerun_data
+    parziale = [r["span"] for r in traccia.ultimo]
+    print(f"rerun del fragment: {parziale}")
+
+    errori = [f"eccezione: {e.value}" for e in at.exception]
+    if len(ids) != 1:
+        errori.append(f"attesi 1 fragment nella vista, trovati {len(ids)}")
+    if f"fragment.{FRAGMENT}" not in completo:
+        errori.append(f"span fragment.{FRAGMENT} assente nel rerun completo")
+    if traccia.reruns != reruns + 1:
+        errori.append(f"rerun contati: {traccia.reruns}, attesi {reruns + 1}")
+    if parziale[-1:] != [f"rerun.{FRAGMENT}"] or f"fragment.{FRAGMENT}" not in parziale:
+        errori.append(f"ultimo rerun senza gli span del fragment: {parziale}")
+    if "loader.staffing" in parziale:
+        errori.append("il rerun del fragment contiene span del rerun completo")
+    return errori
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Verifica la traccia dei tempi sui rerun dei fragment")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL, poi pgserver")
+    args = ap.parse_args()
+
+    warnings.filterwarnings("ignore")
+    from streamlit import config, logger
+    config.set_option("logger.level", "error")
+    logger.set_log_level(logging.ERROR)
+    dsn = args.dsn or dsn_locale()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    snapshot_dir = tempfile.mkdtemp(prefix="estate2026_snap_")
+    os.environ["ESTATE2026_SNAPSHOT_DIR"] = snapshot_dir
+    try:
+        genera(conn, Scala(depositi=3, autisti=20, giorni=30))
+        errori = verifica(dsn_schema(dsn))
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.close()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    for e in errori:
+        print("   ", e)
+    print("OK" if not errori else f"{len(errori)} CONTROLLI FALLITI", flush=True)
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# ===============================================
+# ESTATE 2026 - ACCESSO DATABASE
+# Pool di connessioni PostgreSQL condiviso dal processo
+# ===============================================
+
+import hashlib
+import io
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2
+from psycopg2 import errors as pg_errors
+from psycopg2 import pool as pg_pool
+
+
+class PoolTimeout(pg_pool.PoolError):
+    """Nessuna connessione libera entro il tempo di attesa."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Connessione del pool: ricorda gli statement già preparati lato server."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set = set()
+
+
+class ConnectionPool:
+    """
+    Pool limitato di connessioni psycopg2, thread-safe.
+
+    - al massimo `maxconn` connessioni aperte (le richieste in eccesso
+      attendono fino a `checkout_timeout` secondi)
+    - una connessione più vecchia di `max_age` secondi o inattiva da più
+      di `max_idle` secondi viene chiusa e ricreata
+    - prima di prestare una connessione rimasta ferma più di
+      `health_check_after` secondi si esegue un `SELECT 1`
+    - le connessioni sono in autocommit: la dashboard fa solo letture e
+      nessuna sessione resta "idle in transaction" sul server
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = 1,
+        maxconn: int = 8,
+        max_age: float = 1800.0,
+        max_idle: float = 300.0,
+        health_check_after: float = 30.0,
+        checkout_timeout: float = 15.0,
+        **connect_kwargs,
+    ):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError(f"Dimensioni pool non valide: min={minconn} max={maxconn}")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self.connect_kwargs = connect_kwargs
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle: list = []     # [(conn, creata_il, ultimo_uso)] — LIFO
+        self._born: dict = {}     # id(conn) → timestamp creazione
+        self._closed = False
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, self._born[id(conn)], time.monotonic()))
+
+    # ── ciclo di vita singola connessione ─────────────────────────────
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection, **self.connect_kwargs)
+        conn.autocommit = True
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn) -> None:
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _alive(conn) -> bool:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+                cur.fetchone()
+            return True
+        except Exception:
+            return False
+
+    # ── prestito / restituzione ───────────────────────────────────────
+    def getconn(self):
+        if self._closed:
+            raise pg_pool.PoolError("Pool chiuso")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout(
+                f"Nessuna connessione libera entro {self.checkout_timeout:g}s "
+                f"(pool pieno: {self.maxconn})"
+            )
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+
+                conn, born, last_used = entry
+                now = time.monotonic()
+                if (
+                    conn.closed
+                    or now - born > self.max_age
+                    or now - last_used > self.max_idle
+                ):
+                    self._discard(conn)
+                    continue
+                if now - last_used > self.health_check_after and not self._alive(conn):
+                    self._discard(conn)
+                    continue
+                return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        try:
+            if discard or self._closed or conn.closed:
+                self._discard(conn)
+                return
+            if conn.status != psycopg2.extensions.STATUS_READY:
+                try:
+                    conn.rollback()
+                except Exception:
+                    self._discard(conn)
+                    return
+            born = self._born.get(id(conn), time.monotonic())
+            with self._lock:
+                self._idle.append((conn, born, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Presta una connessione e la restituisce sempre, anche in caso di errore."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def closeall(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = len(self._idle)
+        return {"aperte": len(self._born), "libere": idle, "max": self.maxconn}
+
+
+# --------------------------------------------------
+# STATO DEL DATABASE
+# --------------------------------------------------
+class HealthMonitor:
+    """
+    Verifica periodica del database in un thread di background.
+
+    Ogni `intervallo` secondi esegue `SELECT NOW()` con una connessione del
+    pool e memorizza esito, latenza e ora del server; dopo un errore riprova
+    ogni `intervallo_errore` secondi. Il guasto è "confermato" solo dopo
+    `soglia_guasto` sonde fallite di fila: un singolo timeout non ferma la
+    dashboard. `stato()` non fa I/O e si può chiamare a ogni rerun.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        intervallo: float = 30.0,
+        intervallo_errore: float = 2.0,
+        soglia_guasto: int = 3,
+    ):
+        self.pool = pool
+        self.intervallo = intervallo
+        self.intervallo_errore = intervallo_errore
+        self.soglia_guasto = soglia_guasto
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stato = {
+            "ok": None, "latenza_ms": None, "ora_db": None, "errore": None,
+            "sondato_il": None, "fallimenti": 0,
+        }
+
+    def sonda(self) -> bool:
+        t0 = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT NOW();")
+                    ora_db = cur.fetchone()[0]
+        except Exception as e:
+            with self._lock:
+                self._stato.update(ok=False, errore=str(e), sondato_il=time.time(),
+                                   fallimenti=self._stato["fallimenti"] + 1)
+            return False
+        with self._lock:
+            self._stato.update(ok=True, errore=None, ora_db=ora_db, sondato_il=time.time(), fallimenti=0,
+                               latenza_ms=(time.perf_counter() - t0) * 1000)
+        return True
+
+    def avvia(self) -> "HealthMonitor":
+        """Prima sonda sincrona (lo stato è subito noto), poi il thread periodico."""
+        if self._thread is None:
+            self.sonda()
+            self._thread = threading.Thread(target=self._ciclo, name="db-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def _ciclo(self) -> None:
+        while not self._stop.wait(self.intervallo if self._stato["ok"] else self.intervallo_errore):
+            self.sonda()
+
+    def ferma(self) -> None:
+        self._stop.set()
+
+    def stato(self) -> dict:
+        with self._lock:
+            stato = dict(self._stato)
+        stato["guasto"] = stato["fallimenti"] >= self.soglia_guasto
+        stato["eta_s"] = None if stato["sondato_il"] is None else time.time() - stato["sondato_il"]
+        return stato
+
+
+# --------------------------------------------------
+# STATEMENT PREPARATI LATO SERVER
+# --------------------------------------------------
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+
+def _to_positional(sql: str) -> tuple:
+    """`%(nome)s` → `$n` (stesso nome → stesso indice). Restituisce (sql, nomi)."""
+    nomi: list = []
+
+    def _sub(m):
+        if m.group(1) not in nomi:
+            nomi.append(m.group(1))
+        return f"${nomi.index(m.group(1)) + 1}"
+
+    return _NAMED_PARAM.sub(_sub, sql), nomi
+
+
+def fetch_prepared(conn, sql: str, params: dict = None) -> pd.DataFrame:
+    """
+    Esegue `sql` come statement preparato lato server e restituisce un DataFrame.
+
+    Il nome dello statement deriva dal testo SQL, quindi la stessa forma di
+    query riusa lo stesso piano su ogni connessione del pool: `PREPARE` viene
+    inviato solo la prima volta che una connessione incontra quella query.
+    I parametri sono sempre passati come valori legati, mai interpolati.
+    """
+    params = params or {}
+    body, nomi = _to_positional(sql.strip().rstrip(";"))
+    nome = "q_" + hashlib.sha1(body.encode()).hexdigest()[:16]
+    args = tuple(params[n] for n in nomi)
+    execute = f"EXECUTE {nome}" + (f" ({', '.join(['%s'] * len(args))})" if args else "")
+
+    prepared = getattr(conn, "prepared", set())
+    with conn.cursor() as cur:
+        for tentativo in (0, 1):
+            if nome not in prepared:
+                try:
+                    cur.execute(f"PREPARE {nome} AS {body}")
+                except pg_errors.DuplicatePreparedStatement:
+                    pass
+                prepared.add(nome)
+            try:
+                cur.execute(execute, args)
+                break
+            except pg_errors.InvalidSqlStatementName:
+                # statement perso lato server (es. DISCARD ALL): si riprepara
+                if tentativo:
+                    raise
+                prepared.discard(nome)
+            except pg_errors.FeatureNotSupported:
+                # piano invalidato da una modifica di schema: si riprepara
+                if tentativo:
+                    raise
+                cur.execute(f"DEALLOCATE {nome}")
+                prepared.discard(nome)
+        colonne = [d.name for d in cur.description]
+        righe = cur.fetchall()
+    return pd.DataFrame.from_records(righe, columns=colonne, coerce_float=True)
+
+
+# --------------------------------------------------
+# FETCH MASSIVO VIA COPY
+# --------------------------------------------------
+# `COPY (query) TO STDOUT` trasferisce il risultato come un unico flusso CSV
+# che viene decodificato direttamente in colonne tipizzate (pyarrow.csv, o il
+# parser C di pandas se pyarrow manca), senza creare una tupla Python per
+# riga come fa pd.read_sql.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+# OID dei tipi PostgreSQL → trattamento in lettura
+_OID_BOOL        = {16}
+_OID_DATE        = {1082, 1114}     # date, timestamp (senza fuso)
+_OID_TIMESTAMPTZ = {1184}
+_OID_TEXT        = {18, 19, 25, 1042, 1043}
+
+# sql → [(colonna, oid)], LRU di al più TIPI_QUERY_MAX testi di query. Dopo
+# una migrazione (tipo di una colonna cambiato) va svuotata con
+# svuota_tipi_query(): l'app lo fa sulle notifiche di modifica e a ogni
+# rilettura completa di un dataset.
+TIPI_QUERY_MAX = 128
+_tipi_query: OrderedDict = OrderedDict()
+_tipi_lock = threading.Lock()
+
+
+def svuota_tipi_query() -> None:
+    with _tipi_lock:
+        _tipi_query.clear()
+
+
+def _tipi_colonne(cur, sql: str, params: dict) -> list:
+    with _tipi_lock:
+        tipi = _tipi_query.get(sql)
+        if tipi is not None:
+            _tipi_query.move_to_end(sql)
+            return tipi
+    cur.execute(f"SELECT * FROM ({sql}) AS q LIMIT 0", params)
+    tipi = [(d.name, d.type_code) for d in cur.description]
+    with _tipi_lock:
+        _tipi_query[sql] = tipi
+        _tipi_query.move_to_end(sql)
+        while len(_tipi_query) > TIPI_QUERY_MAX:
+            _tipi_query.popitem(last=False)
+    return tipi
+
+
+def _csv_pyarrow(buf, tipi: list) -> pd.DataFrame:
+    tipo_pa = {}
+    for c, oid in tipi:
+        if oid in _OID_TEXT or oid in _OID_TIMESTAMPTZ:
+            tipo_pa[c] = pa.string()
+        elif oid in _OID_BOOL:
+            tipo_pa[c] = pa.bool_()
+        elif oid in _OID_DATE:
+            tipo_pa[c] = pa.timestamp("us")
+    table = pa_csv.read_csv(buf, convert_options=pa_csv.ConvertOptions(
+        column_types=tipo_pa, null_values=[""], strings_can_be_null=True,
+        quoted_strings_can_be_null=False,   # NULL = campo vuoto, '' = ""
+        true_values=["t"], false_values=["f"],
+    ))
+    return table.to_pandas()
+
+
+def _csv_pandas(buf, tipi: list) -> pd.DataFrame:
+    dtype = {c: "str" for c, oid in tipi if oid in _OID_TEXT | _OID_TIMESTAMPTZ}
+    dtype.update({c: "boolean" for c, oid in tipi if oid in _OID_BOOL})
+    date = [c for c, oid in tipi if oid in _OID_DATE]
+    return pd.read_csv(
+        buf, dtype=dtype, parse_dates=date,
+        true_values=["t"], false_values=["f"], keep_default_na=False, na_values=[""],
+    )
+
+
+def fetch_copy(conn, sql: str, params: dict = None) -> pd.DataFrame:
+    """
+    Esegue `sql` con COPY ... TO STDOUT (CSV) e restituisce un DataFrame.
+
+    COPY non accetta parametri legati: i valori sono resi letterali da
+    `mogrify` (quoting di psycopg2, nessuna interpolazione manuale). I tipi
+    delle colonne sono letti una volta per testo di query: testo → str,
+    date/timestamp → datetime64, booleani da 't'/'f', numeri inferiti dal
+    parser (int64, o float64 se ci sono NULL, come pd.read_sql).
+    """
+    body = sql.strip().rstrip(";")
+    buf = io.BytesIO()
+    with conn.cursor() as cur:
+        tipi = _tipi_colonne(cur, body, params or {})
+        letterale = cur.mogrify(body, params or {}).decode(psycopg2.extensions.encodings[conn.encoding])
+        cur.copy_expert(f"COPY ({letterale}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+    buf.seek(0)
+
+    df = _csv_pyarrow(buf, tipi) if pa_csv is not None else _csv_pandas(buf, tipi)
+    for c, oid in tipi:
+        if oid in _OID_TIMESTAMPTZ:
+            df[c] = pd.to_datetime(df[c], utc=True, format="ISO8601")
+    return df
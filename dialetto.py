@@ -0,0 +1,44 @@
+# ===============================================
+# ESTATE 2026 - DIALETTI SQL
+# Le poche espressioni che cambiano tra Postgres e DuckDB
+# ===============================================
+#
+# Le query dei loader sono SQL standard salvo i frammenti prodotti qui:
+# conteggi condizionali, massimo tra espressioni ed esistenza di una
+# tabella. I parametri restano nello stile psycopg2 `%(nome)s` per
+# entrambi i motori (la traduzione per DuckDB è in
+# archivio_locale.fetch_duckdb).
+
+
+class Dialetto:
+    """Postgres: il dialetto di riferimento delle query."""
+
+    nome = "postgres"
+
+    def conta_se(self, condizione: str) -> str:
+        """Numero di righe del gruppo che soddisfano `condizione`."""
+        return f"COUNT(*) FILTER (WHERE {condizione})"
+
+    def massimo(self, *espressioni: str) -> str:
+        """Il maggiore tra le espressioni (riga per riga)."""
+        return f"GREATEST({', '.join(espressioni)})"
+
+    def tabella_esiste(self, parametro: str) -> str:
+        """Booleano: la tabella il cui nome è nel parametro `parametro` esiste."""
+        return f"to_regclass(%({parametro})s) IS NOT NULL"
+
+
+class DialettoDuckDB(Dialetto):
+    """DuckDB: FILTER e GREATEST sono nativi; cambia il catalogo."""
+
+    nome = "duckdb"
+
+    def tabella_esiste(self, parametro: str) -> str:
+        return (
+            "EXISTS (SELECT 1 FROM information_schema.tables "
+            f"WHERE table_schema = current_schema() AND table_name = %({parametro})s)"
+        )
+
+
+POSTGRES = Dialetto()
+DUCKDB = DialettoDuckDB()
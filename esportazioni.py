@@ -0,0 +1,150 @@
+# ===============================================
+# ESTATE 2026 - ESPORTAZIONI CSV / EXCEL / PARQUET
+# Generate a blocchi, solo quando l'utente le scarica
+# ===============================================
+#
+# I pulsanti di download ricevono una funzione (st.download_button la
+# chiama al click, in un thread a parte) invece dei byte: nessun file è
+# costruito a ogni rerun. Il CSV è scritto a blocchi di BLOCCO_RIGHE righe;
+# l'Excel in modalità constant_memory di xlsxwriter (una riga alla volta su
+# file temporaneo), che pandas.to_excel non può usare perché scrive per
+# colonne. Il Parquet (per gli strumenti BI: tipi conservati, date senza
+# ora come date32, depositi e tipi giorno a dizionario) è scritto un row
+# group per blocco, anche dentro lo zip multi-dataset.
+
+import json
+import zipfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from schema import COLONNE_DATA
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # export Parquet non disponibile
+    pa = pq = None
+
+
+BLOCCO_RIGHE = 50_000
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PARQUET_DISPONIBILE = pq is not None
+
+# Colonne a pochi valori distinti: nel Parquet come dizionario (category in pandas)
+COLONNE_DIZIONARIO = ("deposito", "tipo_giorno", "categoria_giorno", "daytype", "scenario")
+
+
+def date_italiane(df: pd.DataFrame) -> pd.DataFrame:
+    """La colonna `giorno` come testo gg/mm/aaaa (formato degli export)."""
+    if "giorno" not in df.columns:
+        return df
+    return df.assign(giorno=pd.to_datetime(df["giorno"]).dt.strftime("%d/%m/%Y"))
+
+
+def _blocchi(df: pd.DataFrame, formatta=None, righe: int = BLOCCO_RIGHE):
+    for inizio in range(0, max(len(df), 1), righe):
+        blocco = df.iloc[inizio:inizio + righe]
+        yield formatta(blocco) if formatta is not None else blocco
+
+
+def csv_a_blocchi(df: pd.DataFrame, formatta=None, righe: int = BLOCCO_RIGHE) -> bytes:
+    """CSV UTF-8 di `df` (con `formatta` applicata a ogni blocco), senza la stringa intera in memoria."""
+    out = BytesIO()
+    for i, blocco in enumerate(_blocchi(df, formatta, righe)):
+        blocco.to_csv(out, index=False, header=i == 0, encoding="utf-8")
+    return out.getvalue()
+
+
+def _valori(blocco: pd.DataFrame):
+    """Righe del blocco come tuple di valori scrivibili (NaN/NA → cella vuota)."""
+    colonne = [
+        s.astype(object).where(s.notna(), None).to_numpy() if s.dtype.kind not in "iub" else s.to_numpy()
+        for _, s in blocco.items()
+    ]
+    return zip(*colonne) if colonne else iter(())
+
+
+def excel_streaming(fogli: dict, formatta=None, righe: int = BLOCCO_RIGHE) -> bytes:
+    """
+    Workbook .xlsx con un foglio per voce di `fogli` (nome → DataFrame,
+    None = foglio omesso), scritto riga per riga in constant_memory.
+    """
+    out = BytesIO()
+    wb = xlsxwriter.Workbook(out, {
+        "constant_memory": True, "nan_inf_to_errors": True, "default_date_format": "dd/mm/yyyy",
+    })
+    grassetto = wb.add_format({"bold": True, "border": 1})
+    for nome, df in fogli.items():
+        if df is None:
+            continue
+        ws = wb.add_worksheet(nome[:31])
+        ws.write_row(0, 0, [str(c) for c in df.columns], grassetto)
+        r = 1
+        for blocco in _blocchi(df, formatta, righe):
+            for valori in _valori(blocco):
+                ws.write_row(r, 0, [v.item() if isinstance(v, np.generic) else v for v in valori])
+                r += 1
+    wb.close()
+    return out.getvalue()
+
+
+def _colonne_solo_data(df: pd.DataFrame) -> list:
+    """Colonne di COLONNE_DATA senza parte oraria: nel Parquet come date32, non timestamp."""
+    colonne = []
+    for c in COLONNE_DATA & set(df.columns):
+        s = df[c]
+        if s.dtype.kind == "M" and getattr(s.dtype, "tz", None) is None and (s.dropna() == s.dropna().dt.normalize()).all():
+            colonne.append(c)
+    return colonne
+
+
+def _scrivi_parquet(df: pd.DataFrame, destinazione, righe: int = BLOCCO_RIGHE) -> None:
+    """`df` in Parquet zstd su `destinazione` (path o file), un row group per blocco."""
+    # categorie dal frame intero: ogni blocco ha lo stesso tipo dizionario
+    df = df.astype({c: "category" for c in COLONNE_DIZIONARIO if c in df.columns})
+    date = _colonne_solo_data(df)
+    writer = None
+    try:
+        for blocco in _blocchi(df, righe=righe):
+            if writer is None:
+                tabella = pa.Table.from_pandas(blocco, preserve_index=False)
+                schema = tabella.schema
+                for c in date:
+                    schema = schema.set(schema.get_field_index(c), pa.field(c, pa.date32()))
+                tabella = tabella.cast(schema)
+                writer = pq.ParquetWriter(destinazione, schema, compression="zstd")
+            else:
+                tabella = pa.Table.from_pandas(blocco, schema=writer.schema, preserve_index=False)
+            writer.write_table(tabella)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def parquet_streaming(df: pd.DataFrame, righe: int = BLOCCO_RIGHE) -> bytes:
+    out = BytesIO()
+    _scrivi_parquet(df, out, righe)
+    return out.getvalue()
+
+
+def zip_parquet(dataset: dict, manifesto: dict = None, righe: int = BLOCCO_RIGHE) -> bytes:
+    """
+    Zip con un `<nome>.parquet` per voce di `dataset` (None = omesso), ognuno
+    scritto in streaming dentro lo zip, più `manifesto.json` (righe per file
+    e i campi di `manifesto`, es. i filtri applicati).
+    """
+    out = BytesIO()
+    righe_file = {}
+    # Parquet è già compresso: nello zip i file sono solo archiviati
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:
+        for nome, df in dataset.items():
+            if df is None:
+                continue
+            with zf.open(f"{nome}.parquet", "w") as f:
+                _scrivi_parquet(df, f, righe)
+            righe_file[f"{nome}.parquet"] = len(df)
+        zf.writestr("manifesto.json", json.dumps({**(manifesto or {}), "file": righe_file}, indent=2, default=str))
+    return out.getvalue()
@@ -0,0 +1,93 @@
+# ===============================================
+# ESTATE 2026 - BUDGET DEL PAYLOAD DEI GRAFICI
+# Serie ridotte (LTTB), WebGL oltre soglia, testi solo se pochi punti
+# ===============================================
+#
+# Ogni punto di una figura Plotly viaggia come JSON verso il browser e lì
+# va disegnato. Le serie a linea oltre PUNTI_LINEA punti sono ridotte con
+# Largest-Triangle-Three-Buckets (conserva picchi e forma); le serie a
+# marcatori non riducibili oltre PUNTI_WEBGL punti passano a Scattergl;
+# etichette di testo e marcatori solo sotto PUNTI_TESTO punti.
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+PUNTI_LINEA = 500     # punti massimi di una serie a linea
+PUNTI_WEBGL = 1000    # oltre: scatter in WebGL
+PUNTI_TESTO = 120     # oltre: niente testo sulle barre / marcatori sulle linee
+
+
+def _numerico(x) -> np.ndarray:
+    a = np.asarray(x)
+    if np.issubdtype(a.dtype, np.datetime64):
+        return a.astype("datetime64[ns]").astype(np.int64).astype(float)
+    return a.astype(float)
+
+
+def lttb(x, y, soglia: int) -> np.ndarray:
+    """
+    Indici dei `soglia` punti scelti da Largest-Triangle-Three-Buckets
+    (x crescente). Primo e ultimo punto sono sempre inclusi; sotto soglia
+    restituisce tutti gli indici.
+    """
+    n = len(y)
+    if soglia >= n or soglia < 3:
+        return np.arange(n)
+    xs, ys = _numerico(x), np.nan_to_num(_numerico(y))
+    passo = (n - 2) / (soglia - 2)
+    bordi = (np.arange(soglia - 1) * passo).astype(int) + 1   # inizio di ogni secchio
+    bordi = np.append(bordi, n - 1)
+    scelti = np.empty(soglia, dtype=np.int64)
+    scelti[0], scelti[-1] = 0, n - 1
+    a = 0
+    for i in range(soglia - 2):
+        lo, hi = bordi[i], bordi[i + 1]
+        # vertice C: media del secchio successivo (l'ultimo punto per l'ultimo secchio)
+        nlo, nhi = bordi[i + 1], max(bordi[i + 2], bordi[i + 1] + 1)
+        cx, cy = xs[nlo:nhi].mean(), ys[nlo:nhi].mean()
+        area = np.abs((xs[a] - cx) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (cy - ys[a]))
+        a = lo + int(np.argmax(area))
+        scelti[i + 1] = a
+    return scelti
+
+
+def serie(x, y, mode: str = "lines", punti_max: int = PUNTI_LINEA, **kwargs):
+    """
+    Scatter entro il budget. Linee: ridotte con LTTB a `punti_max` punti;
+    i marcatori di "lines+markers" restano solo sotto PUNTI_TESTO punti.
+    Solo marcatori: nessuna riduzione, ma Scattergl oltre PUNTI_WEBGL.
+    """
+    x, y = pd.Series(x).reset_index(drop=True), pd.Series(y).reset_index(drop=True)
+    if "lines" in mode:
+        idx = lttb(x.to_numpy(), y.to_numpy(), punti_max)
+        if len(idx) < len(x):
+            x, y = x.iloc[idx], y.iloc[idx]
+        if "markers" in mode and len(x) > PUNTI_TESTO:
+            mode = "lines"
+    tipo = go.Scattergl if len(x) > PUNTI_WEBGL else go.Scatter
+    return tipo(x=x, y=y, mode=mode, **kwargs)
+
+
+def testi(valori, formato=str, mostra=None):
+    """
+    Etichette per barra (`formato(v)`, "" dove `mostra(v)` è falso), o None
+    oltre PUNTI_TESTO valori: Plotly allora non disegna testo.
+    """
+    if len(valori) > PUNTI_TESTO:
+        return None
+    return [formato(v) if mostra is None or mostra(v) else "" for v in valori]
+
+
+def colori_segno(valori, positivo: str, negativo: str, zero: str = None) -> list:
+    """
+    Colore per valore secondo il segno (zero: `positivo` se non indicato).
+    Lista, non array: un array di oggetti nella figura fa serializzare a
+    Plotly l'intera figura con l'encoder lento.
+    """
+    v = np.asarray(valori, dtype=float)
+    colori = np.where(v >= 0, positivo, negativo)
+    if zero is not None:
+        colori = np.where(v == 0, zero, colori)
+    return colori.tolist()
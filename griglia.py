@@ -0,0 +1,150 @@
+# ===============================================
+# ESTATE 2026 - GRIGLIA VIRTUALIZZATA DEI CODICI TURNO
+# Un solo elemento (iframe HTML), filtri e scorrimento lato browser
+# ===============================================
+#
+# Una cella st.markdown per codice turno significa centinaia di elementi
+# Streamlit per deposito e un delta lento verso il browser a ogni cambio di
+# filtro. Qui il catalogo viaggia una volta come JSON dentro un unico
+# componente HTML: deposito, tipo giorno e prefisso del codice si filtrano
+# in JavaScript, e della griglia sono nel DOM solo le righe visibili
+# (altezza di riga fissa, posizione calcolata dallo scroll).
+
+import json
+
+import pandas as pd
+
+
+ALTEZZA_GRIGLIA = 560   # px dell'iframe
+ALTEZZA_RIGA = 44       # px di una riga di celle o di un'intestazione di gruppo
+LARGHEZZA_CELLA = 110   # px minimi di una cella (il numero per riga segue la larghezza)
+
+ETICHETTE_VALID = {"Lu-Ve": "📅 Lunedì — Venerdì", "Sa": "📅 Sabato", "Do": "📅 Domenica"}
+
+
+def gruppi_codici(df: pd.DataFrame) -> list:
+    """
+    Catalogo (deposito, codice_turno, valid, dal, al) → un gruppo per
+    (deposito, valid) con i codici in ordine e il periodo di validità
+    (della prima riga del gruppo, come nell'esploratore originale).
+    """
+    gruppi = []
+    df = df.sort_values(["deposito", "valid", "codice_turno"], kind="stable")
+    for (dep, valid), g in df.groupby(["deposito", "valid"], observed=True, sort=False):
+        gruppi.append({
+            "d": str(dep), "v": str(valid),
+            "dal": pd.Timestamp(g["dal"].iloc[0]).strftime("%d/%m/%Y"),
+            "al": pd.Timestamp(g["al"].iloc[0]).strftime("%d/%m/%Y"),
+            "c": g["codice_turno"].astype(str).tolist(),
+        })
+    return gruppi
+
+
+def html_griglia_codici(df: pd.DataFrame, colori: dict, altezza: int = ALTEZZA_GRIGLIA) -> str:
+    """Pagina HTML autosufficiente dell'esploratore (`colori`: deposito → colore)."""
+    dati = {
+        "gruppi": gruppi_codici(df), "colori": colori, "etichette": ETICHETTE_VALID,
+        "riga": ALTEZZA_RIGA, "cella": LARGHEZZA_CELLA,
+    }
+    # "</" chiuderebbe il tag <script>
+    dati_js = json.dumps(dati, ensure_ascii=False).replace("</", "<\\/")
+    return _MODELLO.replace("__ALTEZZA__", str(altezza)).replace("__DATI__", dati_js)
+
+
+_MODELLO = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>
+  * { box-sizing: border-box; }
+  body { margin: 0; font-family: Arial, sans-serif; color: #e2e8f0; background: transparent; }
+  .barra { display: flex; flex-wrap: wrap; gap: 10px; align-items: center; margin-bottom: 10px; }
+  select, input { background: rgba(15,23,42,0.9); color: #e2e8f0; border: 1px solid rgba(96,165,250,0.35);
+                  border-radius: 8px; padding: 6px 10px; font-size: 0.9rem; }
+  input { width: 150px; text-transform: uppercase; }
+  .chip { background: rgba(15,23,42,0.8); color: #93c5fd; border: 1px solid rgba(96,165,250,0.35);
+          border-radius: 999px; padding: 5px 12px; font-size: 0.85rem; cursor: pointer; }
+  .chip.attivo { background: #2563eb; color: #fff; border-color: #2563eb; }
+  .kpi { margin-left: auto; color: #94a3b8; font-size: 0.85rem; }
+  .kpi b { color: #e2e8f0; }
+  #vista { position: relative; overflow-y: auto; border-radius: 8px; }
+  #spazio { position: relative; }
+  .riga { position: absolute; left: 0; right: 0; display: grid; gap: 6px; padding: 0 2px; }
+  .titolo { color: #93c5fd; font-weight: 700; font-size: 1rem; padding-top: 14px; white-space: nowrap; }
+  .titolo span { color: #64748b; font-size: 0.8rem; font-weight: 400; }
+  .cella { background: rgba(15,23,42,0.8); border-radius: 8px; padding: 8px 6px; text-align: center;
+           font-size: 0.85rem; font-weight: 700; height: 36px; overflow: hidden; white-space: nowrap; }
+  .vuoto { color: #64748b; padding: 20px 4px; }
+</style></head><body>
+<div class="barra">
+  <select id="deposito"></select>
+  <span id="tipi"></span>
+  <input id="prefisso" placeholder="Prefisso codice…" autocomplete="off">
+  <span class="kpi" id="kpi"></span>
+</div>
+<div id="vista"><div id="spazio"></div></div>
+<script>
+const D = __DATI__;
+const vista = document.getElementById("vista"), spazio = document.getElementById("spazio");
+const selDep = document.getElementById("deposito"), tipiBox = document.getElementById("tipi");
+const prefisso = document.getElementById("prefisso"), kpi = document.getElementById("kpi");
+const titolo = s => s.charAt(0).toUpperCase() + s.slice(1);
+const esc = s => s.replace(/[&<>"]/g, c => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c]));
+let tipo = "Tutti", righe = [], perRiga = 8;
+
+vista.style.height = (__ALTEZZA__ - 56) + "px";
+[...new Set(D.gruppi.map(g => g.d))].forEach(d => selDep.add(new Option(titolo(d), d)));
+
+function disegnaTipi() {
+  const tipi = ["Tutti", ...D.gruppi.filter(g => g.d === selDep.value).map(g => g.v)];
+  if (!tipi.includes(tipo)) tipo = "Tutti";
+  tipiBox.innerHTML = tipi.map(t => `<button class="chip${t === tipo ? " attivo" : ""}" data-t="${esc(t)}">${esc(t)}</button>`).join(" ");
+}
+
+// righe virtuali: un'intestazione per gruppo + righe da `perRiga` codici
+function calcola() {
+  const p = prefisso.value.trim().toUpperCase();
+  perRiga = Math.max(1, Math.floor((vista.clientWidth - 4) / D.cella));
+  righe = [];
+  let n = 0, tipiVisti = new Set(), periodo = null;
+  for (const g of D.gruppi) {
+    if (g.d !== selDep.value || (tipo !== "Tutti" && g.v !== tipo)) continue;
+    const codici = p ? g.c.filter(c => c.toUpperCase().startsWith(p)) : g.c;
+    if (!codici.length) continue;
+    n += codici.length; tipiVisti.add(g.v); periodo = periodo || `${g.dal} → ${g.al}`;
+    righe.push({titolo: `${esc(D.etichette[g.v] || g.v)} <span>(${codici.length} turni · ${g.dal} → ${g.al})</span>`});
+    for (let i = 0; i < codici.length; i += perRiga) righe.push({codici: codici.slice(i, i + perRiga)});
+  }
+  kpi.innerHTML = `🔢 <b>${n}</b> codici · 📋 <b>${tipiVisti.size}</b> tipi giorno · 📅 <b>${periodo || "—"}</b>`;
+  spazio.style.height = (righe.length * D.riga) + "px";
+  vista.scrollTop = 0;
+  disegna();
+}
+
+// solo le righe nella finestra visibile (più un margine) sono nel DOM
+function disegna() {
+  const colore = D.colori[selDep.value] || "#64748b";
+  const da = Math.max(0, Math.floor(vista.scrollTop / D.riga) - 5);
+  const a = Math.min(righe.length, Math.ceil((vista.scrollTop + vista.clientHeight) / D.riga) + 5);
+  let html = "";
+  for (let i = da; i < a; i++) {
+    const r = righe[i], top = i * D.riga;
+    html += r.titolo
+      ? `<div class="riga titolo" style="top:${top}px">${r.titolo}</div>`
+      : `<div class="riga" style="top:${top}px;grid-template-columns:repeat(${perRiga},1fr)">` +
+        r.codici.map(c => `<div class="cella" style="border:1px solid ${colore}55;border-left:3px solid ${colore}">${esc(c)}</div>`).join("") +
+        `</div>`;
+  }
+  spazio.innerHTML = righe.length ? html : `<div class="vuoto">Nessun codice turno per i filtri scelti.</div>`;
+}
+
+let inAttesa = false;
+vista.addEventListener("scroll", () => {
+  if (!inAttesa) { inAttesa = true; requestAnimationFrame(() => { inAttesa = false; disegna(); }); }
+});
+selDep.addEventListener("change", () => { disegnaTipi(); calcola(); });
+tipiBox.addEventListener("click", e => { if (e.target.dataset.t) { tipo = e.target.dataset.t; disegnaTipi(); calcola(); } });
+prefisso.addEventListener("input", calcola);
+new ResizeObserver(() => {
+  if (Math.max(1, Math.floor((vista.clientWidth - 4) / D.cella)) !== perRiga) calcola();
+}).observe(vista);
+disegnaTipi(); calcola();
+</script></body></html>
+"""
@@ -0,0 +1,277 @@
+# ===============================================
+# ESTATE 2026 - NOTIFICHE DI MODIFICA (LISTEN/NOTIFY)
+# Trigger sulle tabelle sorgente + un ascoltatore per processo
+# ===============================================
+#
+# I trigger per istruzione su ogni tabella sorgente fanno due cose:
+#
+#   - scrivono nel REGISTRO le partizioni (giorno, deposito) toccate dalle
+#     righe nuove e vecchie del comando (tabelle di transizione), con l'id
+#     della transazione: la rivalidazione degli snapshot rilegge solo
+#     quelle, invece di confrontare la stagione intera;
+#   - inviano sul canale CANALE il nome della tabella modificata (Postgres
+#     consegna la notifica solo al commit, e una volta per transazione per
+#     ogni tabella). L'app tiene una connessione in LISTEN e, a ogni raffica
+#     di notifiche, chiama `on_modifiche(tabelle)`.
+#
+# I trigger si installano una volta, con un utente che ha i privilegi (la
+# funzione gira con i suoi diritti: chi scrive le tabelle non ha bisogno di
+# scrivere il registro; l'utente dell'app deve poterlo leggere):
+#
+#   python notifiche.py --dsn postgresql://... [--rimuovi]
+
+import argparse
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+
+log = logging.getLogger(__name__)
+
+CANALE = "estate2026_modifiche"
+TABELLE_NOTIFICATE = ("roster", "roster2", "turni", "turni_giornalieri", "assenze", "calendar")
+NOME_TRIGGER = "estate2026_notifica"
+REGISTRO = "estate2026_registro_modifiche"
+# Oltre, le righe del registro si cancellano: deve superare l'intervallo tra
+# due riletture complete degli snapshot (SNAPSHOT_COMPLETO dell'app).
+CONSERVAZIONE_REGISTRO = "2 days"
+
+# Tabella → (FROM, giorno, deposito) della partizione di una riga, con
+# {righe} al posto della tabella. deposito NULL: la riga vale per tutti i
+# depositi del giorno (calendario). Le tabelle senza voce (turni) e i
+# TRUNCATE registrano giorno NULL: tutta la tabella.
+PARTIZIONI = {
+    "roster":            ("{righe} t",                                          "t.data", "t.deposito"),
+    "roster2":           ("{righe} t",                                          "t.data", "t.deposito"),
+    "turni_giornalieri": ("{righe} t",                                          "t.data", "t.deposito"),
+    "assenze":           ("{righe} t JOIN calendar c ON c.daytype = t.daytype", "c.data", "t.deposito"),
+    "calendar":          ("{righe} t",                                          "t.data", "NULL::text"),
+}
+
+# (suffisso, evento, tabelle di transizione) dei trigger per tabella: una
+# tabella di transizione vale per un solo evento, quindi un trigger ciascuno
+EVENTI = (
+    ("ins", "INSERT",   "REFERENCING NEW TABLE AS nuove"),
+    ("upd", "UPDATE",   "REFERENCING OLD TABLE AS vecchie NEW TABLE AS nuove"),
+    ("del", "DELETE",   "REFERENCING OLD TABLE AS vecchie"),
+    ("tru", "TRUNCATE", ""),
+)
+
+_REGISTRO = f"""
+    CREATE TABLE IF NOT EXISTS {REGISTRO} (
+        xid      bigint      NOT NULL DEFAULT txid_current(),
+        tabella  text        NOT NULL,
+        giorno   date,
+        deposito text,
+        il       timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS {REGISTRO}_xid ON {REGISTRO} (xid);
+    CREATE INDEX IF NOT EXISTS {REGISTRO}_il ON {REGISTRO} (il);
+"""
+
+# Argomenti del trigger: FROM, giorno, deposito (PARTIZIONI), o nessuno
+_FUNZIONE = f"""
+    CREATE OR REPLACE FUNCTION {NOME_TRIGGER}() RETURNS trigger
+    LANGUAGE plpgsql SECURITY DEFINER SET search_path FROM CURRENT AS $$
+    DECLARE
+        fonti text[] := CASE TG_OP WHEN 'INSERT' THEN ARRAY['nuove'] WHEN 'DELETE' THEN ARRAY['vecchie']
+                                   WHEN 'UPDATE' THEN ARRAY['nuove', 'vecchie'] END;
+    BEGIN
+        IF TG_OP = 'TRUNCATE' OR TG_NARGS = 0 THEN
+            INSERT INTO {REGISTRO} (tabella) VALUES (TG_TABLE_NAME);
+        ELSE
+            EXECUTE 'INSERT INTO {REGISTRO} (tabella, giorno, deposito) ' || (
+                SELECT string_agg(format('SELECT DISTINCT %L, %s, %s FROM %s', TG_TABLE_NAME, TG_ARGV[1], TG_ARGV[2],
+                                         replace(TG_ARGV[0], '{{righe}}', f)), ' UNION ')
+                FROM unnest(fonti) AS f
+            );
+        END IF;
+        IF random() < 0.01 THEN
+            DELETE FROM {REGISTRO} WHERE il < now() - INTERVAL '{CONSERVAZIONE_REGISTRO}';
+        END IF;
+        PERFORM pg_notify('{CANALE}', TG_TABLE_NAME);
+        RETURN NULL;
+    END $$;
+"""
+
+
+def _argomenti(tabella: str) -> str:
+    """Argomenti del trigger di `tabella` come letterali SQL ('' se non partizionata)."""
+    if tabella not in PARTIZIONI:
+        return ""
+    return ", ".join("'" + a.replace("'", "''") + "'" for a in PARTIZIONI[tabella])
+
+
+def installa_trigger(conn, tabelle=TABELLE_NOTIFICATE) -> list:
+    """Crea (o ricrea) registro, funzione e trigger; restituisce le tabelle coperte (quelle esistenti)."""
+    coperte = []
+    with conn.cursor() as cur:
+        cur.execute(_REGISTRO)
+        cur.execute(_FUNZIONE)
+        for t in tabelle:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (t,))
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"DROP TRIGGER IF EXISTS {NOME_TRIGGER} ON {t};")   # trigger unico delle versioni precedenti
+            for suffisso, evento, transizione in EVENTI:
+                cur.execute(f"""
+                    DROP TRIGGER IF EXISTS {NOME_TRIGGER}_{suffisso} ON {t};
+                    CREATE TRIGGER {NOME_TRIGGER}_{suffisso}
+                        AFTER {evento} ON {t} {transizione}
+                        FOR EACH STATEMENT EXECUTE FUNCTION {NOME_TRIGGER}({_argomenti(t)});
+                """)
+            coperte.append(t)
+    conn.commit()
+    return coperte
+
+
+def rimuovi_trigger(conn, tabelle=TABELLE_NOTIFICATE) -> None:
+    with conn.cursor() as cur:
+        for t in tabelle:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (t,))
+            if cur.fetchone()[0]:
+                cur.execute(f"DROP TRIGGER IF EXISTS {NOME_TRIGGER} ON {t};")
+                for suffisso, _, _ in EVENTI:
+                    cur.execute(f"DROP TRIGGER IF EXISTS {NOME_TRIGGER}_{suffisso} ON {t};")
+        cur.execute(f"DROP FUNCTION IF EXISTS {NOME_TRIGGER}();")
+        cur.execute(f"DROP TABLE IF EXISTS {REGISTRO};")
+    conn.commit()
+
+
+def tabelle_con_trigger(conn) -> list:
+    """Tabelle (nel search_path) su cui il trigger di notifica è installato."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid
+            WHERE t.tgname LIKE %s AND pg_table_is_visible(c.oid)
+            ORDER BY c.relname
+        """, (NOME_TRIGGER + "%",))
+        return [r[0] for r in cur.fetchall()]
+
+
+class AscoltatoreModifiche:
+    """
+    Thread di background in LISTEN su CANALE, con una connessione dedicata
+    (fuori dal pool: LISTEN vale per la sessione).
+
+    Le notifiche che arrivano entro `raffica` secondi l'una dall'altra sono
+    consegnate insieme a `on_modifiche(set_di_tabelle)`. Dopo una
+    riconnessione le notifiche perse non sono recuperabili: si segnalano
+    come modificate tutte le tabelle notificate.
+    """
+
+    def __init__(
+        self, dsn: str, on_modifiche, raffica: float = 0.5,
+        attesa_min: float = 2.0, attesa_max: float = 60.0, **connect_kwargs,
+    ):
+        self.dsn = dsn
+        self.on_modifiche = on_modifiche
+        self.raffica = raffica
+        self.attesa_min = attesa_min
+        self.attesa_max = attesa_max
+        self.connect_kwargs = {"keepalives": 1, "keepalives_idle": 30, **connect_kwargs}
+        self.connesso = False
+        self.tabelle: list = []        # tabelle con trigger installato
+        self.eventi = 0
+        self.ultimo_evento = None
+        self.errore = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def avvia(self) -> "AscoltatoreModifiche":
+        self._thread = threading.Thread(target=self._ciclo, name="notifiche-db", daemon=True)
+        self._thread.start()
+        return self
+
+    def ferma(self) -> None:
+        self._stop.set()
+
+    def stato(self) -> dict:
+        return {
+            "connesso": self.connesso, "tabelle": list(self.tabelle), "eventi": self.eventi,
+            "ultimo_evento": self.ultimo_evento, "errore": self.errore,
+        }
+
+    # ── ciclo ─────────────────────────────────────────────────────────
+    def _ciclo(self) -> None:
+        attesa, riconnessione = self.attesa_min, False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+                conn.autocommit = True
+                self.tabelle = tabelle_con_trigger(conn)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CANALE};")
+                self.connesso, self.errore, attesa = True, None, self.attesa_min
+                if riconnessione:
+                    self._consegna(set(self.tabelle))
+                riconnessione = True
+                self._ascolta(conn)
+            except Exception as e:
+                log.warning("Ascolto notifiche interrotto: %s", e)
+                self.errore = str(e)
+            finally:
+                self.connesso = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(attesa)
+            attesa = min(attesa * 2, self.attesa_max)
+
+    def _ascolta(self, conn) -> None:
+        while not self._stop.is_set():
+            if not select.select([conn], [], [], 5.0)[0]:
+                continue
+            conn.poll()
+            tabelle = self._svuota(conn)
+            # raccoglie il resto della raffica (una transazione lunga = più notifiche)
+            while tabelle and select.select([conn], [], [], self.raffica)[0]:
+                conn.poll()
+                tabelle |= self._svuota(conn)
+            if tabelle:
+                self._consegna(tabelle)
+
+    @staticmethod
+    def _svuota(conn) -> set:
+        tabelle = {n.payload for n in conn.notifies}
+        conn.notifies.clear()
+        return tabelle
+
+    def _consegna(self, tabelle: set) -> None:
+        self.eventi += 1
+        self.ultimo_evento = time.time()
+        try:
+            self.on_modifiche(tabelle)
+        except Exception as e:
+            log.warning("Invalidazione per %s fallita: %s", sorted(tabelle), e)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Installa i trigger di notifica delle modifiche")
+    ap.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--rimuovi", action="store_true", help="rimuove trigger e funzione")
+    args = ap.parse_args()
+    if not args.dsn:
+        ap.error("serve --dsn o DATABASE_URL")
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        if args.rimuovi:
+            rimuovi_trigger(conn)
+            print("Trigger di notifica rimossi.")
+        else:
+            coperte = installa_trigger(conn)
+            print(f"Trigger {NOME_TRIGGER}_* su: {', '.join(coperte)} (canale {CANALE}, registro {REGISTRO})")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# ===============================================
+# ESTATE 2026 - STRUMENTAZIONE TEMPI
+# Span per rerun (tempo, righe, byte) + storico p50/p95
+# ===============================================
+#
+# Una Traccia per sessione. Il thread che esegue lo script la attiva con
+# attiva(); span() e @tracciata registrano nella traccia attiva del thread
+# corrente e non fanno nulla se non ce n'è una (sessioni non admin). Un
+# fragment che si riesegue da solo è un rerun a sé: lo apre e lo chiude
+# il fragment stesso (fragment_tracciato in app.py).
+
+import functools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+class Traccia:
+    """Span del rerun corrente e storico dei tempi per nome di span."""
+
+    def __init__(self, finestra: int = 200):
+        self._lock = threading.Lock()
+        self.storico: dict = defaultdict(lambda: deque(maxlen=finestra))
+        self.corrente: list = []
+        self.ultimo: list = []
+        self.reruns = 0
+        self._t0 = time.perf_counter()
+
+    # ── rerun ─────────────────────────────────────────────────────────
+    def inizia_rerun(self) -> None:
+        with self._lock:
+            self.corrente = []
+            self._t0 = time.perf_counter()
+
+    def chiudi_rerun(self, nome: str = "rerun") -> None:
+        """Chiude il rerun con uno span `nome` sul tempo totale (es. "rerun.<fragment>")."""
+        totale = (time.perf_counter() - self._t0) * 1000
+        with self._lock:
+            self.corrente.append({"span": nome, "ms": totale, "inizio_ms": 0.0, "righe": None, "byte": None})
+            self.storico[nome].append(totale)
+            self.ultimo, self.corrente = self.corrente, []
+            self.reruns += 1
+
+    # ── span ──────────────────────────────────────────────────────────
+    @contextmanager
+    def span(self, nome: str):
+        """Misura il blocco; il dict restituito accetta `righe` e `byte` (vedi misura())."""
+        rec = {"span": nome, "righe": None, "byte": None}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["ms"] = (time.perf_counter() - t0) * 1000
+            rec["inizio_ms"] = (t0 - self._t0) * 1000
+            with self._lock:
+                self.corrente.append(rec)
+                self.storico[nome].append(rec["ms"])
+
+    # ── lettura ───────────────────────────────────────────────────────
+    def dettaglio(self) -> pd.DataFrame:
+        """Span dell'ultimo rerun completo, in ordine di inizio."""
+        df = pd.DataFrame(self.ultimo, columns=["span", "inizio_ms", "ms", "righe", "byte"])
+        return df.sort_values("inizio_ms", kind="stable").reset_index(drop=True)
+
+    def percentili(self) -> pd.DataFrame:
+        with self._lock:
+            storico = {k: np.array(v) for k, v in self.storico.items() if v}
+        righe = [
+            {"span": k, "n": len(v), "p50_ms": float(np.percentile(v, 50)), "p95_ms": float(np.percentile(v, 95))}
+            for k, v in storico.items()
+        ]
+        return pd.DataFrame(righe, columns=["span", "n", "p50_ms", "p95_ms"]).sort_values("p95_ms", ascending=False)
+
+    def esporta_json(self) -> str:
+        return json.dumps({
+            "esportato_il": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "reruns": self.reruns,
+            "ultimo_rerun": self.dettaglio().to_dict(orient="records"),
+            "percentili": self.percentili().to_dict(orient="records"),
+            "storico_ms": {k: list(v) for k, v in self.storico.items()},
+        }, indent=2, default=lambda o: None if pd.isna(o) else o)
+
+
+# --------------------------------------------------
+# TRACCIA ATTIVA PER THREAD
+# --------------------------------------------------
+_locale = threading.local()
+
+
+def attiva(traccia) -> None:
+    """Imposta (o azzera, con None) la traccia del thread corrente."""
+    _locale.traccia = traccia
+
+
+def traccia_attiva():
+    return getattr(_locale, "traccia", None)
+
+
+@contextmanager
+def span(nome: str):
+    t = traccia_attiva()
+    if t is None:
+        yield {}
+        return
+    with t.span(nome) as rec:
+        yield rec
+
+
+def tracciata(nome: str):
+    """Decoratore: ogni chiamata è uno span `nome`."""
+    def decora(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(nome):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decora
+
+
+def misura(rec: dict, df) -> None:
+    """Registra righe e byte di un DataFrame nello span `rec` (no-op fuori traccia)."""
+    if "span" not in rec or df is None:
+        return
+    rec["righe"] = len(df)
+    rec["byte"] = int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,70 @@
+# ===============================================
+# ESTATE 2026 - AGGREGATI PER PERIODO (giorno / settimana / mese)
+# Grafici a dimensione limitata qualunque sia la lunghezza del periodo
+# ===============================================
+#
+# Una barra (o una cella di heatmap) per giorno va bene per una stagione;
+# su un anno con molti depositi il payload Plotly esplode e le etichette
+# "%d/%m" si ripetono tra un anno e l'altro. La risoluzione si sceglie
+# dalla lunghezza del periodo selezionato: oltre GIORNI_MAX[risoluzione]
+# si passa alla successiva. Negli aggregati i valori sono medie
+# giornaliere nel periodo: stessa unità (persone, turni) dei dati per giorno.
+
+from datetime import date
+
+import pandas as pd
+
+
+RISOLUZIONI = ("giorno", "settimana", "mese")
+
+# Giorni massimi del periodo selezionato per ogni risoluzione (oltre: la successiva)
+GIORNI_MAX = {"giorno": 92, "settimana": 731}
+
+# Frequenze pandas dei periodi (settimane da lunedì)
+_FREQUENZA = {"settimana": "W-SUN", "mese": "M"}
+
+# Formato delle date sugli assi e nei tooltip Plotly
+FORMATO_TICK = {"giorno": "%d/%m", "settimana": "%d/%m/%y", "mese": "%m/%Y"}
+FORMATO_HOVER = {"giorno": "%{x|%d/%m/%Y}", "settimana": "sett. %{x|%d/%m/%Y}", "mese": "%{x|%m/%Y}"}
+
+# Etichette di colonna (heatmap): uniche nel periodo a ogni risoluzione
+_FORMATO_ETICHETTA = {"giorno": "%d/%m", "settimana": "%d/%m/%y", "mese": "%m/%Y"}
+
+
+def scegli_risoluzione(dal: date, al: date) -> str:
+    """Risoluzione dei grafici per il periodo [dal, al]."""
+    giorni = (pd.Timestamp(al) - pd.Timestamp(dal)).days + 1
+    for risoluzione in RISOLUZIONI[:-1]:
+        if giorni <= GIORNI_MAX[risoluzione]:
+            return risoluzione
+    return RISOLUZIONI[-1]
+
+
+def inizio_periodo(giorni: pd.Series, risoluzione: str) -> pd.Series:
+    """Primo giorno del periodo (settimana/mese) di ogni data; invariato per "giorno"."""
+    if risoluzione == "giorno":
+        return giorni
+    return giorni.dt.to_period(_FREQUENZA[risoluzione]).dt.start_time
+
+
+def etichette(giorni: pd.Series, risoluzione: str) -> pd.Series:
+    return giorni.dt.strftime(_FORMATO_ETICHETTA[risoluzione])
+
+
+def rollup(df: pd.DataFrame, risoluzione: str, misure: tuple, per: tuple = ()) -> pd.DataFrame:
+    """
+    Somma `misure` per giorno (e per le colonne `per`); per settimana/mese
+    ne fa la media giornaliera nel periodo, con `giorni` = giorni presenti.
+    La colonna del periodo resta "giorno" (il suo primo giorno).
+    """
+    chiavi = ["giorno", *per]
+    if len(df) == 0:
+        return pd.DataFrame(columns=chiavi + list(misure))
+    giornaliero = df.groupby(chiavi, observed=True)[list(misure)].sum().reset_index()
+    if risoluzione == "giorno":
+        return giornaliero
+    giornaliero["giorno"] = inizio_periodo(giornaliero["giorno"], risoluzione)
+    gruppi = giornaliero.groupby(chiavi, observed=True)
+    out = gruppi[list(misure)].mean()
+    out["giorni"] = gruppi.size()
+    return out.reset_index()
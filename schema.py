@@ -0,0 +1,97 @@
+# ===============================================
+# ESTATE 2026 - SCHEMA COLONNE DEI DATASET
+# Tipi compatti applicati a ogni frame caricato
+# ===============================================
+#
+# st.cache_data serializza e copia i frame per ogni chiamante: stringhe
+# ripetute come oggetti Python e conteggi in int64 moltiplicano memoria e
+# costo della copia. Qui si dichiara, per nome di colonna, il tipo compatto.
+
+import numpy as np
+import pandas as pd
+
+
+# Valori ripetuti (pochi distinti) → category
+COLONNE_CATEGORIA = frozenset({
+    "deposito", "tipo_giorno", "categoria_giorno", "scenario", "daytype", "valid",
+})
+
+# Date → datetime64
+COLONNE_DATA = frozenset({"giorno", "data", "dal", "al"})
+
+# Conteggi di persone/turni → intero più piccolo che contiene i valori.
+# Se una colonna arriva con decimali (stime statistiche) o NULL resta float64.
+COLONNE_CONTEGGIO = frozenset({
+    "totale_autisti", "assenze_programmate", "assenze_previste", "turni_richiesti",
+    "disponibili_netti", "gap", "turni", "persone_in_forza", "assenze_nominali",
+    "assenze_statistiche", "infortuni", "malattie", "legge_104", "altre_assenze",
+    "congedo_parentale", "permessi_vari", "ferie_programmate", "riposi", "ps",
+    "aspettativa", "congedo_straord", "non_in_forza", "giorni_attivi",
+    "dipendenti_medi_giorno",
+})
+
+
+def _intero_compatto(s: pd.Series) -> pd.Series:
+    if s.dtype.kind == "f":
+        if s.isna().any() or not np.array_equal(s.to_numpy(), np.round(s.to_numpy())):
+            return s
+    elif s.dtype.kind not in "iu":
+        return s
+    return pd.to_numeric(s, downcast="integer")
+
+
+def compatta(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte le colonne note ai tipi compatti dello schema (le altre restano invariate)."""
+    conversioni = {}
+    for col in df.columns:
+        s = df[col]
+        if col in COLONNE_CATEGORIA and not isinstance(s.dtype, pd.CategoricalDtype):
+            conversioni[col] = s.astype("category")
+        elif col in COLONNE_DATA and s.dtype.kind != "M":
+            conversioni[col] = pd.to_datetime(s)
+        elif col in COLONNE_CONTEGGIO:
+            c = _intero_compatto(s)
+            if c.dtype != s.dtype:
+                conversioni[col] = c
+    if not conversioni:
+        return df
+    out = df.assign(**conversioni)
+    out.attrs = dict(df.attrs)
+    return out
+
+
+def senza_categorie_inutili(df: pd.DataFrame) -> pd.DataFrame:
+    """Dopo un filtro: elimina le categorie non più presenti (groupby/pivot non le riportano)."""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def _espansa(df: pd.DataFrame) -> pd.DataFrame:
+    """Lo stesso frame con i tipi "larghi" di pd.read_sql (oggetti Python, int64)."""
+    conversioni = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) or s.dtype.kind in "OUT" or pd.api.types.is_string_dtype(s):
+            conversioni[col] = s.astype(object)
+        elif s.dtype.kind in "iu":
+            conversioni[col] = s.astype("int64")
+    return df.assign(**conversioni)
+
+
+def report_memoria(frames: dict) -> pd.DataFrame:
+    """Byte occupati per dataset: tipi larghi vs schema compatto."""
+    righe = []
+    for nome, df in frames.items():
+        if df is None or len(df.columns) == 0:
+            continue
+        prima = int(_espansa(df).memory_usage(deep=True, index=False).sum())
+        dopo = int(compatta(df).memory_usage(deep=True, index=False).sum())
+        righe.append({
+            "dataset": nome, "righe": len(df),
+            "prima_kb": prima / 1024, "dopo_kb": dopo / 1024,
+            "risparmio_kb": (prima - dopo) / 1024,
+            "fattore": prima / dopo if dopo else np.nan,
+        })
+    return pd.DataFrame(righe)
@@ -0,0 +1,345 @@
+# ===============================================
+# ESTATE 2026 - SNAPSHOT COLONNARI SU DISCO
+# Avvio a caldo dai dati dell'ultima lettura + rivalidazione in background
+# ===============================================
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # snapshot disattivati: si legge sempre dal database
+    pa = pq = None
+
+
+log = logging.getLogger(__name__)
+
+META_KEY = b"estate2026"
+
+
+# Giorni cambiati distanti al massimo tanto finiscono nello stesso riquadro
+# di rilettura (una query); oltre, si apre un riquadro nuovo.
+GIORNI_RIQUADRO = 7
+
+
+class Incrementale(NamedTuple):
+    """
+    Rivalidazione per partizioni (giorno, deposito) invece che per intero.
+
+    - `segno()` → punto del registro delle modifiche prima del quale ogni
+      transazione è conclusa (None = registro assente o non leggibile).
+    - `modifiche(tabelle, dal_segno)` → DataFrame (tabella, giorno, deposito)
+      delle partizioni toccate da `dal_segno` in poi: deposito None = tutti
+      i depositi, giorno None = tutta la tabella.
+    - `contatori(tabelle)` → {tabella: contatore modifiche}: senza registro
+      dicono solo se rileggere il dataset per intero.
+    - `fetch_riquadro(depositi, dal, al)` → il dataset ristretto al riquadro
+      (depositi None = tutti). None = dataset non partizionato: si rilegge
+      per intero.
+    - `normalizza` → applicata al frame unito (es. tipi compatti).
+    """
+    tabelle: tuple
+    contatori: Callable
+    segno: Optional[Callable] = None
+    modifiche: Optional[Callable] = None
+    fetch_riquadro: Optional[Callable] = None
+    chiavi: tuple = ("giorno", "deposito")
+    normalizza: Callable = lambda df: df
+
+
+def riquadri(cambiate: pd.DataFrame) -> list:
+    """
+    Partizioni cambiate → riquadri (depositi, dal, al) da rileggere.
+
+    Per ogni deposito i giorni sono raggruppati in tratti senza buchi più
+    lunghi di GIORNI_RIQUADRO; tratti con le stesse date su più depositi
+    diventano un solo riquadro. Se un cambiamento vale per ogni deposito
+    (es. il calendario) tutti i tratti coprono tutti i depositi: i riquadri
+    non si sovrappongono mai.
+    """
+    if len(cambiate) == 0:
+        return []
+    cambiate = cambiate.assign(giorno=pd.to_datetime(cambiate["giorno"]))
+    if cambiate["deposito"].isna().any():
+        gruppi = [(None, cambiate["giorno"])]
+    else:
+        gruppi = [((dep,), g) for dep, g in cambiate.groupby("deposito")["giorno"]]
+    tratti: dict = {}
+    for depositi, giorni in gruppi:
+        giorni = giorni.drop_duplicates().sort_values()
+        for _, tratto in giorni.groupby((giorni.diff().dt.days > GIORNI_RIQUADRO).cumsum()):
+            date = (tratto.min().date(), tratto.max().date())
+            tratti[date] = None if depositi is None else tratti.get(date, ()) + depositi
+    return [(depositi, dal, al) for (dal, al), depositi in sorted(tratti.items())]
+
+
+def unisci_riquadri(df: pd.DataFrame, nuovi: list, chiavi: tuple) -> pd.DataFrame:
+    """Sostituisce in `df` le righe di ogni riquadro con quelle rilette; ordine per `chiavi`."""
+    giorno = pd.to_datetime(df["giorno"])
+    dentro = pd.Series(False, index=df.index)
+    for (depositi, dal, al), _ in nuovi:
+        riquadro = giorno.between(pd.Timestamp(dal), pd.Timestamp(al))
+        if depositi is not None:
+            riquadro &= df["deposito"].isin(depositi)
+        dentro |= riquadro
+    parti = [df[~dentro]] + [n for _, n in nuovi]
+    # categorie diverse tra le parti: si unisce a valori e si ricompatta dopo
+    parti = [p.astype({c: object for c in p.columns if isinstance(p[c].dtype, pd.CategoricalDtype)}) for p in parti]
+    out = pd.concat(parti, ignore_index=True)
+    return out.sort_values(list(chiavi), kind="stable").reset_index(drop=True)
+
+
+def versione_contenuto(df: pd.DataFrame) -> str:
+    """Versione del dataset = hash del contenuto (stabile tra riavvii)."""
+    h = hashlib.sha1(",".join(map(str, df.columns)).encode())
+    if len(df):
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+
+class SnapshotStore:
+    """
+    Snapshot Parquet (zstd) dei dataset, uno per nome.
+
+    `servi()` restituisce subito lo snapshot su disco se esiste; se è più
+    vecchio di `ttl` secondi avvia una sola rilettura in background. Se il
+    contenuto letto dal database è cambiato lo snapshot viene riscritto e
+    si chiama `on_change` (es. per svuotare la cache Streamlit del loader).
+
+    Con un `Incrementale` la rilettura segue le modifiche: accanto allo
+    snapshot (`<nome>.stato.json`) resta il segno del registro delle
+    modifiche all'ultima lettura; si rileggono solo le partizioni toccate
+    da allora e si fondono nello snapshot, con un costo che dipende da
+    quanto è cambiato e non dalla lunghezza della stagione. Senza registro
+    un contatore di modifiche cambiato fa rileggere tutto. Ogni
+    `completo_ogni` secondi la rilettura è comunque completa.
+
+    `rivalida_ora()` rivalida subito (e in modo sincrono) un dataset già
+    servito, es. su notifica di modifica dal database: le rivalidazioni di
+    uno stesso dataset non si sovrappongono mai.
+    """
+
+    def __init__(self, directory: str, ttl: float = 600.0, completo_ogni: float = 6 * 3600.0):
+        self.directory = directory
+        self.ttl = ttl
+        self.completo_ogni = completo_ogni
+        self.abilitato = pq is not None
+        self.errori: dict = {}
+        self._lock = threading.Lock()
+        self._in_corso: set = set()
+        self._lock_dataset: dict = {}
+        self._sorgenti: dict = {}  # nome → (fetch, on_change, incrementale) dell'ultimo servi()
+        if self.abilitato:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, nome: str) -> str:
+        return os.path.join(self.directory, f"{nome}.parquet")
+
+    def _path_stato(self, nome: str) -> str:
+        return os.path.join(self.directory, f"{nome}.stato.json")
+
+    def _lock_di(self, nome: str) -> threading.Lock:
+        with self._lock:
+            return self._lock_dataset.setdefault(nome, threading.Lock())
+
+    def _versione(self, nome: str):
+        """Versione dello snapshot su disco (solo metadati), None se manca."""
+        try:
+            return json.loads(pq.read_schema(self._path(nome)).metadata[META_KEY])["versione"]
+        except Exception:
+            return None
+
+    # ── lettura / scrittura ───────────────────────────────────────────
+    def leggi(self, nome: str):
+        """(df, meta) oppure None se lo snapshot manca o è illeggibile."""
+        if not self.abilitato or not os.path.exists(self._path(nome)):
+            return None
+        try:
+            table = pq.read_table(self._path(nome))
+            meta = json.loads(table.schema.metadata[META_KEY])
+            df = table.to_pandas()
+        except Exception as e:
+            log.warning("Snapshot %s illeggibile: %s", nome, e)
+            return None
+        df.attrs["versione"] = meta["versione"]
+        return df, meta
+
+    def scrivi(self, nome: str, df: pd.DataFrame) -> dict:
+        meta = {
+            "versione": df.attrs.get("versione") or versione_contenuto(df),
+            "validato_il": time.time(),
+            "righe": len(df),
+        }
+        if not self.abilitato:
+            return meta
+        self._scrivi_parquet(self._path(nome), df, meta)
+        return meta
+
+    @staticmethod
+    def _scrivi_parquet(path: str, df: pd.DataFrame, meta: dict) -> None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), META_KEY: json.dumps(meta)})
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+
+    def leggi_stato(self, nome: str, versione: str):
+        """Stato della rilettura incrementale, se corrisponde allo snapshot `versione`."""
+        path = self._path_stato(nome)
+        if not self.abilitato or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                stato = json.load(f)
+        except Exception as e:
+            log.warning("Stato %s illeggibile: %s", nome, e)
+            return None
+        return stato if stato.get("versione") == versione else None
+
+    def scrivi_stato(self, nome: str, versione: str, segno, contatori, completo_il: float) -> None:
+        if not self.abilitato:
+            return
+        stato = {
+            "versione": versione, "segno": segno, "contatori": contatori,
+            "validato_il": time.time(), "completo_il": completo_il,
+        }
+        tmp = self._path_stato(nome) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(stato, f)
+        os.replace(tmp, self._path_stato(nome))
+
+    @staticmethod
+    def _segni(inc: Incrementale) -> tuple:
+        """(segno, contatori) attuali: i contatori solo se manca il registro."""
+        segno = inc.segno() if inc.segno is not None else None
+        return segno, (inc.contatori(inc.tabelle) if segno is None else None)
+
+    # ── servizio ──────────────────────────────────────────────────────
+    def servi(self, nome: str, fetch, on_change=None, incrementale: Incrementale = None) -> pd.DataFrame:
+        self._sorgenti[nome] = (fetch, on_change, incrementale)
+        snap = self.leggi(nome)
+        if snap is None:
+            return self._rivalida_completa(nome, fetch, incrementale)
+        df, meta = snap
+        validato_il = meta.get("validato_il", 0)
+        if incrementale:
+            stato = self.leggi_stato(nome, meta["versione"])
+            if stato is not None:
+                validato_il = max(validato_il, stato["validato_il"])
+        if time.time() - validato_il > self.ttl:
+            self.rivalida_async(nome, fetch, meta["versione"], on_change, incrementale)
+        return df
+
+    def rivalida_async(self, nome: str, fetch, versione: str, on_change=None, incrementale=None) -> None:
+        with self._lock:
+            if nome in self._in_corso:
+                return
+            self._in_corso.add(nome)
+        threading.Thread(
+            target=self._rivalida_in_background, args=(nome, fetch, versione, on_change, incrementale),
+            name=f"snapshot-{nome}", daemon=True,
+        ).start()
+
+    def rivalida_ora(self, nome: str, tabelle=()) -> bool:
+        """
+        Rivalida subito il dataset `nome`, trattando `tabelle` come modificate
+        anche se i contatori non lo mostrano ancora (senza registro). False
+        se il dataset non è mai stato servito da questo processo o non ha
+        snapshot.
+        """
+        if nome not in self._sorgenti or not self.abilitato:
+            return False
+        versione = self._versione(nome)
+        if versione is None:
+            return False
+        fetch, on_change, incrementale = self._sorgenti[nome]
+        self._rivalida(nome, fetch, versione, on_change, incrementale, forza=tuple(tabelle))
+        return True
+
+    def _rivalida_in_background(self, *args) -> None:
+        try:
+            self._rivalida(*args)
+        finally:
+            with self._lock:
+                self._in_corso.discard(args[0])
+
+    def _rivalida(self, nome: str, fetch, versione: str, on_change, incrementale=None, forza=()) -> None:
+        with self._lock_di(nome):
+            # una rivalidazione appena conclusa può aver già riscritto lo snapshot
+            versione = self._versione(nome) or versione
+            try:
+                stato = self.leggi_stato(nome, versione) if incrementale else None
+                if stato is not None and time.time() - stato["completo_il"] < self.completo_ogni:
+                    df = self._rivalida_delta(nome, fetch, incrementale, stato, forza=forza)
+                else:
+                    df = self._rivalida_completa(nome, fetch, incrementale)
+                self.errori.pop(nome, None)
+                if df is not None and df.attrs["versione"] != versione and on_change is not None:
+                    on_change()
+            except Exception as e:
+                log.warning("Rivalidazione snapshot %s fallita: %s", nome, e)
+                self.errori[nome] = str(e)
+
+    def _rivalida_completa(self, nome: str, fetch, incrementale) -> pd.DataFrame:
+        # segno letto PRIMA dei dati: una modifica che cade in mezzo risulta
+        # toccata alla verifica successiva, mai persa
+        if incrementale:
+            segno, contatori = self._segni(incrementale)
+        df = fetch()
+        df.attrs["versione"] = versione_contenuto(df)
+        self._scrivi_sicuro(nome, df)
+        if incrementale:
+            self._scrivi_stato_sicuro(nome, df.attrs["versione"], segno, contatori, time.time())
+        return df
+
+    def _rivalida_delta(self, nome: str, fetch, inc: Incrementale, stato: dict, forza=()):
+        """
+        Rilegge solo le partizioni toccate dall'ultimo segno; None se nulla è
+        cambiato. Senza registro (o senza segno nello stato) si confrontano
+        i contatori, con le tabelle in `forza` comunque cambiate (i contatori
+        delle statistiche arrivano con qualche istante di ritardo sul commit).
+        """
+        segno, contatori = self._segni(inc)
+        if segno is None or stato.get("segno") is None:
+            contatori = contatori or inc.contatori(inc.tabelle)
+            prima = stato.get("contatori") or {}
+            if any(t in forza or contatori.get(t) != prima.get(t) for t in inc.tabelle):
+                return self._rivalida_completa(nome, fetch, inc)
+            self._scrivi_stato_sicuro(nome, stato["versione"], segno, contatori, stato["completo_il"])
+            return None
+
+        toccate = inc.modifiche(inc.tabelle, stato["segno"])
+        if len(toccate) == 0:
+            self._scrivi_stato_sicuro(nome, stato["versione"], segno, None, stato["completo_il"])
+            return None
+        if inc.fetch_riquadro is None or toccate["giorno"].isna().any():
+            return self._rivalida_completa(nome, fetch, inc)
+
+        snap = self.leggi(nome)
+        nuovi = [(r, inc.fetch_riquadro(*r)) for r in riquadri(toccate[["giorno", "deposito"]])]
+        df = inc.normalizza(unisci_riquadri(snap[0], nuovi, inc.chiavi))
+        df.attrs["versione"] = versione_contenuto(df)
+        log.info("Snapshot %s: %d riquadri riletti (%d righe)", nome, len(nuovi), sum(len(n) for _, n in nuovi))
+        self._scrivi_sicuro(nome, df)
+        self._scrivi_stato_sicuro(nome, df.attrs["versione"], segno, None, stato["completo_il"])
+        return df
+
+    def _scrivi_sicuro(self, nome: str, df: pd.DataFrame) -> None:
+        try:
+            self.scrivi(nome, df)
+        except Exception as e:
+            log.warning("Scrittura snapshot %s fallita: %s", nome, e)
+
+    def _scrivi_stato_sicuro(self, nome: str, *args) -> None:
+        try:
+            self.scrivi_stato(nome, *args)
+        except Exception as e:
+            log.warning("Scrittura stato %s fallita: %s", nome, e)
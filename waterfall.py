@@ -0,0 +1,84 @@
+# ===============================================
+# ESTATE 2026 - COMPOSIZIONE DEL GAP (WATERFALL)
+# Organico → assenze → turni → gap, per qualunque mese o periodo
+# ===============================================
+#
+# I componenti vengono dai dati di copertura già in cache (una riga per
+# giorno e deposito): nessuna query in più e nessun valore fisso. Ogni
+# componente è la media giornaliera, sui giorni scelti, della somma sui
+# depositi scelti; per costruzione organico − assenze − turni = gap medio
+# della copertura sugli stessi giorni.
+
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+
+MESI = (
+    "Gennaio", "Febbraio", "Marzo", "Aprile", "Maggio", "Giugno",
+    "Luglio", "Agosto", "Settembre", "Ottobre", "Novembre", "Dicembre",
+)
+
+
+class ComposizioneGap(NamedTuple):
+    """Medie giornaliere (persone) dei componenti del gap su `giorni` giorni."""
+    autisti: float = 0.0
+    assenze_statistiche: float = 0.0
+    assenze_roster: float = 0.0
+    turni: float = 0.0
+    giorni: int = 0
+
+    @property
+    def disponibili(self) -> float:
+        return self.autisti - self.assenze_statistiche - self.assenze_roster
+
+    @property
+    def gap(self) -> float:
+        return self.disponibili - self.turni
+
+
+def mesi_periodo(giorni: pd.Series) -> list:
+    """Mesi (pd.Period) presenti in `giorni`, in ordine."""
+    return sorted(giorni.dt.to_period("M").unique())
+
+
+def etichetta_mese(mese: pd.Period) -> str:
+    return f"{MESI[mese.month - 1]} {mese.year}"
+
+
+def seleziona_giorni(
+    cop: pd.DataFrame, mese: Optional[pd.Period] = None, senza_domeniche: bool = False,
+    categorie: Optional[pd.Series] = None,
+) -> pd.DataFrame:
+    """
+    Righe di `cop` del `mese` (None = tutte), eventualmente senza domeniche:
+    da `categorie` (giorno → categoria_giorno, la dimensione calendario) o,
+    per le date che non vi compaiono, dal giorno della settimana.
+    """
+    mask = pd.Series(True, index=cop.index)
+    if mese is not None:
+        mask &= cop["giorno"].dt.to_period("M") == mese
+    if senza_domeniche:
+        domenica = cop["giorno"].dt.dayofweek.eq(6)
+        if categorie is not None:
+            categoria = cop["giorno"].map(categorie)
+            domenica = categoria.eq("Domenica").where(categoria.notna(), domenica).astype(bool)
+        mask &= ~domenica
+    return cop[mask]
+
+
+def composizione_gap(cop: pd.DataFrame) -> ComposizioneGap:
+    """Componenti del waterfall dalla copertura (giorno, deposito, persone_in_forza, ...)."""
+    if len(cop) == 0:
+        return ComposizioneGap()
+    giornaliero = cop.groupby("giorno")[
+        ["persone_in_forza", "assenze_statistiche", "assenze_nominali", "turni_richiesti"]
+    ].sum()
+    medie = giornaliero.mean()
+    return ComposizioneGap(
+        autisti=float(medie["persone_in_forza"]),
+        assenze_statistiche=float(medie["assenze_statistiche"]),
+        assenze_roster=float(medie["assenze_nominali"]),
+        turni=float(medie["turni_richiesti"]),
+        giorni=len(giornaliero),
+    )